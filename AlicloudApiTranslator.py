@@ -2,6 +2,11 @@
 # This file is auto-generated, don't edit it. Thanks.
 import os
 import sys
+import json
+import time
+import threading
+import logging
+import concurrent.futures
 
 from typing import List
 
@@ -11,10 +16,51 @@ from alibabacloud_alimt20181012 import models as alimt_20181012_models
 from alibabacloud_tea_util import models as util_models
 from alibabacloud_tea_util.client import Client as UtilClient
 
+from EndpointSelector import EndpointSelector
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+# Translators shared between `ARSWorker` restarts, keyed by (key_id, key_secret, endpoint or candidate endpoints)
+# Note the underlying HTTP connection pool is kept by `TeaCore` per host for the whole process,
+# so reusing a warmed translator means reusing its keep-alive connection.
+_shared_translators: dict[tuple, "AlicloudApiTranslator"] = {}
+_shared_translators_lock = threading.Lock()
+
 
 class AlicloudApiTranslator:
     def __init__(self):
         self.client: alimt20181012Client = None
+        self.endpoint: str = None
+        # Switches `client` to the best of several endpoints before each request, see `use_selector`
+        self.selector: EndpointSelector = None
+        self._credentials: tuple[str, str] = None
+        self.last_request_time: float = 0 # time.monotonic() of the last request (translate or probe)
+        self._keepalive_thread: threading.Thread = None
+        self._keepalive_stop = threading.Event()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="translator")
+
+    @staticmethod
+    def get_shared(key_id: str, key_secret: str, endpoint: str = f'mt.cn-hangzhou.aliyuncs.com', keepalive_interval_s: float = 0,
+                   selector: EndpointSelector = None) -> "AlicloudApiTranslator":
+        """
+        获取一个可在`ARSWorker`重启之间复用的Translator
+        第一次创建时会在后台线程里预热连接
+        有`selector`时忽略`endpoint`，使用其中最快的endpoint
+        """
+        key = (key_id, key_secret, tuple(selector.candidates) if selector else endpoint)
+        with _shared_translators_lock:
+            translator = _shared_translators.get(key, None)
+            if translator is None:
+                translator = AlicloudApiTranslator()
+                translator.init_client(key_id, key_secret, selector.best() if selector else endpoint)
+                if selector:
+                    translator.use_selector(selector)
+                threading.Thread(target=translator.warm_up, daemon=True).start()
+                if keepalive_interval_s > 0:
+                    translator.start_keepalive(keepalive_interval_s)
+                _shared_translators[key] = translator
+        return translator
 
     def init_client(self, key_id: str, key_secret: str, endpoint: str = f'mt.cn-hangzhou.aliyuncs.com'):
         """
@@ -22,13 +68,94 @@ class AlicloudApiTranslator:
         @return: Client
         @throws Exception
         """
+        self.client = self.create_client(key_id, key_secret, endpoint)
+        self.endpoint = endpoint
+        self._credentials = (key_id, key_secret)
+
+    @staticmethod
+    def create_client(key_id: str, key_secret: str, endpoint: str) -> alimt20181012Client:
         config = open_api_models.Config(
             access_key_id=key_id,
             access_key_secret=key_secret,
         )
         # Endpoint 请参考 https://api.aliyun.com/product/alimt
+        # "http://host:port" for a local stand-in such as `FakeAlimtServer`
+        if endpoint.startswith("http://"):
+            config.protocol = "http"
+            endpoint = endpoint[len("http://"):]
         config.endpoint = endpoint
-        self.client = alimt20181012Client(config)
+        return alimt20181012Client(config)
+
+    @staticmethod
+    def probe(key_id: str, key_secret: str, endpoint: str, timeout_ms: int = 3000) -> float:
+        """
+        向`endpoint`发送一个语种识别请求，用于`EndpointSelector`
+        @return: 耗时(秒)
+        @throws Exception
+        """
+        client = AlicloudApiTranslator.create_client(key_id, key_secret, endpoint)
+        runtime = util_models.RuntimeOptions(read_timeout=timeout_ms, connect_timeout=timeout_ms)
+        start = time.perf_counter()
+        client.get_detect_language_with_options(alimt_20181012_models.GetDetectLanguageRequest(source_text="hi"), runtime)
+        return time.perf_counter() - start
+
+    def use_selector(self, selector: EndpointSelector):
+        """
+        每次请求前换到`selector`排名第一的endpoint，请求失败时报告给它
+        """
+        self.selector = selector
+
+    def _client(self) -> alimt20181012Client:
+        if self.selector and self.selector.best() != self.endpoint:
+            logger.info(f"Translator switched to {self.selector.best()}")
+            self.init_client(*self._credentials, self.selector.best())
+        return self.client
+
+    def _report_failure(self, endpoint: str, e: Exception):
+        if self.selector:
+            self.selector.report_failure(endpoint, str(e))
+
+    def warm_up(self, read_timeout_ms=3000, connect_timeout_ms=3000) -> float:
+        """
+        发送一个很便宜的请求(语种识别)来提前完成DNS/TCP/TLS握手
+        @return: 耗时(秒)，失败时返回-1
+        """
+        start = time.perf_counter()
+        try:
+            request = alimt_20181012_models.GetDetectLanguageRequest(source_text="hi")
+            runtime = util_models.RuntimeOptions(
+                read_timeout=read_timeout_ms,
+                connect_timeout=connect_timeout_ms,
+            )
+            self._client().get_detect_language_with_options(request, runtime)
+        except Exception as e:
+            logger.warning(f"Translator warm up failed: {e}")
+            self._report_failure(self.endpoint, e)
+            return -1
+        finally:
+            self.last_request_time = time.monotonic()
+        elapsed = time.perf_counter() - start
+        logger.debug(f"Translator warm up took {elapsed * 1000:.1f}ms")
+        return elapsed
+
+    def start_keepalive(self, interval_s: float):
+        """
+        在后台定期探测，避免空闲的keep-alive连接被服务器关掉
+        只有在`interval_s`内没有任何请求时才会发送探测
+        注意每次探测都是一次计费的语种识别请求，没人说话时也会发送
+        """
+        if self._keepalive_thread and self._keepalive_thread.is_alive():
+            return
+        self._keepalive_stop.clear()
+        def keepalive():
+            while not self._keepalive_stop.wait(interval_s / 2):
+                if time.monotonic() - self.last_request_time >= interval_s:
+                    self.warm_up()
+        self._keepalive_thread = threading.Thread(target=keepalive, daemon=True)
+        self._keepalive_thread.start()
+
+    def stop_keepalive(self):
+        self._keepalive_stop.set()
 
     def translate(self, source_language, target_language, context, source_text, read_timeout_ms=1000, connect_timeout_ms=1000) -> str:
         # Create Request
@@ -46,16 +173,96 @@ class AlicloudApiTranslator:
             connect_timeout=connect_timeout_ms,
         )
         # Send Request (block)
-        respond = self.client.translate_general_with_options(translate_general_request, runtime)
+        start = time.perf_counter()
+        client, endpoint = self._client(), self.endpoint
+        try:
+            respond = client.translate_general_with_options(translate_general_request, runtime)
+        except Exception as e:
+            self._report_failure(endpoint, e)
+            raise
+        finally:
+            self.last_request_time = time.monotonic()
+        logger.debug(f"Translate took {(time.perf_counter() - start) * 1000:.1f}ms")
         return respond.body.data.translated
 
+    def translate_batch(self, source_language, target_language, source_texts: List[str], read_timeout_ms=1000, connect_timeout_ms=1000) -> List[str]:
+        """
+        通过批量翻译接口，在一次请求里翻译多句话（批量接口不支持context）
+        """
+        # Create Request
+        get_batch_translate_request = alimt_20181012_models.GetBatchTranslateRequest(
+            api_type='translate_standard',
+            scene='general',
+            format_type='text',
+            source_text=json.dumps({str(i): text for i, text in enumerate(source_texts)}, ensure_ascii=False),
+            source_language=source_language,
+            target_language=target_language,
+        )
+        # Set network options
+        runtime = util_models.RuntimeOptions(
+            read_timeout=read_timeout_ms,
+            connect_timeout=connect_timeout_ms,
+        )
+        # Send Request (block)
+        start = time.perf_counter()
+        client, endpoint = self._client(), self.endpoint
+        try:
+            respond = client.get_batch_translate_with_options(get_batch_translate_request, runtime)
+        except Exception as e:
+            self._report_failure(endpoint, e)
+            raise
+        finally:
+            self.last_request_time = time.monotonic()
+        logger.debug(f"Batch translate of {len(source_texts)} texts took {(time.perf_counter() - start) * 1000:.1f}ms")
+        # Results are not guaranteed to be in order
+        translated = [""] * len(source_texts)
+        for item in respond.body.translated_list:
+            translated[int(item["index"])] = item.get("translated", "")
+        return translated
+
+    def translate_multi(self, source_language, target_languages: List[str], context, source_texts: List[str], read_timeout_ms=1000, connect_timeout_ms=1000) -> List[dict[str, str]]:
+        """
+        把多句话翻译成多种语言
+        每种语言各一个请求并发执行：一句话时用通用翻译(带context)，多句话时用批量翻译
+        @return: 每句话对应一个 {target_language: translated_text}
+        """
+        def translate_to(target_language) -> List[str]:
+            if len(source_texts) == 1:
+                return [self.translate(source_language, target_language, context, source_texts[0], read_timeout_ms, connect_timeout_ms)]
+            return self.translate_batch(source_language, target_language, source_texts, read_timeout_ms, connect_timeout_ms)
+
+        futures = {lang: self._executor.submit(translate_to, lang) for lang in target_languages}
+        results = [{} for _ in source_texts]
+        for lang, future in futures.items():
+            for i, translated in enumerate(future.result()):
+                results[i][lang] = translated
+        return results
+
 
 if __name__ == '__main__':
+    # Report the first request after a warm up vs warm latency
     translator = AlicloudApiTranslator()
     translator.init_client(os.environ.get("ALIBABA_CLOUD_ACCESS_KEY_ID"), os.environ.get("ALIBABA_CLOUD_ACCESS_KEY_SECRET"), endpoint='mt.cn-hangzhou.aliyuncs.com')
-    res = translator.translate(
-        "zh", "ja",
-        "这是上一句话，可以为空的。",
-        "这是现在在说的话。",
-    )
-    print(res)
\ No newline at end of file
+    # Warm up before the first translate like `get_shared` does, the probe pays for the handshakes
+    print(f"warm up probe (cold): {translator.warm_up() * 1000:.1f}ms")
+    start = time.perf_counter()
+    translator.translate("zh", "ja", "", "这是现在在说的话。")
+    print(f"first after warm up: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    latencies = []
+    for i in range(10):
+        start = time.perf_counter()
+        res = translator.translate(
+            "zh", "ja",
+            "这是上一句话，可以为空的。",
+            "这是现在在说的话。",
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(res)
+    print(f"warm: {sorted(latencies)[len(latencies) // 2]:.1f}ms (median of {len(latencies)})")
+
+    # Two targets and a burst of sentences in one round trip
+    start = time.perf_counter()
+    res = translator.translate_multi("zh", ["ja", "en"], "", ["这是第一句话。", "这是第二句话。", "这是第三句话。"])
+    print(res)
+    print(f"3 sentences x 2 targets: {(time.perf_counter() - start) * 1000:.1f}ms")
@@ -0,0 +1,152 @@
+import time
+import threading
+import collections
+import logging
+from typing import Any, Dict
+
+from AudioLevel import DEFAULT_SILENCE_RMS, is_silence, pcm16_bytes_per_ms
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+class BacklogPolicy:
+    """What to drop when the unsent audio exceeds `max_backlog_ms`."""
+    DROP_SILENCE = 'drop_silence'  # drop silent frames first, then the oldest
+    DROP_OLDEST = 'drop_oldest'
+    FAST_FORWARD = 'fast_forward'  # drop the whole backlog and continue live
+
+
+class AudioBacklog:
+    """Audio frames waiting to be sent to the ASR server, bounded by duration.
+       Thread-safe: frames are appended by the capture side and popped by the sender.
+
+    Args:
+        sample_rate (int): The pcm sample rate, None if the duration is unknown
+            (non-pcm formats), which disables the bound.
+        max_backlog_ms (int): Upper bound of unsent audio. None for unbounded.
+        policy (str): One of `BacklogPolicy`.
+        stall_timeout_ms (int): The uplink is considered stalled if nothing
+            is sent for this long while audio is waiting, or this much speech
+            is sent without any response from the server.
+        silence_rms (float): RMS threshold of a silent pcm frame.
+    """
+    def __init__(self,
+                 sample_rate: int = None,
+                 max_backlog_ms: int = None,
+                 policy: str = BacklogPolicy.DROP_SILENCE,
+                 stall_timeout_ms: int = 2000,
+                 silence_rms: float = DEFAULT_SILENCE_RMS):
+        self._frames = collections.deque()
+        self._lock = threading.Lock()
+        self._bytes_per_ms = pcm16_bytes_per_ms(sample_rate) if sample_rate else None
+        self._max_backlog_ms = max_backlog_ms
+        self._policy = policy
+        self._stall_timeout_ms = stall_timeout_ms
+        self._silence_rms = silence_rms
+        self._backlog_bytes = 0
+        self._sent_bytes = 0
+        self._dropped_bytes = 0
+        self._speech_sent_since_ack_bytes = 0
+        self._last_send_time = time.monotonic()
+        self._last_ack_time = time.monotonic()
+        self._stalled = False
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def append(self, buffer: bytes):
+        with self._lock:
+            self._frames.append(buffer)
+            self._backlog_bytes += len(buffer)
+            if self._max_backlog_ms is not None and self._bytes_per_ms:
+                self._trim(self._max_backlog_ms * self._bytes_per_ms)
+
+        stalled = self.is_stalled()
+        if stalled != self._stalled:
+            self._stalled = stalled
+            stats = self.get_stats()
+            if stalled:
+                logger.warning('Uplink stalled, backlog %.0fms.' % stats['backlog_ms'])
+            else:
+                logger.warning('Uplink recovered, %.0fms audio dropped in total.' % stats['dropped_ms'])
+
+    def pop(self) -> bytes:
+        """Take the oldest frame for sending, None if empty."""
+        with self._lock:
+            if len(self._frames) == 0:
+                return None
+            frame = self._frames.popleft()
+            self._backlog_bytes -= len(frame)
+        self._sent_bytes += len(frame)
+        self._last_send_time = time.monotonic()
+        if self._bytes_per_ms and not is_silence(frame, self._silence_rms):
+            self._speech_sent_since_ack_bytes += len(frame)
+        return frame
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._backlog_bytes = 0
+
+    def ack(self):
+        """Called on every response from the server."""
+        self._last_ack_time = time.monotonic()
+        self._speech_sent_since_ack_bytes = 0
+
+    def _trim(self, max_bytes: float):
+        """Drop audio by `self._policy` until the backlog fits into `max_bytes`.
+           The newest frame is always kept.
+           Must be called with `self._lock` held.
+        """
+        if self._backlog_bytes <= max_bytes:
+            return
+
+        if self._policy == BacklogPolicy.FAST_FORWARD:
+            newest = self._frames.pop()
+            self._dropped_bytes += self._backlog_bytes - len(newest)
+            self._frames.clear()
+            self._frames.append(newest)
+            self._backlog_bytes = len(newest)
+            return
+
+        if self._policy == BacklogPolicy.DROP_SILENCE:
+            kept = collections.deque()
+            while len(self._frames) > 1 and self._backlog_bytes > max_bytes:
+                frame = self._frames.popleft()
+                if is_silence(frame, self._silence_rms):
+                    self._backlog_bytes -= len(frame)
+                    self._dropped_bytes += len(frame)
+                else:
+                    kept.append(frame)
+            kept.extend(self._frames)
+            self._frames = kept
+
+        while len(self._frames) > 1 and self._backlog_bytes > max_bytes:
+            frame = self._frames.popleft()
+            self._backlog_bytes -= len(frame)
+            self._dropped_bytes += len(frame)
+
+    def is_stalled(self) -> bool:
+        """Whether the uplink seems stalled: audio is waiting but nothing
+           was sent for `stall_timeout_ms`, or more than `stall_timeout_ms`
+           of speech was sent without any response.
+        """
+        now = time.monotonic()
+        timeout_s = self._stall_timeout_ms / 1000
+        if self._backlog_bytes > 0 and now - self._last_send_time > timeout_s:
+            return True
+        if self._bytes_per_ms and now - self._last_ack_time > timeout_s and \
+                self._speech_sent_since_ack_bytes > self._stall_timeout_ms * self._bytes_per_ms:
+            return True
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Uplink metrics. Durations are only available for pcm."""
+        bytes_per_ms = self._bytes_per_ms or float('nan')
+        return {
+            'backlog_frames': len(self._frames),
+            'backlog_ms': self._backlog_bytes / bytes_per_ms,
+            'sent_ms': self._sent_bytes / bytes_per_ms,
+            'dropped_ms': self._dropped_bytes / bytes_per_ms,
+            'stalled': self.is_stalled(),
+        }
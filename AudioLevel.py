@@ -0,0 +1,29 @@
+import array
+import math
+try:
+    import audioop # Removed in python 3.13
+except ImportError:
+    audioop = None
+
+# Helpers for 16bit mono PCM, which is what we send to the ASR server
+
+SAMPLE_WIDTH = 2
+
+# RMS below this is treated as silence, quiet rooms are usually around 100~300
+DEFAULT_SILENCE_RMS = 400
+
+
+def pcm16_bytes_per_ms(sample_rate: int) -> float:
+    return sample_rate * SAMPLE_WIDTH / 1000
+
+def pcm16_rms(buffer: bytes) -> float:
+    if len(buffer) < SAMPLE_WIDTH:
+        return 0
+    if audioop:
+        return audioop.rms(buffer, SAMPLE_WIDTH)
+    samples = array.array("h")
+    samples.frombytes(memoryview(buffer)[:len(buffer) // SAMPLE_WIDTH * SAMPLE_WIDTH])
+    return math.sqrt(sum(x * x for x in samples) / len(samples))
+
+def is_silence(buffer: bytes, threshold: float = DEFAULT_SILENCE_RMS) -> bool:
+    return pcm16_rms(buffer) < threshold
@@ -0,0 +1,295 @@
+import abc
+import sys
+import mmap
+import time
+import array
+import shutil
+import socket
+import struct
+import asyncio
+import threading
+import subprocess
+import logging
+from typing import BinaryIO
+
+from AudioLevel import pcm16_bytes_per_ms
+from CaptureRecorder import CaptureReader, RECORD_AUDIO
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Everything `ARSWorker` reads 16kHz mono 16bit pcm from
+# `read()` returns a bytes-like frame (bytes, bytearray or a memoryview into the source), None once the source has ended.
+# Frames are handed over as they are, never copied into another buffer on the way,
+# except the big-endian payload of RTP, byte-swapped once into a new buffer on little-endian machines.
+
+
+class AudioSourceKind:
+    MIC = 'mic'
+    FILE = 'file'
+    STDIN = 'stdin'
+    UDP = 'udp'
+    PULSE_MONITOR = 'pulse_monitor'
+
+
+class AudioSource(abc.ABC):
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 200):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_bytes = int(pcm16_bytes_per_ms(sample_rate) * frame_ms)
+        # A read left running by a cancelled worker finishes before the next one starts
+        self.read_lock = threading.Lock()
+        self.ended = False # no more audio, `Supervisor` stops instead of restarting the worker
+        self.realtime = True # False if reading slower only delays the audio, the worker then waits for the uplink instead of dropping frames
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def reopen(self):
+        with self.read_lock:
+            self.stop()
+            self.start()
+
+    @abc.abstractmethod
+    async def read(self) -> bytes | None:
+        pass
+
+
+def _find_wav_data(buffer) -> tuple[int, int]:
+    # Offset and size of the pcm in a RIFF/WAVE file, 16kHz mono 16bit only
+    riff, _, wave = struct.unpack_from("<4sI4s", buffer, 0)
+    if riff != b"RIFF" or wave != b"WAVE":
+        raise ValueError("Not a wav file")
+    offset = 12
+    while offset + 8 <= len(buffer):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", buffer, offset)
+        offset += 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", buffer, offset)
+            if audio_format != 1 or channels != 1 or sample_rate != 16000 or bits != 16:
+                raise ValueError(f"Only 16kHz mono 16bit pcm wav is supported, got format {audio_format}, {channels}ch, {sample_rate}Hz, {bits}bit")
+        elif chunk_id == b"data":
+            return offset, min(chunk_size, len(buffer) - offset)
+        offset += chunk_size + (chunk_size & 1)
+    raise ValueError("No data chunk in the wav file")
+
+
+class FileSource(AudioSource):
+    """
+    A wav file or the audio of a `.vrccap` capture, memory-mapped and read in place.
+    Other formats (e.g. flac) are decoded once through the optional `soundfile`.
+
+    Args:
+        realtime (bool): Pace frames at real time like a mic, False to deliver them as fast as the pipeline reads.
+        loop (bool): Start over at the end instead of ending.
+    """
+    def __init__(self, path: str, realtime: bool = True, loop: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self._file: BinaryIO = None
+        self._mmap: mmap.mmap = None
+        self._reader: CaptureReader = None
+        self._frames: list = None
+        self._index = 0
+        self._started_at = 0.0
+        self._position_s = 0.0
+
+    def start(self):
+        if self.path.endswith(".vrccap"):
+            # Audio records are memoryviews into the mapped capture
+            self._reader = CaptureReader(self.path)
+            self._frames = [payload for kind, _, payload in self._reader if kind == RECORD_AUDIO]
+        elif self.path.endswith(".wav"):
+            self._file = open(self.path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            offset, size = _find_wav_data(self._mmap)
+            view = memoryview(self._mmap)[offset:offset + size - size % 2]
+            self._frames = [view[i:i + self.frame_bytes] for i in range(0, len(view), self.frame_bytes)]
+        else:
+            try:
+                import soundfile
+            except ImportError as e:
+                raise ImportError(f"Reading {self.path} needs `pip install soundfile`, or convert it to 16kHz mono 16bit wav") from e
+            data, sample_rate = soundfile.read(self.path, dtype="int16", always_2d=True)
+            if sample_rate != self.sample_rate or data.shape[1] != 1:
+                raise ValueError(f"{self.path} must be {self.sample_rate}Hz mono, got {sample_rate}Hz {data.shape[1]}ch")
+            view = memoryview(data.tobytes())
+            self._frames = [view[i:i + self.frame_bytes] for i in range(0, len(view), self.frame_bytes)]
+        self._index = 0
+        self._position_s = 0.0
+        self._started_at = time.monotonic()
+        self.ended = False
+
+    def stop(self):
+        self._frames = None
+        try:
+            if self._reader:
+                self._reader.close()
+            if self._mmap:
+                self._mmap.close()
+        except BufferError:
+            # Frames still queued somewhere keep the mapping alive, it is closed once they are collected
+            pass
+        if self._file:
+            self._file.close()
+        self._reader, self._mmap, self._file = None, None, None
+
+    async def read(self) -> memoryview | None:
+        if self._frames is None:
+            # Stopped
+            self.ended = True
+            return None
+        if self._index >= len(self._frames):
+            if not self.loop or not self._frames:
+                self.ended = True
+                return None
+            self._index = 0
+        frame = self._frames[self._index]
+        self._index += 1
+        if self.realtime:
+            await asyncio.sleep(max(0, self._started_at + self._position_s - time.monotonic()))
+        else:
+            await asyncio.sleep(0)
+        self._position_s += len(frame) / pcm16_bytes_per_ms(self.sample_rate) / 1000
+        return frame
+
+
+class StdinSource(AudioSource):
+    """Raw pcm from a pipe, `sys.stdin` by default, e.g. `ffmpeg -i x.mp3 -f s16le -ac 1 -ar 16000 - | python main.cmd.py ...`"""
+    def __init__(self, stream: BinaryIO = None, realtime: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.stream = stream
+        self.realtime = realtime
+
+    def start(self):
+        if self.stream is None:
+            self.stream = sys.stdin.buffer
+
+    async def read(self) -> bytearray | None:
+        return await asyncio.to_thread(self._read)
+
+    def _read(self) -> bytearray | None:
+        # Read straight into the frame handed over, no intermediate buffer
+        with self.read_lock:
+            frame = bytearray(self.frame_bytes)
+            view = memoryview(frame)
+            filled = 0
+            while filled < len(frame):
+                n = self.stream.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            view.release()
+            if filled == 0:
+                self.ended = True
+                return None
+            if filled < len(frame):
+                del frame[filled:]
+            return frame
+
+
+class PulseMonitorSource(StdinSource):
+    """
+    What the speakers play (e.g. the game), through `parec` of PulseAudio or `pw-record` of PipeWire.
+    `device` is a source name like `alsa_output.xxx.monitor`, empty for the monitor of the default output.
+    """
+    def __init__(self, device: str = "", **kwargs):
+        super().__init__(realtime=True, **kwargs)
+        self.device = device
+        self.process: subprocess.Popen = None
+
+    def _command(self) -> list[str]:
+        if shutil.which("parec"):
+            return ["parec", f"--device={self.device or '@DEFAULT_MONITOR@'}", "--format=s16le", f"--rate={self.sample_rate}", "--channels=1", "--raw",
+                    f"--latency-msec={self.frame_ms}"]
+        if shutil.which("pw-record"):
+            target = ["--target", self.device] if self.device else ["-P", "{ stream.capture.sink = true }"]
+            return ["pw-record", *target, "--format", "s16", "--rate", str(self.sample_rate), "--channels", "1", "-"]
+        raise FileNotFoundError("Neither parec nor pw-record is installed")
+
+    def start(self):
+        self.ended = False
+        self.process = subprocess.Popen(self._command(), stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, bufsize=0)
+        self.stream = self.process.stdout
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process.stdout.close()
+            self.process = None
+
+
+def parse_rtp(packet: bytes) -> memoryview:
+    # Payload of an RTP packet, without the header, CSRCs, extension and padding
+    view = memoryview(packet)
+    if len(view) < 12 or view[0] >> 6 != 2:
+        raise ValueError("Not an RTP packet")
+    offset = 12 + (view[0] & 0x0f) * 4
+    if view[0] & 0x10:
+        offset += 4 + struct.unpack_from("!H", view, offset + 2)[0] * 4
+    end = len(view) - (view[-1] if view[0] & 0x20 else 0)
+    return view[offset:end]
+
+
+class UdpSource(AudioSource):
+    """
+    Raw pcm datagrams, or RTP with L16 payload when `rtp` (network byte order, converted to little endian).
+    Silence is delivered when nothing arrives for a frame, so the pipeline keeps running like with a mic.
+    """
+    def __init__(self, host: str = "0.0.0.0", port: int = 8766, rtp: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.rtp = rtp
+        self.sock: socket.socket = None
+        self.silence = bytes(self.frame_bytes)
+        # Stats
+        self.datagrams = 0
+        self.invalid = 0
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.settimeout(self.frame_ms / 1000)
+        self.port = self.sock.getsockname()[1]
+        logger.info(f"Receiving audio on udp://{self.host}:{self.port}{' (RTP)' if self.rtp else ''}")
+
+    def stop(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    async def read(self) -> bytes | memoryview:
+        return await asyncio.to_thread(self._read)
+
+    def _read(self) -> bytes | memoryview:
+        with self.read_lock:
+            while True:
+                try:
+                    packet = self.sock.recv(65536)
+                except socket.timeout:
+                    return self.silence
+                self.datagrams += 1
+                if not self.rtp:
+                    return packet
+                try:
+                    payload = parse_rtp(packet)
+                except ValueError:
+                    self.invalid += 1
+                    continue
+                if sys.byteorder == "little":
+                    # L16 is big-endian. Python cannot swap bytes in place in a bytes-like object, so this is one copy
+                    samples = array.array("h")
+                    samples.frombytes(payload[:len(payload) // 2 * 2])
+                    samples.byteswap()
+                    return memoryview(samples).cast("B")
+                return payload
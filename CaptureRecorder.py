@@ -0,0 +1,164 @@
+import os
+import io
+import json
+import mmap
+import time
+import struct
+import threading
+import logging
+from typing import Any, Iterator
+
+from dashscope.audio.asr import RecognitionResult
+from DashscopeCustomRecognition import DashscopeCustomRecognitionCallback
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Capture file format (little endian)
+#   file header:    magic(8s) version(I) sample_rate(I) start_unix_time(d)
+#   segment*:       magic(4s) record_count(I) payload_bytes(I) + records
+#   record:         kind(B) time_us(q) payload_bytes(I) + payload
+# Records are buffered and written one segment at a time,
+# so a capture cut off by a crash is still readable up to its last complete segment.
+FILE_MAGIC = b"VRCPCAP\x00"
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct("<8sIId")
+SEGMENT_MAGIC = b"SEGM"
+SEGMENT_HEADER = struct.Struct("<4sII")
+RECORD_HEADER = struct.Struct("<BqI")
+
+RECORD_AUDIO = 1 # raw mic pcm
+RECORD_RESPONSE = 2 # json of `RecognitionResult`
+RECORD_OSC = 3 # json of [address, args]
+
+
+class CaptureRecorder:
+    def __init__(self, path: str, sample_rate: int = 16000, segment_bytes: int = 256 * 1024, segment_interval_s: float = 1.0):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.segment_interval_s = segment_interval_s
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, sample_rate, time.time()))
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._segment = io.BytesIO()
+        self._segment_records = 0
+        self._segment_start = time.perf_counter()
+
+    @staticmethod
+    def open_in(directory: str, sample_rate: int = 16000) -> "CaptureRecorder":
+        os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        path = os.path.join(directory, time.strftime("capture-%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}.vrccap")
+        logger.info(f"Recording capture into {path}")
+        return CaptureRecorder(path, sample_rate)
+
+    def _record(self, kind: int, payload: bytes):
+        now = time.perf_counter()
+        with self._lock:
+            if self._file is None:
+                return
+            self._segment.write(RECORD_HEADER.pack(kind, int((now - self._start) * 1e6), len(payload)))
+            self._segment.write(payload)
+            self._segment_records += 1
+            if self._segment.tell() >= self.segment_bytes or now - self._segment_start >= self.segment_interval_s:
+                self._flush_segment()
+
+    def _flush_segment(self):
+        # Must be called with `self._lock` held
+        if self._segment_records == 0:
+            return
+        payload = self._segment.getbuffer()
+        self._file.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, self._segment_records, len(payload)))
+        self._file.write(payload)
+        self._file.flush()
+        del payload
+        self._segment = io.BytesIO()
+        self._segment_records = 0
+        self._segment_start = time.perf_counter()
+
+    def record_audio(self, buffer: bytes):
+        self._record(RECORD_AUDIO, buffer)
+
+    def record_response(self, result: RecognitionResult):
+        self._record(RECORD_RESPONSE, str(result).encode("utf-8"))
+
+    def record_osc(self, address: str, args: list):
+        self._record(RECORD_OSC, json.dumps([address, args], ensure_ascii=False).encode("utf-8"))
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_segment()
+            self._file.close()
+            self._file = None
+
+
+class CaptureReader:
+    """Reads a capture through mmap, audio payloads are memoryviews into the file."""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.sample_rate, self.start_unix_time = FILE_HEADER.unpack_from(self._mmap, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError(f"{path} is not a capture file")
+
+    def __iter__(self) -> Iterator[tuple[int, float, memoryview]]:
+        """Yields (kind, seconds since start, payload)"""
+        view = memoryview(self._mmap)
+        offset = FILE_HEADER.size
+        while offset + SEGMENT_HEADER.size <= len(view):
+            magic, record_count, payload_bytes = SEGMENT_HEADER.unpack_from(view, offset)
+            offset += SEGMENT_HEADER.size
+            if magic != SEGMENT_MAGIC or offset + payload_bytes > len(view):
+                logger.warning(f"Truncated capture {self.path}, stop at byte {offset}")
+                break
+            for _ in range(record_count):
+                kind, time_us, length = RECORD_HEADER.unpack_from(view, offset)
+                offset += RECORD_HEADER.size
+                yield kind, time_us / 1e6, view[offset:offset + length]
+                offset += length
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class RecordingCallback(DashscopeCustomRecognitionCallback):
+    """Records every server response before passing it to `callback`."""
+    def __init__(self, callback: DashscopeCustomRecognitionCallback, recorder: CaptureRecorder):
+        self.callback = callback
+        self.recorder = recorder
+
+    def on_open(self) -> None:
+        self.callback.on_open()
+
+    def on_close(self) -> None:
+        self.callback.on_close()
+
+    def on_complete(self) -> None:
+        self.callback.on_complete()
+
+    def on_event(self, result: RecognitionResult) -> None:
+        self.recorder.record_response(result)
+        self.callback.on_event(result)
+
+    def on_error(self, result: RecognitionResult) -> None:
+        self.recorder.record_response(result)
+        self.callback.on_error(result)
+
+    def on_response_timeout(self, result: RecognitionResult):
+        self.recorder.record_response(result)
+        self.callback.on_response_timeout(result)
+
+
+class RecordingOscClient:
+    """Records every OSC message before sending it with `client`."""
+    def __init__(self, client: Any, recorder: CaptureRecorder):
+        self.client = client
+        self.recorder = recorder
+
+    def send_message(self, address: str, value: Any) -> None:
+        self.recorder.record_osc(address, value)
+        self.client.send_message(address, value)
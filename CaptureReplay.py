@@ -0,0 +1,137 @@
+import json
+import time
+import asyncio
+import logging
+
+import dashscope
+import pythonosc.osc_message
+
+from core import Setting, VRChatOscCallback, DispatchEndpointEvents
+from DashscopeApiAsr import DashscopeApiAsr
+from FakeDashscopeServer import FakeDashscopeServer, ScriptedResponse
+from CaptureRecorder import CaptureReader, RECORD_AUDIO, RECORD_RESPONSE, RECORD_OSC
+from AudioLevel import pcm16_bytes_per_ms
+from LocalEndpointer import LocalEndpointer
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+class SimulatedClock:
+    """Capture time running `speed` times faster than the wall clock, 0 for unpaced."""
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self._start = time.perf_counter()
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def now(self) -> float:
+        elapsed = time.perf_counter() - self._start
+        return elapsed * self.speed if self.speed > 0 else elapsed
+
+    async def sleep_until(self, t: float):
+        if self.speed <= 0:
+            await asyncio.sleep(0)
+            return
+        delay = t / self.speed - (time.perf_counter() - self._start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class OscCollector(asyncio.DatagramProtocol):
+    """Local UDP receiver standing in for VRChat."""
+    def __init__(self, clock: SimulatedClock):
+        self.clock = clock
+        self.messages: list[tuple[float, str, list]] = []
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        message = pythonosc.osc_message.OscMessage(data)
+        self.messages.append((self.clock.now(), message.address, list(message.params)))
+
+
+def load_capture(reader: CaptureReader) -> tuple[list, list[ScriptedResponse], list]:
+    """
+    @return: (audio [(t, pcm)], responses scripted by audio position, osc [(t, address, args)])
+    """
+    bytes_per_ms = pcm16_bytes_per_ms(reader.sample_rate)
+    audio = []
+    script = []
+    osc = []
+    audio_ms = 0
+    last_audio_t = 0
+    for kind, t, payload in reader:
+        if kind == RECORD_AUDIO:
+            audio.append((t, payload))
+            audio_ms += len(payload) / bytes_per_ms
+            last_audio_t = t
+        elif kind == RECORD_RESPONSE:
+            script.append(ScriptedResponse(audio_ms, t - last_audio_t, json.loads(bytes(payload))))
+        elif kind == RECORD_OSC:
+            address, args = json.loads(bytes(payload))
+            osc.append((t, address, args))
+    return audio, script, osc
+
+
+async def replay(path: str, speed: float = 1.0, osc_port: int = 9001, local_endpointing: bool = False) -> dict:
+    """
+    Feed a capture through `DashscopeCustomRecognition` and `VRChatOscCallback`
+    against a local `FakeDashscopeServer` replaying the recorded responses.
+    Translation is disabled, translated text is not part of the script.
+    With `local_endpointing`, also reports how much earlier text is shown.
+    """
+    reader = CaptureReader(path)
+    audio, script, recorded_osc = load_capture(reader)
+    clock = SimulatedClock(speed)
+
+    server = FakeDashscopeServer(sample_rate=reader.sample_rate, script=script, speed=speed)
+    dashscope.base_websocket_api_url = await server.start()
+
+    loop = asyncio.get_running_loop()
+    transport, collector = await loop.create_datagram_endpoint(lambda: OscCollector(clock), local_addr=("127.0.0.1", osc_port))
+
+    setting = Setting()
+    setting.vrchat_ip = "127.0.0.1"
+    setting.vrchat_port = osc_port
+    callback = VRChatOscCallback(setting)
+    endpointer = LocalEndpointer(reader.sample_rate) if local_endpointing else None
+    asr = DashscopeApiAsr()
+    try:
+        await asyncio.to_thread(asr.start, api_key="replay", callback=callback)
+        clock.start()
+        wall_start = time.perf_counter()
+        for t, pcm in audio:
+            await clock.sleep_until(t)
+            if asr.is_stopped():
+                break
+            asr.send_audio_frame(pcm)
+            if endpointer:
+                DispatchEndpointEvents(endpointer.process(pcm), callback)
+        if not asr.is_stopped():
+            await asyncio.to_thread(asr.stop)
+        wall = time.perf_counter() - wall_start
+        # Let the last OSC datagrams arrive
+        await asyncio.sleep(0.1)
+    finally:
+        transport.close()
+        await server.stop()
+        # Views into the mmap must be released before closing it
+        audio.clear()
+        pcm = None
+        reader.close()
+
+    # Compare the chatbox output
+    recorded_inputs = [(t, args[0]) for t, address, args in recorded_osc if address == "/chatbox/input"]
+    replayed_inputs = [(t, args[0]) for t, address, args in collector.messages if address == "/chatbox/input"]
+    deltas = [r[0] - o[0] for o, r in zip(recorded_inputs, replayed_inputs)]
+    return {
+        "capture_seconds": recorded_osc[-1][0] if recorded_osc else 0,
+        "wall_seconds": wall,
+        "responses": len(script),
+        "recorded_chatbox_inputs": len(recorded_inputs),
+        "replayed_chatbox_inputs": len(replayed_inputs),
+        "mismatched_texts": sum(o[1] != r[1] for o, r in zip(recorded_inputs, replayed_inputs)),
+        "mean_delay_delta_s": sum(deltas) / len(deltas) if deltas else 0,
+        "max_delay_delta_s": max(deltas) if deltas else 0,
+        "early_commits": len(callback.early_gains_ms),
+        "mean_early_gain_ms": sum(callback.early_gains_ms) / len(callback.early_gains_ms) * (speed or 1) if callback.early_gains_ms else 0,
+    }
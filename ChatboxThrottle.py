@@ -0,0 +1,95 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+class ChatboxThrottle:
+    """
+    At most one chatbox message per `min_interval_ms`, VRChat does not show messages coming faster.
+    A message too early waits until the interval has passed, and a newer one replaces it on the way:
+    the chatbox shows the whole state every time, so only the latest one matters.
+    `close` when the session ends, so a waiting message neither gets lost nor goes out into the next session.
+
+    Args:
+        send: `(text, sfx)`, does the actual OSC send, called from any thread.
+        loop: Wait on this loop instead of a timer thread.
+    """
+    def __init__(self, send: Callable[[str, bool], None], min_interval_ms: float = 1500, loop: asyncio.AbstractEventLoop = None):
+        self._send = send
+        self.min_interval_s = min_interval_ms / 1000
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._last_sent = float("-inf")
+        self._pending: tuple[str, bool] = None
+        self._timer: threading.Timer | asyncio.TimerHandle = None
+        self._closed = False
+        # Stats
+        self.sent = 0
+        self.replaced = 0
+
+    def send(self, text: str, sfx: bool):
+        with self._lock:
+            if self._closed:
+                return
+            wait_s = self._last_sent + self.min_interval_s - time.monotonic()
+            if self._pending is None and wait_s <= 0:
+                self._last_sent = time.monotonic()
+                self.sent += 1
+            else:
+                if self._pending is None:
+                    self._schedule(wait_s)
+                else:
+                    self.replaced += 1
+                # The sound effect of a replaced message was not heard yet
+                self._pending = (text, sfx or self._pending is not None and self._pending[1])
+                return
+        self._send(text, sfx)
+
+    def wait_s(self) -> float:
+        """Until the waiting message goes out, 0 if there is none."""
+        with self._lock:
+            if self._pending is None:
+                return 0.0
+            return max(0.0, self._last_sent + self.min_interval_s - time.monotonic())
+
+    def _schedule(self, delay_s: float):
+        # Under `_lock`
+        if self.loop:
+            def arm():
+                with self._lock:
+                    if not self._closed:
+                        self._timer = self.loop.call_later(delay_s, self.flush)
+            self.loop.call_soon_threadsafe(arm)
+        else:
+            self._timer = threading.Timer(delay_s, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Send the waiting message now."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._timer = None
+            if pending is None:
+                return
+            self._last_sent = time.monotonic()
+            self.sent += 1
+        self._send(*pending)
+
+    def close(self, flush: bool = True):
+        """Send the waiting message now, or drop it, and nothing after."""
+        with self._lock:
+            self._closed = True
+            timer, self._timer = self._timer, None
+            pending, self._pending = self._pending, None
+            if flush and pending is not None:
+                self._last_sent = time.monotonic()
+                self.sent += 1
+        if timer:
+            timer.cancel()
+        if flush and pending is not None:
+            self._send(*pending)
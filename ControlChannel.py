@@ -0,0 +1,237 @@
+import os
+import hmac
+import json
+import time
+import asyncio
+import logging
+import secrets
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Local control channel between the settings panel and the running recognizer
+# ws://127.0.0.1:{control_port}/control, json messages
+# Any web page open in a browser can reach localhost, so a handshake needs
+#   "Authorization: Bearer {token}", the token `main.cmd.py` writes next to `setting.json` on every start,
+#   and no "Origin": browsers always send one, the panel connects from its Python side and sends none.
+# Only `REMOTE_KEYS` of the setting are applied, never credentials, file paths or where audio and OSC go.
+#   panel -> recognizer:
+#       {"type": "setting", "setting": {key: value, ...}}   changed keys only are applied
+#   recognizer -> panel:
+#       {"type": "applied", "changed": [...], "rejected": [...], "restarted": bool, "elapsed_ms"}   rejected keys apply after a restart of the recognizer
+#       {"type": "status", "health": {...}, "pipeline": {...}}   every second
+#       {"type": "transcript", "text", "translated"}
+#       {"type": "latency", ...}   e.g. "mt_ms", "early_gain_ms", "task_start_ms"
+#       {"type": "runtime", "loop_lag_ms", "max_loop_lag_ms", "threads"}   every few seconds, see `Profiler.RuntimeMonitor`
+#       {"type": "usage", "budget_exceeded": true, "day", "api_key", "billed_s"}   once per day and key, see `UsageLedger`
+
+
+def format_message(message: dict) -> str:
+    """One line of the panel's live log for a transcript, latency, usage or applied message."""
+    if message["type"] == "transcript":
+        return f"{message['text']}" + (f" ({message['translated']})" if message["translated"] else "")
+    if message["type"] == "latency":
+        # Numbers rounded, anything else as is, e.g. "hedge_winner", "translation_late" or a missing "handshake_ms"
+        return " ".join(f"{k}={v:.0f}" if isinstance(v, (int, float)) and not isinstance(v, bool) else f"{k}={v}"
+                        for k, v in message.items() if k != "type")
+    if message["type"] == "usage":
+        return f"{message['billed_s']:.0f}s billed on {message['day']} for key {message['api_key']}, over the daily budget"
+    return f"applied {message['changed']} in {message['elapsed_ms']:.0f}ms" + (", restarted" if message["restarted"] else "") + (f", not applied {message['rejected']}" if message["rejected"] else "")
+
+
+def control_token_path(setting_path: str) -> str:
+    # e.g. setting.json -> setting.control_token
+    return os.path.splitext(setting_path)[0] + ".control_token"
+
+
+def issue_control_token(setting_path: str) -> str:
+    """A new random token for this run, written next to `setting_path` for the panel, see `control_token_path`."""
+    token = secrets.token_urlsafe(24)
+    path = control_token_path(setting_path)
+    # Replaced at once, the panel never reads half a token
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wt", encoding="utf-8") as f:
+        f.write(token)
+    os.replace(temp_path, path)
+    return token
+
+
+def read_control_token(setting_path: str) -> str:
+    try:
+        with open(control_token_path(setting_path), "rt", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+class ControlServer:
+    """
+    Args:
+        setting: The live setting object, changed in place.
+        token: Required from the panel, see `issue_control_token`.
+        remote_keys: The setting keys the panel may change.
+        on_setting: Called with the changed keys after they are applied, returns whether the worker was restarted.
+        status: Returns the "health" part of the periodic status.
+    """
+    def __init__(self, setting: Any, port: int, token: str, remote_keys: set[str], on_setting: Callable[[list[str]], Awaitable[bool]] = None,
+                 status: Callable[[], dict] = None, host: str = "127.0.0.1", status_interval_s: float = 1.0, max_queued: int = 256):
+        if not token:
+            raise ValueError("The control channel needs a token")
+        self.setting = setting
+        self.token = token
+        self.remote_keys = remote_keys
+        self.host = host
+        self.port = port
+        self.on_setting = on_setting
+        self.status = status
+        self.status_interval_s = status_interval_s
+        self.max_queued = max_queued
+        self.pipeline: dict = {}
+        self._subscribers: set[asyncio.Queue] = set()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._runner: web.AppRunner = None
+        self._status_task: asyncio.Task = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        app = web.Application()
+        app.router.add_get("/control", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Control channel listening on ws://{self.host}:{self.port}/control")
+        self._status_task = asyncio.create_task(self._status_worker())
+
+    async def stop(self):
+        if self._status_task:
+            self._status_task.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+
+    def publish(self, message: dict):
+        """Send to every subscriber, callable from any thread. Slow subscribers lose messages instead of blocking."""
+        if self._loop is None or not self._subscribers:
+            return
+        if message.get("type") == "pipeline":
+            # Folded into the next status
+            self.pipeline = message
+            return
+        self._loop.call_soon_threadsafe(self._fan_out, message)
+
+    def _fan_out(self, message: dict):
+        for queue in self._subscribers:
+            if queue.qsize() < self.max_queued:
+                queue.put_nowait(message)
+
+    async def _status_worker(self):
+        while True:
+            await asyncio.sleep(self.status_interval_s)
+            if self._subscribers:
+                self._fan_out({
+                    "type": "status",
+                    "health": self.status() if self.status else {},
+                    "pipeline": {k: v for k, v in self.pipeline.items() if k != "type"},
+                })
+
+    async def _apply(self, new_setting: dict) -> dict:
+        start = time.perf_counter()
+        changed = [key for key, value in new_setting.items() if key in self.setting.__dict__ and self.setting.__dict__[key] != value]
+        rejected = [key for key in changed if key not in self.remote_keys]
+        changed = [key for key in changed if key in self.remote_keys]
+        if rejected:
+            logger.warning(f"[Control] not applied remotely, restart to apply: {rejected}")
+        for key in changed:
+            self.setting.__dict__[key] = new_setting[key]
+        restarted = False
+        if changed:
+            logger.info(f"[Control] setting changed: {changed}")
+            if self.on_setting:
+                restarted = await self.on_setting(changed)
+        return {"type": "applied", "changed": changed, "rejected": rejected, "restarted": restarted, "elapsed_ms": (time.perf_counter() - start) * 1000}
+
+    def _authorized(self, request: web.Request) -> bool:
+        if "Origin" in request.headers:
+            logger.warning(f"[Control] rejected a connection from {request.headers['Origin']}")
+            return False
+        return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {self.token}")
+
+    async def _handle(self, request: web.Request) -> web.WebSocketResponse:
+        if not self._authorized(request):
+            raise web.HTTPForbidden()
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def send_worker():
+            while True:
+                await ws.send_str(json.dumps(await queue.get(), ensure_ascii=False))
+        sender = asyncio.create_task(send_worker())
+        self._subscribers.add(queue)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    message = json.loads(msg.data)
+                except ValueError:
+                    logger.warning("Control channel: ignored a malformed message")
+                    continue
+                if not isinstance(message, dict):
+                    continue
+                if message.get("type") == "setting" and isinstance(message.get("setting"), dict):
+                    queue.put_nowait(await self._apply(message["setting"]))
+        finally:
+            self._subscribers.discard(queue)
+            sender.cancel()
+        return ws
+
+
+class ControlClient:
+    """
+    Panel side, reconnects until stopped. `on_message` receives every message from the recognizer.
+    `token()` is asked on every connect, the recognizer issues a new one whenever it starts.
+    """
+    def __init__(self, port: int, token: Callable[[], str], host: str = "127.0.0.1", on_message: Callable[[dict], None] = None, retry_s: float = 2.0):
+        self.url = f"ws://{host}:{port}/control"
+        self.token = token
+        self.on_message = on_message
+        self.retry_s = retry_s
+        self.connected = False
+        self._ws: aiohttp.ClientWebSocketResponse = None
+        self._applied: asyncio.Future = None
+
+    async def push_setting(self, setting: dict, timeout: float = 10) -> dict:
+        """Apply settings on the running recognizer, returns the "applied" reply, None if not connected."""
+        if not self.connected:
+            return None
+        self._applied = asyncio.get_running_loop().create_future()
+        await self._ws.send_str(json.dumps({"type": "setting", "setting": setting}, ensure_ascii=False))
+        return await asyncio.wait_for(self._applied, timeout)
+
+    async def run(self):
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    async with session.ws_connect(self.url, headers={"Authorization": f"Bearer {self.token()}"}) as ws:
+                        self._ws = ws
+                        self.connected = True
+                        logger.debug(f"Control channel connected to {self.url}")
+                        async for msg in ws:
+                            if msg.type != WSMsgType.TEXT:
+                                break
+                            message = json.loads(msg.data)
+                            if message.get("type") == "applied" and self._applied and not self._applied.done():
+                                self._applied.set_result(message)
+                            if self.on_message:
+                                self.on_message(message)
+                except aiohttp.ClientError:
+                    pass
+                finally:
+                    self.connected = False
+                    self._ws = None
+                await asyncio.sleep(self.retry_s)
@@ -3,6 +3,7 @@
 import dashscope
 from dashscope.audio.asr import RecognitionCallback, RecognitionResult
 from DashscopeCustomRecognition import DashscopeCustomRecognition, DashscopeCustomRecognitionCallback
+from AudioBacklog import BacklogPolicy
 
 
 class DefaultCallback(DashscopeCustomRecognitionCallback):
@@ -23,14 +24,22 @@ class DashscopeApiAsr:
         if self.recognition and not self.recognition.is_stopped():
             self.recognition.stop()
 
-    def start(self, api_key: str, callback: RecognitionCallback = DefaultCallback(), disfluency_removal_enabled=False):
+    # `url` of another endpoint (e.g. region) than `dashscope.base_websocket_api_url`
+    def start(self, api_key: str, callback: RecognitionCallback = DefaultCallback(), disfluency_removal_enabled=False,
+              max_backlog_ms=None, backlog_policy=BacklogPolicy.DROP_SILENCE, stall_timeout_ms=2000, fast_events=False,
+              model='paraformer-realtime-v1', url=None):
         dashscope.api_key = api_key
         self.recognition = DashscopeCustomRecognition(
-            model='paraformer-realtime-v1',
+            model=model,
             format='pcm',
             sample_rate=16000,
             callback=callback,
+            max_backlog_ms=max_backlog_ms,
+            backlog_policy=backlog_policy,
+            stall_timeout_ms=stall_timeout_ms,
+            fast_events=fast_events,
             disfluency_removal_enabled=disfluency_removal_enabled,
+            base_address=url,
         )
         self.recognition.start()
 
@@ -40,9 +49,15 @@ class DashscopeApiAsr:
     def is_stopped(self):
         return self.recognition.is_stopped()
 
+    def wait_ready(self, timeout: float = 10) -> bool:
+        return self.recognition.wait_ready(timeout)
+
     def send_audio_frame(self, audio_data):
         self.recognition.send_audio_frame(audio_data)
 
+    def get_backlog_stats(self):
+        return self.recognition.get_backlog_stats()
+
 
 
 if __name__ == "__main__":
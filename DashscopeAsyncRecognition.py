@@ -0,0 +1,396 @@
+import asyncio
+import json
+import time
+import uuid
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Dict, List
+
+import aiohttp
+import dashscope
+from dashscope.api_entities.dashscope_response import (DashScopeAPIResponse,
+                                                       RecognitionResponse)
+from dashscope.common.api_key import get_default_api_key
+from dashscope.common.constants import WEBSOCKET_ERROR_CODE
+from dashscope.common.error import (InputRequired, InvalidParameter,
+                                    ModelRequired, RequestFailure)
+from dashscope.common.logging import logger
+from dashscope.version import __version__ as dashscope_version
+from dashscope.protocol.websocket import (ACTION_KEY, ERROR_MESSAGE,
+                                          ERROR_NAME, EVENT_KEY, HEADER,
+                                          ActionType, EventType,
+                                          WebsocketStreamingMode)
+
+from dashscope.audio.asr import RecognitionResult
+
+from AudioBacklog import AudioBacklog, BacklogPolicy
+from DashscopeCustomRecognition import DashscopeCustomRecognitionCallback
+from RecognitionEvent import RecognitionEvent, fast_loads
+from DashscopeConnection import DashscopeConnectionPool, PooledConnection
+
+
+# Asyncio-native counterpart of `DashscopeCustomRecognition`
+# Speaks the same duplex websocket protocol, but runs on the caller's event loop:
+# no receive thread, no polling input generator.
+class DashscopeAsyncRecognition:
+    """Speech recognition interface running on asyncio.
+
+    Usage:
+        recognition = DashscopeAsyncRecognition(model, 'pcm', 16000)
+        await recognition.start()
+        # in one task, either send directly
+        await recognition.send_audio_frame(data)
+        # or queue into the bounded backlog drained by the internal sender
+        recognition.push_audio_frame(data)
+        # in another task
+        async for result in recognition:
+            ...
+        await recognition.stop()
+
+    Args:
+        model (str): The requested model_id.
+        format (str): The input audio format for speech recognition.
+        sample_rate (int): The input audio sample rate for speech recognition.
+        api_key (str): The dashscope api key, `dashscope.api_key` by default.
+        url (str): The websocket url, `dashscope.base_websocket_api_url` by default.
+        workspace (str): The dashscope workspace id.
+        phrase_id (str): The ID of phrase.
+        max_backlog_ms, backlog_policy, stall_timeout_ms:
+            Bound of `push_audio_frame`, see `AudioBacklog`.
+        fast_events (bool): Yield the lightweight `RecognitionEvent`,
+            decoded with orjson when installed.
+        connection_pool (DashscopeConnectionPool): Run the task on a kept
+            open connection and give it back after task-finished, instead of
+            connecting for this task only. Its url and key are used then.
+
+        **kwargs: Same as `DashscopeCustomRecognition`.
+    """
+
+    def __init__(self,
+                 model: str,
+                 format: str,
+                 sample_rate: int,
+                 api_key: str = None,
+                 url: str = None,
+                 workspace: str = None,
+                 phrase_id: str = None,
+                 max_backlog_ms: int = None,
+                 backlog_policy: str = BacklogPolicy.DROP_SILENCE,
+                 stall_timeout_ms: int = 2000,
+                 fast_events: bool = False,
+                 connection_pool: DashscopeConnectionPool = None,
+                 **kwargs):
+        if model is None:
+            raise ModelRequired('Model is required!')
+        if format is None:
+            raise InputRequired('format is required!')
+        if sample_rate is None:
+            raise InputRequired('sample_rate is required!')
+
+        self.model = model
+        self.format = format
+        self.sample_rate = sample_rate
+        self._api_key = api_key
+        self._url = url
+        self._workspace = workspace
+        self._phrase = phrase_id
+        self._kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        self._session: aiohttp.ClientSession = None
+        self._ws: aiohttp.ClientWebSocketResponse = None
+        self._task_id: str = None
+        self._running = False
+        self._finished = asyncio.Event()
+        # Uplink backlog, bounded by duration for pcm
+        self._stream_data = AudioBacklog(
+            sample_rate=sample_rate if format == 'pcm' else None,
+            max_backlog_ms=max_backlog_ms,
+            policy=backlog_policy,
+            stall_timeout_ms=stall_timeout_ms,
+        )
+        self._stream_ready = asyncio.Event()
+        self._sender: asyncio.Task = None
+        # Yield `RecognitionEvent` instead of `RecognitionResult`
+        self._fast_events = fast_events
+        self._loads = fast_loads if fast_events else json.loads
+        self._connection_pool = connection_pool
+        self._connection: PooledConnection = None
+        self._task_finished = False # the connection is left clean, so it can go back to the pool
+        # Timing of the last `start()`, handshake is 0 on a reused connection
+        self.handshake_ms = 0.0
+        self.start_ms = 0.0
+
+    def _build_headers(self) -> Dict[str, str]:
+        headers = {
+            'Authorization': 'bearer %s' % (self._api_key or get_default_api_key()),
+            'user-agent': 'dashscope/%s; VRChatParaformerAsr' % dashscope_version,
+        }
+        if self._workspace is not None:
+            headers['X-DashScope-WorkSpace'] = self._workspace
+        return headers
+
+    def _build_start_message(self) -> str:
+        parameters = {
+            'sample_rate': self.sample_rate,
+            'format': self.format,
+            **self._kwargs,
+        }
+        payload = {
+            'model': self.model,
+            'task_group': 'audio',
+            'task': 'asr',
+            'function': 'recognition',
+            'parameters': parameters,
+            'input': {},
+        }
+        if self._phrase is not None and len(self._phrase) > 0:
+            payload['resources'] = [{'resource_id': self._phrase, 'resource_type': 'asr_phrase'}]
+        header = {
+            'streaming': WebsocketStreamingMode.DUPLEX,
+            'task_id': self._task_id,
+            ACTION_KEY: ActionType.START,
+        }
+        return json.dumps({'header': header, 'payload': payload})
+
+    async def start(self):
+        """Connect and start the recognition task.
+
+        Raises:
+            InvalidParameter: Recognition has already started.
+            RequestFailure: The server refused the task.
+        """
+        if self._running:
+            raise InvalidParameter('Speech recognition has started.')
+
+        self._task_id = uuid.uuid4().hex
+        self._finished.clear()
+        self._task_finished = False
+        start = time.perf_counter()
+        try:
+            await self._connect()
+            try:
+                await self._start_task()
+            except (RequestFailure, ConnectionError, aiohttp.ClientError):
+                if self._connection is None or not self._connection.reused:
+                    raise
+                # The kept connection went stale, once more on a new one
+                await self._connection_pool.release(self._connection, reusable=False)
+                await self._connect(fresh=True)
+                await self._start_task()
+        except BaseException:
+            await self.close()
+            raise
+        self.start_ms = (time.perf_counter() - start) * 1000
+        logger.debug('Recognition task started in %.1fms, handshake %.1fms' % (self.start_ms, self.handshake_ms))
+        self._running = True
+        self._sender = asyncio.create_task(self._send_worker())
+
+    async def _connect(self, fresh: bool = False):
+        if self._connection_pool is not None:
+            self._connection = await self._connection_pool.acquire(fresh)
+            self._ws = self._connection.ws
+            self.handshake_ms = 0.0 if self._connection.reused else self._connection.handshake_ms
+            return
+        start = time.perf_counter()
+        self._session = aiohttp.ClientSession()
+        self._ws = await self._session.ws_connect(
+            self._url or dashscope.base_websocket_api_url,
+            headers=self._build_headers(),
+            heartbeat=30,
+        )
+        self.handshake_ms = (time.perf_counter() - start) * 1000
+
+    async def _start_task(self):
+        await self._ws.send_str(self._build_start_message())
+        # Wait for task-started
+        while True:
+            msg = await self._ws.receive()
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                raise RequestFailure(request_id=self._task_id,
+                                     http_code=WEBSOCKET_ERROR_CODE,
+                                     name='Unknown',
+                                     message='Unexpected message before task-started: %s' % msg.type)
+            msg_json = json.loads(msg.data)
+            event = msg_json[HEADER][EVENT_KEY]
+            if event == EventType.STARTED:
+                break
+            elif event == EventType.FAILED:
+                raise RequestFailure(request_id=self._task_id,
+                                     http_code=WEBSOCKET_ERROR_CODE,
+                                     name=msg_json[HEADER][ERROR_NAME],
+                                     message=msg_json[HEADER][ERROR_MESSAGE])
+
+    async def _send_worker(self):
+        while True:
+            await self._stream_ready.wait()
+            self._stream_ready.clear()
+            frame = self._stream_data.pop()
+            while frame is not None:
+                await self._ws.send_bytes(frame)
+                frame = self._stream_data.pop()
+
+    async def send_audio_frame(self, buffer: bytes):
+        """Send one audio frame, returns once it is written to the socket.
+
+        Raises:
+            InvalidParameter: Cannot send data to an uninitiated recognition.
+        """
+        if self._running is False:
+            raise InvalidParameter('Speech recognition has stopped.')
+        await self._ws.send_bytes(buffer)
+
+    def push_audio_frame(self, buffer: bytes):
+        """Queue one audio frame without waiting for the socket.
+
+        Raises:
+            InvalidParameter: Cannot send data to an uninitiated recognition.
+        """
+        if self._running is False:
+            raise InvalidParameter('Speech recognition has stopped.')
+        self._stream_data.append(buffer)
+        self._stream_ready.set()
+
+    def is_stalled(self) -> bool:
+        return self._running and self._stream_data.is_stalled()
+
+    def get_backlog_stats(self) -> Dict[str, Any]:
+        return self._stream_data.get_stats()
+
+    async def stop(self, timeout: float = 5):
+        """Finish the task, wait for the remaining results to be consumed
+           by the iterator, then close the connection.
+
+        Raises:
+            InvalidParameter: Cannot stop an uninitiated recognition.
+        """
+        if self._running is False:
+            raise InvalidParameter('Speech recognition has stopped.')
+
+        self._running = False
+        try:
+            # drain all queued audio before finishing
+            self._sender.cancel()
+            frame = self._stream_data.pop()
+            while frame is not None:
+                await self._ws.send_bytes(frame)
+                frame = self._stream_data.pop()
+            header = {'streaming': WebsocketStreamingMode.DUPLEX, 'task_id': self._task_id, ACTION_KEY: ActionType.FINISHED}
+            await self._ws.send_str(json.dumps({'header': header, 'payload': {'input': {}}}))
+            await asyncio.wait_for(self._finished.wait(), timeout)
+        except (asyncio.TimeoutError, ConnectionError, RuntimeError) as e:
+            logger.warning('Recognition did not finish cleanly: %s' % e)
+        finally:
+            await self.close()
+
+    async def close(self, finish_timeout: float = 0):
+        """Close the connection immediately, pending audio and results are dropped.
+           On a pooled connection, first wait up to `finish_timeout` for the
+           server to finish the task, so the connection can be kept.
+        """
+        self._running = False
+        if self._sender is not None:
+            self._sender.cancel()
+            self._sender = None
+        self._stream_data.clear()
+        if self._connection is not None and not self._task_finished and finish_timeout > 0:
+            await self._finish_task(finish_timeout)
+        if self._connection is not None:
+            await self._connection_pool.release(self._connection, reusable=self._task_finished)
+            self._connection = None
+            self._ws = None
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._finished.set()
+
+    async def _finish_task(self, timeout: float):
+        # Nobody reads the results anymore, skip them until task-finished
+        header = {'streaming': WebsocketStreamingMode.DUPLEX, 'task_id': self._task_id, ACTION_KEY: ActionType.FINISHED}
+        try:
+            async with asyncio.timeout(timeout):
+                await self._ws.send_str(json.dumps({'header': header, 'payload': {'input': {}}}))
+                while True:
+                    msg = await self._ws.receive()
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    event = json.loads(msg.data)[HEADER][EVENT_KEY]
+                    if event == EventType.FINISHED:
+                        self._task_finished = True
+                        break
+                    elif event == EventType.FAILED:
+                        break
+        except (asyncio.TimeoutError, ConnectionError, RuntimeError) as e:
+            logger.debug('Task not finished before closing: %s' % e)
+
+    def is_stopped(self) -> bool:
+        return not self._running
+
+    def _to_result(self, status_code, output=None, usage=None, code=None, message=None) -> RecognitionResult | RecognitionEvent:
+        if self._fast_events:
+            return RecognitionEvent(status_code, self._task_id, output, usage, code, message)
+        response = DashScopeAPIResponse(request_id=self._task_id,
+                                        status_code=status_code,
+                                        output=output,
+                                        usage=usage,
+                                        code=code,
+                                        message=message)
+        usages: List[Any] = None
+        if output and 'sentence' in output and usage:
+            usages = [{'end_time': output['sentence']['end_time'], 'usage': usage}]
+        return RecognitionResult(RecognitionResponse.from_api_response(response), usages=usages)
+
+    async def __aiter__(self) -> AsyncIterator[RecognitionResult | RecognitionEvent]:
+        """Results until the task finishes or fails.
+           A result with empty output means the task is completed,
+           a result whose status code is not OK means it failed.
+        """
+        try:
+            while self._ws is not None:
+                msg = await self._ws.receive()
+                self._stream_data.ack()
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    msg_json = self._loads(msg.data)
+                    event = msg_json[HEADER][EVENT_KEY]
+                    payload = msg_json.get('payload', {})
+                    if event == EventType.GENERATED:
+                        yield self._to_result(HTTPStatus.OK, payload.get('output', {}), payload.get('usage', None))
+                    elif event == EventType.FINISHED:
+                        self._task_finished = True
+                        # May still carry the last sentence, yielded like the SDK does before the empty completion
+                        if payload and payload.get('output'):
+                            yield self._to_result(HTTPStatus.OK, payload['output'], payload.get('usage', None))
+                        yield self._to_result(HTTPStatus.OK, {})
+                        break
+                    elif event == EventType.FAILED:
+                        yield self._to_result(WEBSOCKET_ERROR_CODE,
+                                              code=msg_json[HEADER][ERROR_NAME],
+                                              message=msg_json[HEADER][ERROR_MESSAGE])
+                        break
+                elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    if self._running:
+                        yield self._to_result(WEBSOCKET_ERROR_CODE,
+                                              code='ConnectionClosed',
+                                              message='Websocket closed unexpectedly: %s' % msg.extra)
+                    break
+        finally:
+            self._running = False
+            self._finished.set()
+
+    async def dispatch(self, callback: DashscopeCustomRecognitionCallback):
+        """Feed results to `callback` on the current loop,
+           the same way `DashscopeCustomRecognition` does on its receive thread.
+        """
+        async for result in self:
+            if result.status_code == HTTPStatus.OK:
+                if not result.output:
+                    callback.on_complete()
+                else:
+                    callback.on_event(result)
+            elif result.status_code == WEBSOCKET_ERROR_CODE and result.code == "ResponseTimeout":
+                callback.on_response_timeout(result)
+                callback.on_close()
+            else:
+                callback.on_error(result)
+                callback.on_close()
+                break
@@ -0,0 +1,178 @@
+import ssl
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict
+
+import aiohttp
+import dashscope
+from dashscope.common.api_key import get_default_api_key
+from dashscope.version import __version__ as dashscope_version
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Dashscope runs one task at a time per websocket, but the socket stays usable after task-finished:
+# the next run-task goes over the same authenticated connection instead of a new DNS+TCP+TLS+upgrade.
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    Offers the TLS session of the last connection to a host when connecting to it again,
+    so an unavoidable reconnect skips the full handshake if the server accepts the ticket.
+    """
+    def __init__(self, protocol: int = ssl.PROTOCOL_TLS_CLIENT):
+        self._last_connections: Dict[str, ssl.SSLObject] = {}
+
+    @staticmethod
+    def create() -> "ResumingSSLContext":
+        context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.load_default_certs()
+        return context
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if not server_side and session is None:
+            last = self._last_connections.get(server_hostname, None)
+            # The session (TLS 1.3 ticket) only exists once the server has sent it after the handshake
+            if last is not None and last.session is not None and last.session.has_ticket:
+                session = last.session
+        sslobj = super().wrap_bio(incoming, outgoing, server_side=server_side, server_hostname=server_hostname, session=session)
+        if not server_side:
+            self._last_connections[server_hostname] = sslobj
+        return sslobj
+
+
+def build_headers(api_key: str = None, workspace: str = None) -> Dict[str, str]:
+    headers = {
+        'Authorization': 'bearer %s' % (api_key or get_default_api_key()),
+        'user-agent': 'dashscope/%s; VRChatParaformerAsr' % dashscope_version,
+    }
+    if workspace is not None:
+        headers['X-DashScope-WorkSpace'] = workspace
+    return headers
+
+
+async def probe_handshake(url: str, api_key: str = None, workspace: str = None, timeout_s: float = 3) -> float:
+    """Seconds of a fresh websocket handshake with `url` (DNS, TCP, TLS, upgrade), raises if it fails. For `EndpointSelector`."""
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        async with session.ws_connect(url, headers=build_headers(api_key, workspace), timeout=timeout_s):
+            return time.perf_counter() - start
+
+
+class PooledConnection:
+    def __init__(self, ws: aiohttp.ClientWebSocketResponse, handshake_ms: float, tls_resumed: bool):
+        self.ws = ws
+        self.handshake_ms = handshake_ms
+        self.tls_resumed = tls_resumed
+        self.tasks = 0 # tasks started on this connection
+        self.idle_since = 0.0
+
+    @property
+    def reused(self) -> bool:
+        return self.tasks > 1
+
+
+_shared_pools: dict[tuple, "DashscopeConnectionPool"] = {}
+_shared_pools_lock = threading.Lock()
+
+
+class DashscopeConnectionPool:
+    """
+    Websockets to Dashscope kept open between recognition tasks, see `DashscopeAsyncRecognition(connection_pool=...)`.
+    `acquire()` hands out an idle connection or opens one, `release()` takes it back after task-finished.
+
+    Args:
+        max_idle (int): Idle connections kept, further released ones are closed.
+        idle_timeout_s (float): Idle connections older than this are closed instead of reused,
+            before the server drops them on its own.
+        heartbeat_s (float): Websocket ping interval, also detects dead idle connections.
+    """
+    def __init__(self, url: str = None, api_key: str = None, workspace: str = None,
+                 max_idle: int = 1, idle_timeout_s: float = 45, heartbeat_s: float = 20):
+        self.url = url
+        self.api_key = api_key
+        self.workspace = workspace
+        self.max_idle = max_idle
+        self.idle_timeout_s = idle_timeout_s
+        self.heartbeat_s = heartbeat_s
+        self.ssl_context = ResumingSSLContext.create()
+        self._session: aiohttp.ClientSession = None
+        self._idle: list[PooledConnection] = []
+        # Stats
+        self.stats = {"connects": 0, "reuses": 0, "tls_resumed": 0, "handshake_ms_total": 0.0}
+
+    @staticmethod
+    def get_shared(url: str = None, api_key: str = None, workspace: str = None) -> "DashscopeConnectionPool":
+        """The pool of the running loop for these credentials, kept across `ARSWorkerAsync` restarts."""
+        loop = asyncio.get_running_loop()
+        with _shared_pools_lock:
+            for key in [key for key in _shared_pools if key[0].is_closed()]:
+                del _shared_pools[key]
+            key = (loop, url, api_key, workspace)
+            pool = _shared_pools.get(key, None)
+            if pool is None:
+                pool = DashscopeConnectionPool(url, api_key, workspace)
+                _shared_pools[key] = pool
+        return pool
+
+    @staticmethod
+    async def close_shared():
+        """Close the shared pools of the running loop, before it ends."""
+        loop = asyncio.get_running_loop()
+        with _shared_pools_lock:
+            pools = [pool for key, pool in _shared_pools.items() if key[0] is loop]
+            for key in [key for key in _shared_pools if key[0] is loop]:
+                del _shared_pools[key]
+        for pool in pools:
+            await pool.close()
+
+    def _build_headers(self) -> Dict[str, str]:
+        return build_headers(self.api_key, self.workspace)
+
+    async def connect(self) -> PooledConnection:
+        if self._session is None or self._session.closed:
+            # DNS answers are cached too, a reconnect only pays for TCP and (resumed) TLS
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=self.ssl_context, ttl_dns_cache=300))
+        start = time.perf_counter()
+        ws = await self._session.ws_connect(self.url or dashscope.base_websocket_api_url,
+                                            headers=self._build_headers(), heartbeat=self.heartbeat_s)
+        handshake_ms = (time.perf_counter() - start) * 1000
+        sslobj = ws.get_extra_info('ssl_object')
+        connection = PooledConnection(ws, handshake_ms, sslobj is not None and sslobj.session_reused)
+        self.stats["connects"] += 1
+        self.stats["handshake_ms_total"] += handshake_ms
+        if connection.tls_resumed:
+            self.stats["tls_resumed"] += 1
+        logger.debug(f"Dashscope connected in {handshake_ms:.1f}ms{', TLS resumed' if connection.tls_resumed else ''}")
+        return connection
+
+    async def acquire(self, fresh: bool = False) -> PooledConnection:
+        """An idle connection, or a new one if there is none or `fresh`."""
+        now = time.monotonic()
+        while self._idle and not fresh:
+            connection = self._idle.pop()
+            if not connection.ws.closed and now - connection.idle_since < self.idle_timeout_s:
+                self.stats["reuses"] += 1
+                connection.tasks += 1
+                return connection
+            await connection.ws.close()
+        connection = await self.connect()
+        connection.tasks += 1
+        return connection
+
+    async def release(self, connection: PooledConnection, reusable: bool = True):
+        """`reusable` only if the task on it has finished, anything else may leave messages behind."""
+        if reusable and not connection.ws.closed and len(self._idle) < self.max_idle:
+            connection.idle_since = time.monotonic()
+            self._idle.append(connection)
+        else:
+            await connection.ws.close()
+
+    async def close(self):
+        for connection in self._idle:
+            await connection.ws.close()
+        self._idle.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
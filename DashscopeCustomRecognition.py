@@ -16,6 +16,10 @@ from dashscope.protocol.websocket import WebsocketStreamingMode
 
 from dashscope.audio.asr import RecognitionCallback, RecognitionResult
 
+from AudioLevel import DEFAULT_SILENCE_RMS
+from AudioBacklog import AudioBacklog, BacklogPolicy
+from RecognitionEvent import RecognitionEvent
+
 class DashscopeCustomRecognitionCallback(RecognitionCallback):
     def on_response_timeout(self, result: RecognitionResult):
         pass
@@ -32,6 +36,15 @@ class DashscopeCustomRecognition(BaseApi):
         format (str): The input audio format for speech recognition.
         sample_rate (int): The input audio sample rate for speech recognition.
         workspace (str): The dashscope workspace id.
+        max_backlog_ms (int): Upper bound of audio waiting to be sent,
+            only applied to `pcm` format. None for unbounded.
+        backlog_policy (str): One of `BacklogPolicy`.
+        stall_timeout_ms (int): The uplink is considered stalled if nothing
+            is sent for this long while audio is waiting, or this much speech
+            is sent without any response from the server.
+        silence_rms (float): RMS threshold of a silent pcm frame.
+        fast_events (bool): Pass the lightweight `RecognitionEvent` to
+            `on_event` instead of building a `RecognitionResult`.
 
         **kwargs:
             phrase_id (list, `optional`): The ID of phrase.
@@ -56,6 +69,11 @@ class DashscopeCustomRecognition(BaseApi):
                  format: str,
                  sample_rate: int,
                  workspace: str = None,
+                 max_backlog_ms: int = None,
+                 backlog_policy: str = BacklogPolicy.DROP_SILENCE,
+                 stall_timeout_ms: int = 2000,
+                 silence_rms: float = DEFAULT_SILENCE_RMS,
+                 fast_events: bool = False,
                  **kwargs):
         if model is None:
             raise ModelRequired('Model is required!')
@@ -71,10 +89,20 @@ class DashscopeCustomRecognition(BaseApi):
         self._recognition_once = False
         self._callback = callback
         self._running = False
-        self._stream_data = []
+        # Set once the server has started the task and takes audio, see `wait_ready`
+        self._ready = threading.Event()
+        # Uplink backlog, bounded by duration for pcm
+        self._stream_data = AudioBacklog(
+            sample_rate=sample_rate if format == 'pcm' else None,
+            max_backlog_ms=max_backlog_ms,
+            policy=backlog_policy,
+            stall_timeout_ms=stall_timeout_ms,
+            silence_rms=silence_rms,
+        )
         self._worker = None
         self._kwargs = kwargs
         self._workspace = workspace
+        self._fast_events = fast_events
 
     def __del__(self):
         if self._running:
@@ -91,9 +119,12 @@ class DashscopeCustomRecognition(BaseApi):
         """
         responses = self.__launch_request()
         for part in responses:
+            self._stream_data.ack()
             if part.status_code == HTTPStatus.OK:
                 if len(part.output) == 0:
                     self._callback.on_complete()
+                elif self._fast_events:
+                    self._callback.on_event(RecognitionEvent.from_response(part))
                 else:
                     usage: Dict[str, Any] = None
                     useags: List[Any] = None
@@ -184,7 +215,8 @@ class DashscopeCustomRecognition(BaseApi):
         self._phrase = phrase_id
         self._kwargs.update(**kwargs)
         self._recognition_once = False
-        self._worker = threading.Thread(target=self.__receive_worker)
+        self._ready.clear()
+        self._worker = threading.Thread(target=self.__receive_worker, name="DashscopeReceive")
         self._worker.start()
         if self._worker.is_alive():
             self._running = True
@@ -251,7 +283,7 @@ class DashscopeCustomRecognition(BaseApi):
                     if not audio_data:
                         break
                     else:
-                        self._stream_data = self._stream_data + [audio_data]
+                        self._stream_data.append(audio_data)
             else:
                 raise InputDataRequired(
                     'The supplied file was empty (zero bytes long)')
@@ -321,17 +353,39 @@ class DashscopeCustomRecognition(BaseApi):
         if self._running is False:
             raise InvalidParameter('Speech recognition has stopped.')
 
-        self._stream_data = self._stream_data + [buffer]
+        self._stream_data.append(buffer)
+
+    def is_stalled(self) -> bool:
+        """Whether the uplink seems stalled, see `AudioBacklog.is_stalled`.
+        """
+        return self._running and self._stream_data.is_stalled()
+
+    def get_backlog_stats(self) -> Dict[str, Any]:
+        """Uplink metrics. Durations are only available for `pcm` format.
+        """
+        return self._stream_data.get_stats()
 
     def is_stopped(self) -> bool:
         return not self._running
 
+    def wait_ready(self, timeout: float = 10) -> bool:
+        """Block until the task is started on the server, audio sent before that only waits in the backlog.
+        False if it stopped or timed out first.
+        """
+        deadline = time.monotonic() + timeout
+        while self._running and time.monotonic() < deadline:
+            if self._ready.wait(0.05):
+                return True
+        return self._ready.is_set()
+
     def _tidy_kwargs(self):
         for k in self._kwargs.copy():
             if self._kwargs[k] is None:
                 self._kwargs.pop(k, None)
 
     def _input_stream_cycle(self):
+        # The SDK only pulls audio after task-started
+        self._ready.set()
         while self._running:
             while len(self._stream_data) == 0:
                 if self._running:
@@ -340,14 +394,17 @@ class DashscopeCustomRecognition(BaseApi):
                 else:
                     break
 
-            for frame in self._stream_data:
+            frame = self._stream_data.pop()
+            while frame is not None:
                 yield bytes(frame)
-            self._stream_data.clear()
+                frame = self._stream_data.pop()
 
             if self._recognition_once:
                 self._running = False
 
         # drain all audio data when invoking stop().
         if self._recognition_once is False:
-            for frame in self._stream_data:
-                yield bytes(frame)
\ No newline at end of file
+            frame = self._stream_data.pop()
+            while frame is not None:
+                yield bytes(frame)
+                frame = self._stream_data.pop()
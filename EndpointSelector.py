@@ -0,0 +1,175 @@
+import math
+import time
+import asyncio
+import logging
+import statistics
+import threading
+from dataclasses import dataclass, field
+from typing import Callable
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Several endpoints of the same service (regions), the one answering fastest and failing least is used.
+# Probes run on a thread of their own, `best()` never waits for them: until the first round is done it is the first candidate,
+# so the list is in order of preference.
+
+
+@dataclass
+class EndpointStats:
+    rtt_ms: float = None # smoothed median of a probe round, None until a probe succeeded
+    error_rate: float = 0.0 # smoothed share of failed probes and requests
+    probes: int = 0
+    failures: int = 0
+    last_error: str = None
+    rtts_ms: list[float] = field(default_factory=list, repr=False) # of the current round
+
+
+_shared_selectors: dict[str, "EndpointSelector"] = {}
+_shared_selectors_lock = threading.Lock()
+
+
+class EndpointSelector:
+    """
+    Ranks `candidates` by `rtt_ms + error_penalty_ms * error_rate`, probing each `probes_per_round` times
+    every `reprobe_interval_s`, and again right after `report_failure`.
+    Another endpoint is only switched to if it scores `switch_margin` better, so similar ones do not flap.
+
+    Args:
+        name: For the log, e.g. "asr" or "mt".
+        probe: `probe(endpoint)` returns the seconds a round trip took and raises if it failed, may be a coroutine function.
+    """
+    def __init__(self, name: str, candidates: list[str], probe: Callable[[str], float], reprobe_interval_s: float = 600,
+                 probes_per_round: int = 3, error_penalty_ms: float = 1000, switch_margin: float = 0.2, smoothing: float = 0.3):
+        if not candidates:
+            raise ValueError("No candidate endpoints")
+        self.name = name
+        self.candidates = list(candidates)
+        self.probe = probe
+        self.reprobe_interval_s = reprobe_interval_s
+        self.probes_per_round = probes_per_round
+        self.error_penalty_ms = error_penalty_ms
+        self.switch_margin = switch_margin
+        self.smoothing = smoothing
+        self.stats = {endpoint: EndpointStats() for endpoint in self.candidates}
+        self.rounds = 0
+        self._best = self.candidates[0]
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+
+    @staticmethod
+    def get_shared(name: str, candidates: list[str], probe: Callable[[str], float], reprobe_interval_s: float = 600) -> "EndpointSelector":
+        """
+        The running selector of `name`, kept across worker restarts. The latest `probe` is used, e.g. after a key change.
+        Different candidates replace it, the old one stops probing.
+        """
+        with _shared_selectors_lock:
+            selector = _shared_selectors.get(name, None)
+            if selector is not None and selector.candidates != list(candidates):
+                selector.stop()
+                selector = None
+            if selector is None:
+                selector = EndpointSelector(name, candidates, probe, reprobe_interval_s)
+                selector.start()
+                _shared_selectors[name] = selector
+            selector.probe = probe
+            selector.reprobe_interval_s = reprobe_interval_s
+        return selector
+
+    @staticmethod
+    def stop_shared(name: str):
+        """No candidates for `name` any more, e.g. the list was cleared in the setting."""
+        with _shared_selectors_lock:
+            selector = _shared_selectors.pop(name, None)
+        if selector is not None:
+            selector.stop()
+
+    def best(self) -> str:
+        return self._best
+
+    def score(self, endpoint: str) -> float:
+        stats = self.stats[endpoint]
+        if stats.rtt_ms is None:
+            return math.inf
+        return stats.rtt_ms + self.error_penalty_ms * stats.error_rate
+
+    def ranking(self) -> list[tuple[str, float]]:
+        return sorted(((endpoint, self.score(endpoint)) for endpoint in self.candidates), key=lambda item: item[1])
+
+    def _count(self, endpoint: str, failed: bool, error: str = None):
+        # Under `_lock`
+        stats = self.stats[endpoint]
+        stats.probes += 1
+        stats.error_rate += self.smoothing * ((1.0 if failed else 0.0) - stats.error_rate)
+        if failed:
+            stats.failures += 1
+            stats.last_error = error
+
+    def report_failure(self, endpoint: str, error: str = None):
+        """A request or session on `endpoint` failed: counts against it, and everything is probed again now."""
+        if endpoint not in self.stats:
+            return
+        with self._lock:
+            self._count(endpoint, True, error)
+            self._choose()
+        self._wake.set()
+
+    def _choose(self):
+        # Under `_lock`
+        current = self._best
+        best = min(self.candidates, key=self.score) # the earlier candidate on a tie
+        best_score, current_score = self.score(best), self.score(current)
+        if best == current or math.isinf(best_score):
+            return
+        if math.isinf(current_score) or best_score < current_score * (1 - self.switch_margin):
+            self._best = best
+            logger.info(f"[Endpoint] {self.name}: switched to {best} ({best_score:.0f}) from {current} ({current_score:.0f})")
+
+    def probe_once(self, endpoint: str):
+        try:
+            elapsed = self.probe(endpoint)
+            if asyncio.iscoroutine(elapsed):
+                elapsed = asyncio.run(elapsed)
+        except Exception as e:
+            with self._lock:
+                self._count(endpoint, True, str(e))
+            logger.debug(f"[Endpoint] {self.name}: probe of {endpoint} failed: {e}")
+            return
+        with self._lock:
+            self._count(endpoint, False)
+            self.stats[endpoint].rtts_ms.append(elapsed * 1000)
+
+    def probe_round(self):
+        """Probe every candidate, then pick the best. Blocks, called by the probe thread."""
+        for _ in range(self.probes_per_round):
+            # Interleaved, so a passing hiccup of the network is not blamed on one endpoint
+            for endpoint in self.candidates:
+                self.probe_once(endpoint)
+        with self._lock:
+            for stats in self.stats.values():
+                if stats.rtts_ms:
+                    rtt_ms = statistics.median(stats.rtts_ms)
+                    stats.rtt_ms = rtt_ms if stats.rtt_ms is None else stats.rtt_ms + self.smoothing * (rtt_ms - stats.rtt_ms)
+                    stats.rtts_ms.clear()
+            self.rounds += 1
+            self._choose()
+        logger.debug(f"[Endpoint] {self.name}: " + ", ".join(f"{endpoint} {score:.0f}" for endpoint, score in self.ranking()))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"EndpointSelector-{self.name}")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self, min_gap_s: float = 10):
+        while not self._stop.is_set():
+            self._wake.clear()
+            started = time.monotonic()
+            self.probe_round()
+            self._wake.wait(self.reprobe_interval_s)
+            # Failures in a row probe at most every `min_gap_s`
+            self._stop.wait(max(0.0, started + min_gap_s - time.monotonic()))
@@ -0,0 +1,99 @@
+import json
+import uuid
+import random
+import asyncio
+import threading
+import logging
+
+from aiohttp import web
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+# Local stand-in of the Alicloud machine translation API
+# Point `alicloud_endpoint` at `server.endpoint` ("http://127.0.0.1:port")
+class FakeAlimtServer:
+    """
+    Answers TranslateGeneral, GetBatchTranslate and GetDetectLanguage after `latency_ms`,
+    translating to "[{target_language}] {source_text}".
+    A `failure_rate` share of requests fail with HTTP 500.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0, failure_rate: float = 0):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        # Stats
+        self.requests = 0
+        self.failures = 0
+        self._runner: web.AppRunner = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: threading.Thread = None
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_route("*", "/", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.debug(f"FakeAlimtServer listening on {self.endpoint}")
+        return self.endpoint
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self) -> str:
+        """Run on a dedicated loop, for synchronous callers."""
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+        self._thread = threading.Thread(target=run, daemon=True, name="FakeAlimtServer")
+        self._thread.start()
+        started.wait()
+        return self.endpoint
+
+    def stop_in_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _translate(self, target_language: str, text: str) -> str:
+        return f"[{target_language}] {text}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        params = dict(request.query)
+        params.update(await request.post())
+        action = params.get("Action") or request.headers.get("x-acs-action")
+        request_id = uuid.uuid4().hex
+        self.requests += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if random.random() < self.failure_rate:
+            self.failures += 1
+            return web.json_response({"RequestId": request_id, "Code": "InternalError", "Message": "Injected failure"}, status=500)
+
+        if action == "TranslateGeneral":
+            data = {"Translated": self._translate(params["TargetLanguage"], params["SourceText"]), "WordCount": str(len(params["SourceText"]))}
+        elif action == "GetBatchTranslate":
+            texts = json.loads(params["SourceText"])
+            data = [{"index": index, "code": "200", "translated": self._translate(params["TargetLanguage"], text), "wordCount": str(len(text))}
+                    for index, text in texts.items()]
+            return web.json_response({"RequestId": request_id, "Code": 200, "TranslatedList": data})
+        elif action == "GetDetectLanguage":
+            return web.json_response({"RequestId": request_id, "DetectedLanguage": "en"})
+        else:
+            return web.json_response({"RequestId": request_id, "Code": "InvalidAction.NotFound", "Message": f"{action} is not supported"}, status=404)
+        return web.json_response({"RequestId": request_id, "Code": "200", "Data": data})
@@ -0,0 +1,183 @@
+import ssl
+import asyncio
+import json
+import threading
+import logging
+from dataclasses import dataclass
+
+from aiohttp import web, WSMsgType
+
+from AudioLevel import pcm16_bytes_per_ms
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+@dataclass
+class ScriptedResponse:
+    audio_ms: float # sent once this much audio has been received
+    delay_s: float # then wait this long (divided by speed)
+    response: dict # json of `RecognitionResult`
+
+
+# Local stand-in of the Dashscope realtime recognition websocket
+# Point `dashscope.base_websocket_api_url` (or the `url` of `DashscopeAsyncRecognition`) at `server.url`
+class FakeDashscopeServer:
+    """
+    Without a script, every `partial_ms` of received audio produces a partial sentence,
+    and every `sentence_ms` a completed one, each `latency_ms` later.
+    `handshake_ms` delays accepting a websocket, like the round trips to a far away region.
+    With a script, every recorded response is replayed at the same audio position.
+    Several tasks can run one after another on the same connection.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, sample_rate: int = 16000,
+                 script: list[ScriptedResponse] = None, sentence_ms: int = 2000, partial_ms: int = 200,
+                 latency_ms: float = 0, speed: float = 1.0, ssl_context: ssl.SSLContext = None, handshake_ms: float = 0):
+        self.host = host
+        self.port = port
+        self.bytes_per_ms = pcm16_bytes_per_ms(sample_rate)
+        self.script = script
+        self.sentence_ms = sentence_ms
+        self.partial_ms = partial_ms
+        self.latency_ms = latency_ms
+        self.handshake_ms = handshake_ms
+        self.speed = speed
+        self.ssl_context = ssl_context # serve wss://, e.g. to see TLS session resumption
+        self.finished_payload = {"output": {}} # of task-finished, the real server may put the last sentence in it
+        # Stats
+        self.connections = 0
+        self.active_connections = 0
+        self.tasks = 0
+        self.audio_ms_received = 0
+        self._runner: web.AppRunner = None
+        self._sockets: set[web.WebSocketResponse] = set()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: threading.Thread = None
+
+    @property
+    def url(self) -> str:
+        return f"{'wss' if self.ssl_context else 'ws'}://{self.host}:{self.port}/api-ws/v1/inference"
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/api-ws/v1/inference", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port, ssl_context=self.ssl_context)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.debug(f"FakeDashscopeServer listening on {self.url}")
+        return self.url
+
+    async def stop(self):
+        # Clients may keep their connection open between tasks
+        for ws in list(self._sockets):
+            await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self) -> str:
+        """Run on a dedicated loop, for synchronous callers."""
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+        self._thread = threading.Thread(target=run, daemon=True, name="FakeDashscopeServer")
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop_in_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _delay(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed > 0 else 0
+
+    def _generated(self, task_id: str, response: dict) -> str:
+        if response.get("status_code", 200) != 200:
+            return json.dumps({"header": {"event": "task-failed", "task_id": task_id,
+                                          "error_code": response.get("code", "Unknown"),
+                                          "error_message": response.get("message", "")}})
+        return json.dumps({"header": {"event": "result-generated", "task_id": task_id},
+                           "payload": {"output": response.get("output") or {}, "usage": response.get("usage")}},
+                          ensure_ascii=False)
+
+    def _synthetic(self, sentence: int, begin_ms: float, audio_ms: float, final: bool) -> dict:
+        text = f"sentence {sentence} " + "." * int((audio_ms - begin_ms) // self.partial_ms)
+        return {
+            "status_code": 200,
+            "output": {"sentence": {"begin_time": int(begin_ms), "end_time": int(audio_ms) if final else None, "text": text, "words": []}},
+            "usage": {"duration": int(audio_ms - begin_ms) // 1000} if final else None,
+        }
+
+    async def _handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        if self.handshake_ms:
+            await asyncio.sleep(self.handshake_ms / 1000)
+        await ws.prepare(request)
+        self.connections += 1
+        self.active_connections += 1
+        self._sockets.add(ws)
+        outbox: asyncio.Queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        async def send_worker():
+            # Messages are (due loop time, text), sent in order
+            while True:
+                due, message = await outbox.get()
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await ws.send_str(message)
+        sender = asyncio.create_task(send_worker())
+
+        task_id = None
+        audio_bytes = 0
+        script_index = 0
+        sentence = 0
+        sentence_begin_ms = 0
+        last_partial_ms = 0
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.TEXT:
+                    header = json.loads(msg.data)["header"]
+                    if header["action"] == "run-task":
+                        task_id = header["task_id"]
+                        self.tasks += 1
+                        audio_bytes = script_index = sentence = 0
+                        sentence_begin_ms = last_partial_ms = 0
+                        await ws.send_str(json.dumps({"header": {"event": "task-started", "task_id": task_id}}))
+                    elif header["action"] == "finish-task":
+                        finished = json.dumps({"header": {"event": "task-finished", "task_id": task_id}, "payload": self.finished_payload})
+                        outbox.put_nowait((loop.time(), finished))
+                elif msg.type == WSMsgType.BINARY:
+                    audio_bytes += len(msg.data)
+                    audio_ms = audio_bytes / self.bytes_per_ms
+                    self.audio_ms_received += len(msg.data) / self.bytes_per_ms
+                    if self.script is not None:
+                        while script_index < len(self.script) and self.script[script_index].audio_ms <= audio_ms:
+                            scripted = self.script[script_index]
+                            outbox.put_nowait((loop.time() + self._delay(scripted.delay_s), self._generated(task_id, scripted.response)))
+                            script_index += 1
+                    else:
+                        due = loop.time() + self._delay(self.latency_ms / 1000)
+                        if audio_ms - sentence_begin_ms >= self.sentence_ms:
+                            outbox.put_nowait((due, self._generated(task_id, self._synthetic(sentence, sentence_begin_ms, audio_ms, True))))
+                            sentence += 1
+                            sentence_begin_ms = last_partial_ms = audio_ms
+                        elif audio_ms - last_partial_ms >= self.partial_ms:
+                            outbox.put_nowait((due, self._generated(task_id, self._synthetic(sentence, sentence_begin_ms, audio_ms, False))))
+                            last_partial_ms = audio_ms
+        finally:
+            # The client only closes after task-finished, anything left is undeliverable
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            self.active_connections -= 1
+            self._sockets.discard(ws)
+        return ws
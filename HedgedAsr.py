@@ -0,0 +1,230 @@
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from dashscope.audio.asr import RecognitionResult
+from DashscopeApiAsr import DashscopeApiAsr
+from DashscopeCustomRecognition import DashscopeCustomRecognitionCallback
+from UsageLedger import UsageSession, UsageCallback
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Hedged recognition: the same audio goes to two sessions (another region, or another model),
+# whichever final of a sentence comes first is shown, the other one is recognized as the same sentence
+# by its `begin_time`/`end_time` and dropped. Both sessions get the audio from its first frame,
+# so their timestamps are on the same timeline. Costs twice the recognition, and usage is counted per session for that.
+
+
+@dataclass
+class _Final:
+    begin_time: int
+    end_time: int
+    leg: int
+    at: float # perf_counter when it arrived
+    matched: bool = False
+
+
+def _overlap_ratio(a_begin: int, a_end: int, b_begin: int, b_end: int) -> float:
+    # Overlap relative to the shorter one, the sessions may cut sentences a little differently
+    shorter = max(min(a_end - a_begin, b_end - b_begin), 1)
+    return (min(a_end, b_end) - max(a_begin, b_begin)) / shorter
+
+
+class SentenceHedge:
+    """
+    Merges the results of several sessions into one stream for `callback`.
+    Partials only come from the session that won the last sentence, so the chatbox does not flicker between two texts.
+
+    Args:
+        names: Of each session, for the log.
+        min_overlap (float): Finals of different sessions overlapping at least this much are the same sentence.
+    """
+    def __init__(self, callback: DashscopeCustomRecognitionCallback, names: list[str],
+                 publish: Callable[[dict], None] = None, min_overlap: float = 0.5, keep: int = 32):
+        self.callback = callback
+        self.names = names
+        self.publish = publish
+        self.min_overlap = min_overlap
+        self._lock = threading.Lock()
+        self._finals: deque[_Final] = deque(maxlen=keep)
+        self._delivered_end = -1
+        self._leader = 0
+        self._opened = False
+        self._completed = 0
+        self._closed = [False] * len(names)
+        self._failed = [False] * len(names)
+        # Stats
+        self.wins = [0] * len(names)
+        self.saved_ms: list[float] = [] # how much earlier the winner's final came than the other's
+        self.saved_vs_first_ms = 0.0 # total, compared to using only the first session
+
+    def _same_sentence(self, begin_time: int, end_time: int, leg: int) -> _Final | None:
+        for final in reversed(self._finals):
+            if final.leg != leg and _overlap_ratio(begin_time, end_time, final.begin_time, final.end_time) >= self.min_overlap:
+                return final
+        return None
+
+    def on_event(self, leg: int, result: RecognitionResult):
+        sentence = result.get_sentence()
+        if not sentence:
+            return
+        now = time.perf_counter()
+        begin_time, end_time = sentence.get("begin_time") or 0, sentence.get("end_time")
+        with self._lock:
+            if not result.is_sentence_end(sentence):
+                deliver = leg == self._leader and begin_time >= self._delivered_end
+            else:
+                final = self._same_sentence(begin_time, end_time, leg)
+                deliver = final is None
+                if deliver:
+                    self._finals.append(_Final(begin_time, end_time, leg, now))
+                    self._delivered_end = max(self._delivered_end, end_time)
+                    self._leader = leg
+                elif not final.matched:
+                    final.matched = True
+                    saved_ms = (now - final.at) * 1000
+                    self.wins[final.leg] += 1
+                    self.saved_ms.append(saved_ms)
+                    if final.leg != 0:
+                        self.saved_vs_first_ms += saved_ms
+                    logger.debug(f"[Hedge] {self.names[final.leg]} was {saved_ms:.0f}ms ahead of {self.names[leg]}")
+                    if self.publish:
+                        self.publish({"type": "latency", "hedge_winner": self.names[final.leg], "hedge_saved_ms": saved_ms})
+        if deliver:
+            self.callback.on_event(result)
+
+    def on_open(self, leg: int):
+        with self._lock:
+            first, self._opened = not self._opened, True
+        if first:
+            self.callback.on_open()
+
+    def on_error(self, leg: int, result: RecognitionResult):
+        with self._lock:
+            self._failed[leg] = True
+            others_running = any(not closed and not failed for i, (closed, failed) in enumerate(zip(self._closed, self._failed)) if i != leg)
+            if others_running and self._leader == leg:
+                self._leader = next(i for i in range(len(self.names)) if not self._closed[i] and not self._failed[i])
+        if others_running:
+            logger.warning(f"[Hedge] {self.names[leg]} failed, going on with the other session: {result.message}")
+        else:
+            self.callback.on_error(result)
+
+    def on_response_timeout(self, leg: int, result: RecognitionResult):
+        with self._lock:
+            last = sum(self._closed) + 1 >= len(self.names)
+        if last:
+            self.callback.on_response_timeout(result)
+
+    def on_complete(self, leg: int):
+        with self._lock:
+            self._completed += 1
+            last = self._completed == len(self.names)
+        if last:
+            self.callback.on_complete()
+
+    def on_close(self, leg: int):
+        with self._lock:
+            self._closed[leg] = True
+            last = all(self._closed)
+        if last:
+            self.log_summary()
+            self.callback.on_close()
+
+    def get_stats(self) -> dict:
+        matched = len(self.saved_ms)
+        return {
+            "wins": dict(zip(self.names, self.wins)),
+            "matched_sentences": matched,
+            "avg_saved_ms": sum(self.saved_ms) / matched if matched else 0.0,
+            "avg_saved_vs_first_ms": self.saved_vs_first_ms / matched if matched else 0.0,
+        }
+
+    def log_summary(self):
+        stats = self.get_stats()
+        if not stats["matched_sentences"]:
+            return
+        logger.info(f"[Hedge] {', '.join(f'{name} won {wins}' for name, wins in stats['wins'].items())} of {stats['matched_sentences']} sentences, "
+                    f"{stats['avg_saved_ms']:.0f}ms ahead of the slower session on average, "
+                    f"{stats['avg_saved_vs_first_ms']:.0f}ms earlier than {self.names[0]} alone")
+
+
+class _LegCallback(DashscopeCustomRecognitionCallback):
+    def __init__(self, hedge: SentenceHedge, leg: int):
+        self.hedge = hedge
+        self.leg = leg
+
+    def on_open(self) -> None:
+        self.hedge.on_open(self.leg)
+
+    def on_close(self) -> None:
+        self.hedge.on_close(self.leg)
+
+    def on_complete(self) -> None:
+        self.hedge.on_complete(self.leg)
+
+    def on_event(self, result: RecognitionResult) -> None:
+        self.hedge.on_event(self.leg, result)
+
+    def on_error(self, result: RecognitionResult) -> None:
+        self.hedge.on_error(self.leg, result)
+
+    def on_response_timeout(self, result: RecognitionResult):
+        self.hedge.on_response_timeout(self.leg, result)
+
+
+class HedgedDashscopeAsr:
+    """
+    Same interface as `DashscopeApiAsr`, running one session per `(model, url)` of `legs` on the same audio.
+    Keeps going while any of them does.
+
+    Args:
+        legs: `url` None for the default endpoint, e.g. `[("paraformer-realtime-v1", None), ("paraformer-realtime-v2", None)]`.
+        usage: Billed audio of every session is added, including the finals dropped as duplicates.
+    """
+    def __init__(self, legs: list[tuple[str, str | None]], publish: Callable[[dict], None] = None, usage: UsageSession = None):
+        self.legs = legs
+        self.publish = publish
+        self.usage = usage
+        self.asrs = [DashscopeApiAsr() for _ in legs]
+        self.hedge: SentenceHedge = None
+
+    def start(self, api_key: str, callback: DashscopeCustomRecognitionCallback, **kwargs):
+        names = [f"{model}@{url}" if url else model for model, url in self.legs]
+        if len(set(names)) < len(names):
+            names = [f"{name}#{i}" for i, name in enumerate(names)]
+        self.hedge = SentenceHedge(callback, names, self.publish)
+        for i, (asr, (model, url)) in enumerate(zip(self.asrs, self.legs)):
+            leg_callback = _LegCallback(self.hedge, i)
+            if self.usage:
+                leg_callback = UsageCallback(leg_callback, self.usage)
+            asr.start(api_key=api_key, callback=leg_callback, model=model, url=url, **kwargs)
+
+    def stop(self):
+        for asr in self.asrs:
+            if not asr.is_stopped():
+                asr.stop()
+
+    def is_stopped(self):
+        return all(asr.is_stopped() for asr in self.asrs)
+
+    def wait_ready(self, timeout: float = 10) -> bool:
+        # The first ready session is enough, the other one catches up from its backlog
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self.is_stopped():
+            if any(asr.wait_ready(0.01) for asr in self.asrs if not asr.is_stopped()):
+                return True
+        return False
+
+    def send_audio_frame(self, audio_data):
+        for asr in self.asrs:
+            if not asr.is_stopped():
+                asr.send_audio_frame(audio_data)
+
+    def get_backlog_stats(self):
+        # Of the session furthest behind, so a file is not read faster than both can take
+        running = [asr for asr in self.asrs if not asr.is_stopped()] or self.asrs
+        return max((asr.get_backlog_stats() for asr in running), key=lambda stats: stats["backlog_frames"])
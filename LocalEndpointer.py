@@ -0,0 +1,60 @@
+from AudioLevel import DEFAULT_SILENCE_RMS, SAMPLE_WIDTH, pcm16_rms
+
+
+class EndpointEvent:
+    ONSET = 'onset'
+    OFFSET = 'offset'
+
+
+# Energy based speech onset/offset detection on the capture side,
+# so the UI can react before the ASR server does.
+class LocalEndpointer:
+    """
+    Args:
+        sample_rate (int): The pcm sample rate.
+        window_ms (int): Frames are judged in windows of this length.
+        onset_ms (int): Voiced audio needed to report an onset.
+        offset_ms (int): Silence needed after speech to report an offset.
+        speech_rms (float): Minimum RMS of a voiced window.
+        noise_ratio (float): A voiced window is also louder than noise floor * `noise_ratio`.
+    """
+    def __init__(self, sample_rate: int = 16000, window_ms: int = 20, onset_ms: int = 60, offset_ms: int = 600,
+                 speech_rms: float = DEFAULT_SILENCE_RMS, noise_ratio: float = 3.0):
+        self.window_bytes = sample_rate * window_ms // 1000 * SAMPLE_WIDTH
+        self.window_ms = window_ms
+        self.onset_ms = onset_ms
+        self.offset_ms = offset_ms
+        self.speech_rms = speech_rms
+        self.noise_ratio = noise_ratio
+        self.noise_floor = speech_rms / noise_ratio
+        self.in_speech = False
+        self._voiced_ms = 0
+        self._silent_ms = 0
+
+    def process(self, buffer: bytes) -> list[str]:
+        """Feed one captured frame, returns the `EndpointEvent`s found in it."""
+        events = []
+        view = memoryview(buffer)
+        for offset in range(0, len(view) - self.window_bytes + 1, self.window_bytes):
+            rms = pcm16_rms(view[offset:offset + self.window_bytes])
+            voiced = rms >= max(self.speech_rms, self.noise_floor * self.noise_ratio)
+            if not voiced:
+                # Follow the noise floor down quickly and up slowly
+                self.noise_floor += (rms - self.noise_floor) * (0.5 if rms < self.noise_floor else 0.02)
+
+            if voiced:
+                self._voiced_ms += self.window_ms
+                self._silent_ms = 0
+            else:
+                self._silent_ms += self.window_ms
+                if not self.in_speech:
+                    self._voiced_ms = 0
+
+            if not self.in_speech and self._voiced_ms >= self.onset_ms:
+                self.in_speech = True
+                events.append(EndpointEvent.ONSET)
+            elif self.in_speech and self._silent_ms >= self.offset_ms:
+                self.in_speech = False
+                self._voiced_ms = 0
+                events.append(EndpointEvent.OFFSET)
+        return events
@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+import logging
+from typing import Any, List
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Machine translation on CPU with int8 quantized Opus-MT models through CTranslate2
+#   pip install ctranslate2 sentencepiece
+# One model per language pair in `{model_dir}/{source_language}-{target_language}`, converted by e.g.
+#   ct2-transformers-converter --model Helsinki-NLP/opus-mt-zh-en --output_dir mt/zh-en --quantization int8 --copy_files source.spm target.spm
+
+_shared_local_translators: dict[tuple[str, int], "LocalMtTranslator"] = {}
+_shared_local_translators_lock = threading.Lock()
+
+
+class LocalMtTranslator:
+    """
+    Same `translate`, `translate_batch` and `translate_multi` as `AlicloudApiTranslator`.
+    `context` and the network timeouts are accepted and ignored.
+    """
+    def __init__(self, model_dir: str, num_threads: int = 2, max_batch_size: int = 16):
+        self.model_dir = model_dir
+        self.num_threads = num_threads
+        self.max_batch_size = max_batch_size
+        self._models: dict[tuple[str, str], tuple[Any, Any, Any]] = {}
+        # One translation at a time, ctranslate2 already uses `num_threads` for each
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_shared(model_dir: str, num_threads: int = 2, warm_up_pairs: list[tuple[str, str]] = None) -> "LocalMtTranslator":
+        """
+        获取一个可在`ARSWorker`重启之间复用的本地Translator
+        第一次创建时会在后台线程里加载并预热`warm_up_pairs`的模型
+        """
+        key = (os.path.abspath(model_dir), num_threads)
+        with _shared_local_translators_lock:
+            translator = _shared_local_translators.get(key, None)
+            if translator is None:
+                translator = LocalMtTranslator(model_dir, num_threads)
+                if warm_up_pairs:
+                    threading.Thread(target=translator.warm_up, args=(warm_up_pairs,), daemon=True).start()
+                _shared_local_translators[key] = translator
+        return translator
+
+    def pair_dir(self, source_language: str, target_language: str) -> str:
+        return os.path.join(self.model_dir, f"{source_language}-{target_language}")
+
+    def supports(self, source_language: str, target_language: str) -> bool:
+        return (source_language, target_language) in self._models or os.path.exists(os.path.join(self.pair_dir(source_language, target_language), "model.bin"))
+
+    def _load(self, source_language: str, target_language: str) -> tuple[Any, Any, Any]:
+        # Must be called with `self._lock` held
+        model = self._models.get((source_language, target_language), None)
+        if model is not None:
+            return model
+        try:
+            import ctranslate2
+            import sentencepiece
+        except ImportError as e:
+            raise ImportError("The local translator needs `pip install ctranslate2 sentencepiece`") from e
+        path = self.pair_dir(source_language, target_language)
+        start = time.perf_counter()
+        model = (
+            ctranslate2.Translator(path, device="cpu", compute_type="int8", intra_threads=self.num_threads),
+            sentencepiece.SentencePieceProcessor(model_file=os.path.join(path, "source.spm")),
+            sentencepiece.SentencePieceProcessor(model_file=os.path.join(path, "target.spm")),
+        )
+        self._models[(source_language, target_language)] = model
+        logger.info(f"Local MT model {path} loaded in {time.perf_counter() - start:.1f}s")
+        return model
+
+    def warm_up(self, pairs: list[tuple[str, str]]) -> float:
+        """
+        加载模型并翻译一次，让第一句话不用等模型加载和内存分配
+        @return: 耗时(秒)，失败时返回-1
+        """
+        start = time.perf_counter()
+        try:
+            for source_language, target_language in pairs:
+                if self.supports(source_language, target_language):
+                    self.translate_batch(source_language, target_language, ["hi"])
+        except Exception as e:
+            logger.warning(f"Local translator warm up failed: {e}")
+            return -1
+        elapsed = time.perf_counter() - start
+        logger.debug(f"Local translator warm up took {elapsed * 1000:.1f}ms")
+        return elapsed
+
+    def translate(self, source_language, target_language, context, source_text, read_timeout_ms=None, connect_timeout_ms=None) -> str:
+        return self.translate_batch(source_language, target_language, [source_text])[0]
+
+    def translate_batch(self, source_language, target_language, source_texts: List[str], read_timeout_ms=None, connect_timeout_ms=None) -> List[str]:
+        """
+        所有句子在一次推理里批量翻译（按长度分组，减少padding）
+        """
+        start = time.perf_counter()
+        with self._lock:
+            translator, source_spm, target_spm = self._load(source_language, target_language)
+            tokens = [tokens + ["</s>"] for tokens in source_spm.encode(source_texts, out_type=str)]
+            # Greedy, and never much longer than the input even if the model starts repeating itself
+            results = translator.translate_batch(tokens, max_batch_size=self.max_batch_size, beam_size=1,
+                                                 max_decoding_length=min(256, max(len(t) for t in tokens) * 3 + 8))
+        translated = target_spm.decode([result.hypotheses[0] for result in results])
+        logger.debug(f"Local translate of {len(source_texts)} texts took {(time.perf_counter() - start) * 1000:.1f}ms")
+        return translated
+
+    def translate_multi(self, source_language, target_languages: List[str], context, source_texts: List[str], read_timeout_ms=None, connect_timeout_ms=None) -> List[dict[str, str]]:
+        """
+        把多句话翻译成多种语言，每种语言一次批量推理
+        @return: 每句话对应一个 {target_language: translated_text}
+        """
+        results = [{} for _ in source_texts]
+        for lang in target_languages:
+            for i, translated in enumerate(self.translate_batch(source_language, lang, source_texts)):
+                results[i][lang] = translated
+        return results
@@ -0,0 +1,249 @@
+import os
+import time
+import uuid
+import platform
+import threading
+import logging
+from http import HTTPStatus
+from typing import Any, Dict
+
+from dashscope.api_entities.dashscope_response import DashScopeAPIResponse, RecognitionResponse
+from dashscope.audio.asr import RecognitionResult
+from DashscopeCustomRecognition import DashscopeCustomRecognitionCallback
+from AudioBacklog import AudioBacklog, BacklogPolicy
+from AudioLevel import pcm16_bytes_per_ms
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# On-device streaming Paraformer, run by ONNX Runtime on CPU through sherpa-onnx
+#   pip install sherpa-onnx numpy
+# The model directory holds tokens.txt, encoder(.int8).onnx and decoder(.int8).onnx,
+# e.g. sherpa-onnx-streaming-paraformer-bilingual-zh-en from the sherpa-onnx asr-models releases.
+# The int8 quantized files are preferred when present.
+
+_shared_models: dict[tuple[str, int], Any] = {}
+_shared_models_lock = threading.Lock()
+
+
+def _model_file(model_dir: str, name: str) -> str:
+    for file_name in (f"{name}.int8.onnx", f"{name}.onnx"):
+        path = os.path.join(model_dir, file_name)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No {name}.int8.onnx or {name}.onnx in {model_dir}")
+
+
+def load_model(model_dir: str, num_threads: int = 2) -> Any:
+    """Load a streaming Paraformer, endpoints are detected by trailing silence like the server does."""
+    try:
+        import sherpa_onnx
+    except ImportError as e:
+        raise ImportError("The local ASR engine needs `pip install sherpa-onnx numpy`") from e
+    start = time.perf_counter()
+    model = sherpa_onnx.OnlineRecognizer.from_paraformer(
+        tokens=os.path.join(model_dir, "tokens.txt"),
+        encoder=_model_file(model_dir, "encoder"),
+        decoder=_model_file(model_dir, "decoder"),
+        num_threads=num_threads,
+        sample_rate=16000,
+        feature_dim=80,
+        enable_endpoint_detection=True,
+        rule1_min_trailing_silence=2.4, # no speech yet
+        rule2_min_trailing_silence=0.8, # after speech
+        rule3_min_utterance_length=20,
+        provider="cpu",
+    )
+    logger.info(f"Local ASR model {model_dir} loaded in {time.perf_counter() - start:.1f}s, {num_threads} threads")
+    return model
+
+
+def get_shared_model(model_dir: str, num_threads: int = 2) -> Any:
+    """The model is loaded once and reused between `ARSWorker` restarts."""
+    key = (os.path.abspath(model_dir), num_threads)
+    with _shared_models_lock:
+        model = _shared_models.get(key, None)
+        if model is None:
+            model = load_model(model_dir, num_threads)
+            _shared_models[key] = model
+    return model
+
+
+def pcm16_to_float(buffer: bytes):
+    import numpy as np
+    return np.frombuffer(buffer, dtype=np.int16).astype(np.float32) / 32768
+
+
+# Same interface and callbacks as `DashscopeApiAsr`, so `VRChatOscCallback` works unchanged
+class LocalParaformerAsr:
+    """
+    Audio is queued into an `AudioBacklog` and decoded on a worker thread,
+    results are `RecognitionResult`s shaped like the server's: partials, then a final with `end_time` at each endpoint.
+
+    Args:
+        max_duration_s (float): Stop by itself after this much audio, at the next endpoint. None to run until `stop`.
+    """
+    def __init__(self, model_dir: str, num_threads: int = 2, sample_rate: int = 16000):
+        self.model_dir = model_dir
+        self.num_threads = num_threads
+        self.sample_rate = sample_rate
+        self.bytes_per_ms = pcm16_bytes_per_ms(sample_rate)
+        self.callback: DashscopeCustomRecognitionCallback = None
+        self.max_duration_s: float = None
+        self._model = None
+        self._stream = None
+        self._backlog: AudioBacklog = None
+        self._worker: threading.Thread = None
+        self._running = False
+        self._task_id = ""
+        # Stats
+        self.decoded_ms = 0.0
+        self.decode_s = 0.0
+
+    def start(self, callback: DashscopeCustomRecognitionCallback, max_backlog_ms=None, backlog_policy=BacklogPolicy.DROP_SILENCE,
+              stall_timeout_ms=2000, max_duration_s: float = None):
+        self._model = get_shared_model(self.model_dir, self.num_threads)
+        self._stream = self._model.create_stream()
+        self._backlog = AudioBacklog(self.sample_rate, max_backlog_ms, backlog_policy, stall_timeout_ms)
+        self.callback = callback
+        self.max_duration_s = max_duration_s
+        self._task_id = uuid.uuid4().hex
+        self._running = True
+        self._worker = threading.Thread(target=self._decode_worker, daemon=True, name="LocalParaformerAsr")
+        self._worker.start()
+        self.callback.on_open()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._worker.join()
+        self.callback.on_close()
+
+    def is_stopped(self):
+        return not self._running
+
+    def send_audio_frame(self, audio_data: bytes):
+        self._backlog.append(audio_data)
+
+    def get_backlog_stats(self) -> Dict[str, Any]:
+        return self._backlog.get_stats()
+
+    def get_rtf(self) -> float:
+        """Decoding time over decoded audio duration, below 1 keeps up with real time."""
+        return self.decode_s * 1000 / self.decoded_ms if self.decoded_ms else 0
+
+    def _to_result(self, text: str, begin_ms: float, end_ms: float = None) -> RecognitionResult:
+        sentence = {"begin_time": int(begin_ms), "end_time": None if end_ms is None else int(end_ms), "text": text, "words": []}
+        response = DashScopeAPIResponse(request_id=self._task_id, status_code=HTTPStatus.OK, output={"sentence": sentence})
+        return RecognitionResult(RecognitionResponse.from_api_response(response))
+
+    def _decode(self, samples=None):
+        start = time.perf_counter()
+        if samples is not None:
+            self._stream.accept_waveform(self.sample_rate, samples)
+        while self._model.is_ready(self._stream):
+            self._model.decode_stream(self._stream)
+        self.decode_s += time.perf_counter() - start
+
+    def _decode_worker(self):
+        text = ""
+        begin_ms = 0.0
+        ended_by_itself = False
+        try:
+            while self._running:
+                frame = self._backlog.pop()
+                if frame is None:
+                    time.sleep(0.01)
+                    continue
+                self._decode(pcm16_to_float(frame))
+                self.decoded_ms += len(frame) / self.bytes_per_ms
+                self._backlog.ack()
+
+                new_text = self._model.get_result(self._stream)
+                if new_text and new_text != text:
+                    text = new_text
+                    self.callback.on_event(self._to_result(text, begin_ms))
+                if self._model.is_endpoint(self._stream):
+                    if text:
+                        self.callback.on_event(self._to_result(text, begin_ms, self.decoded_ms))
+                    self._model.reset(self._stream)
+                    text = ""
+                    begin_ms = self.decoded_ms
+                    if self.max_duration_s and self.decoded_ms >= self.max_duration_s * 1000:
+                        ended_by_itself = True
+                        break
+
+            # Flush the sentence in progress
+            if not ended_by_itself:
+                self._stream.input_finished()
+                self._decode()
+                text = self._model.get_result(self._stream)
+                if text:
+                    self.callback.on_event(self._to_result(text, begin_ms, self.decoded_ms))
+            self.callback.on_complete()
+        except Exception as e:
+            logger.exception("Local ASR failed")
+            ended_by_itself = True
+            response = DashScopeAPIResponse(request_id=self._task_id, status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                                            code=type(e).__name__, message=str(e))
+            self.callback.on_error(RecognitionResult(RecognitionResponse.from_api_response(response)))
+        if ended_by_itself:
+            self._running = False
+            self._backlog.clear()
+            self.callback.on_close()
+
+
+def benchmark(model_dir: str, audio: bytes, num_threads: int = 2, frame_ms: int = 200, sample_rate: int = 16000) -> dict:
+    """
+    Decode `audio` (16bit mono pcm) as fast as possible, frame by frame like the mic delivers it.
+    `frame_p95_ms` is the latency the engine adds on top of the audio itself when running live.
+    """
+    load_start = time.perf_counter()
+    model = load_model(model_dir, num_threads)
+    load_s = time.perf_counter() - load_start
+    stream = model.create_stream()
+    bytes_per_ms = pcm16_bytes_per_ms(sample_rate)
+    frame_bytes = int(frame_ms * bytes_per_ms)
+    frame_times: list[float] = []
+    sentences: list[str] = []
+    first_partial_ms: float = None
+
+    for offset in range(0, len(audio) - frame_bytes + 1, frame_bytes):
+        start = time.perf_counter()
+        stream.accept_waveform(sample_rate, pcm16_to_float(audio[offset:offset + frame_bytes]))
+        while model.is_ready(stream):
+            model.decode_stream(stream)
+        text = model.get_result(stream)
+        frame_times.append(time.perf_counter() - start)
+        if text and first_partial_ms is None:
+            first_partial_ms = (offset + frame_bytes) / bytes_per_ms
+        if model.is_endpoint(stream):
+            if text:
+                sentences.append(text)
+            model.reset(stream)
+    # Finalization after the speaker stops, without waiting for trailing silence
+    start = time.perf_counter()
+    stream.input_finished()
+    while model.is_ready(stream):
+        model.decode_stream(stream)
+    if text := model.get_result(stream):
+        sentences.append(text)
+    finalize_ms = (time.perf_counter() - start) * 1000
+
+    audio_s = len(audio) / bytes_per_ms / 1000
+    decode_s = sum(frame_times)
+    frame_times.sort()
+    return {
+        "cpu": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "num_threads": num_threads,
+        "load_s": load_s,
+        "audio_s": audio_s,
+        "rtf": decode_s / audio_s if audio_s else 0,
+        "frame_p50_ms": frame_times[len(frame_times) // 2] * 1000 if frame_times else 0,
+        "frame_p95_ms": frame_times[int(len(frame_times) * 0.95)] * 1000 if frame_times else 0,
+        "frame_max_ms": frame_times[-1] * 1000 if frame_times else 0,
+        "first_partial_audio_ms": first_partial_ms,
+        "finalize_ms": finalize_ms,
+        "sentences": sentences,
+    }
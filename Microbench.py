@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import queue
+import asyncio
+import logging
+import platform
+import statistics
+import subprocess
+from http import HTTPStatus
+from typing import Callable
+
+from dashscope.api_entities.dashscope_response import DashScopeAPIResponse, RecognitionResponse
+from dashscope.audio.asr import RecognitionResult
+
+from core import Setting, VRChatOscCallback, MicCollector
+from DashscopeCustomRecognition import DashscopeCustomRecognition, DashscopeCustomRecognitionCallback
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Microbenchmarks of what runs per audio frame and per recognition event, see `main.microbench.py`
+# Each benchmark is a setup function returning `run(n)`, which does the operation `n` times.
+# A run is one json line in the history file:
+#   {"time", "commit", "python", "platform", "results": {name: {"us_per_op", "min_us_per_op"}}}
+
+FRAME = bytes(3200) # 100ms of 16kHz 16bit pcm, what `MicCollector` reads
+
+
+class _NullOscClient:
+    def send_message(self, address, value):
+        pass
+
+
+class _EchoTranslator:
+    cloud_used = False
+
+    def translate_multi(self, src_lang: str, dst_langs: list[str], context: str, texts: list[str]) -> list[dict[str, str]]:
+        return [{lang: text for lang in dst_langs} for text in texts]
+
+
+class _NullCallback(DashscopeCustomRecognitionCallback):
+    pass
+
+
+class _FakeStream:
+    # What `MicCollector` uses of a pyaudio stream
+    def read(self, frames: int) -> bytes:
+        return FRAME[:frames * 2] if frames * 2 <= len(FRAME) else bytes(frames * 2)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _result(text: str, end: bool) -> RecognitionResult:
+    words = [{"begin_time": 1200 + i * 200, "end_time": 1400 + i * 200, "text": c, "punctuation": ""} for i, c in enumerate(text)]
+    output = {"sentence": {"begin_time": 1200, "end_time": 4400 if end else None, "text": text, "words": words}}
+    usage = {"duration": 4} if end else None
+    response = DashScopeAPIResponse(request_id="bench", status_code=HTTPStatus.OK, output=output, usage=usage, code=None, message=None)
+    usages = [{"end_time": 4400, "usage": usage}] if end else None
+    return RecognitionResult(RecognitionResponse.from_api_response(response), usages=usages)
+
+
+class _QuietLogger:
+    # The callbacks log every event: keep the cost of making the records, without writing them out
+    def __enter__(self):
+        self._handlers, logger.handlers = logger.handlers, [logging.NullHandler()]
+
+    def __exit__(self, *_):
+        logger.handlers = self._handlers
+
+
+def _recognition(stall_timeout_ms: int = 2000) -> DashscopeCustomRecognition:
+    recognition = DashscopeCustomRecognition('paraformer-realtime-v1', _NullCallback(), 'pcm', 16000, stall_timeout_ms=stall_timeout_ms)
+    # Not connected, only the uplink side is measured
+    recognition._running = True
+    return recognition
+
+
+def bench_send_audio_frame() -> Callable[[int], None]:
+    recognition = _recognition(stall_timeout_ms=10**9)
+    def run(n: int):
+        for i in range(n):
+            recognition.send_audio_frame(FRAME)
+            if i % 100 == 99:
+                recognition._stream_data.clear()
+        recognition._stream_data.clear()
+    return run
+
+
+def bench_send_and_pull() -> Callable[[int], None]:
+    # A frame through the backlog into the SDK's input generator
+    recognition = _recognition()
+    frames = recognition._input_stream_cycle()
+    def run(n: int):
+        for _ in range(n):
+            recognition.send_audio_frame(FRAME)
+            next(frames)
+    return run
+
+
+def _osc_callback(translator=None) -> VRChatOscCallback:
+    callback = VRChatOscCallback(Setting())
+    callback.osc_client = _NullOscClient()
+    if translator:
+        # Translated in `run` instead of a worker thread, so it is measured too
+        callback.translator = translator
+        callback.pending_texts = queue.Queue()
+    return callback
+
+
+def bench_on_event_partial() -> Callable[[int], None]:
+    callback = _osc_callback()
+    result = _result("今天晚上一起去那个世界", False)
+    def run(n: int):
+        with _QuietLogger():
+            for _ in range(n):
+                callback.on_event(result)
+    return run
+
+
+def bench_on_event_final() -> Callable[[int], None]:
+    callback = _osc_callback()
+    result = _result("今天晚上一起去那个世界看看吧。", True)
+    def run(n: int):
+        with _QuietLogger():
+            for _ in range(n):
+                callback.on_event(result)
+    return run
+
+
+def bench_on_event_final_translated() -> Callable[[int], None]:
+    callback = _osc_callback(_EchoTranslator())
+    result = _result("今天晚上一起去那个世界看看吧。", True)
+    def run(n: int):
+        with _QuietLogger():
+            for _ in range(n):
+                callback.on_event(result)
+                texts, _ = callback._take_burst(callback.pending_texts.get_nowait())
+                callback._send_translated(texts, callback._translate(texts))
+    return run
+
+
+def bench_setting_serialize() -> Callable[[int], None]:
+    setting = Setting()
+    def run(n: int):
+        for _ in range(n):
+            setting.serialize()
+    return run
+
+
+def bench_setting_deserialize() -> Callable[[int], None]:
+    setting = Setting()
+    data = setting.serialize()
+    def run(n: int):
+        for _ in range(n):
+            setting.deserialize(data)
+    return run
+
+
+def bench_mic_read() -> Callable[[int], None]:
+    # The thread hop of every read, the stream itself returns at once
+    mic = MicCollector(Setting())
+    mic.stream = _FakeStream()
+    loop = asyncio.new_event_loop()
+    async def read(n: int):
+        for _ in range(n):
+            await mic.read()
+    def run(n: int):
+        loop.run_until_complete(read(n))
+    return run
+
+
+BENCHMARKS: dict[str, Callable[[], Callable[[int], None]]] = {
+    "recognition.send_audio_frame": bench_send_audio_frame,
+    "recognition.send_and_pull": bench_send_and_pull,
+    "osc_callback.on_event.partial": bench_on_event_partial,
+    "osc_callback.on_event.final": bench_on_event_final,
+    "osc_callback.on_event.final_translated": bench_on_event_final_translated,
+    "setting.serialize": bench_setting_serialize,
+    "setting.deserialize": bench_setting_deserialize,
+    "mic.read": bench_mic_read,
+}
+
+
+def measure(run: Callable[[int], None], repeat: int = 9, target_s: float = 0.05) -> dict:
+    """µs per operation, median and best of `repeat` timings of about `target_s` each."""
+    n = 1
+    while True:
+        start = time.perf_counter()
+        run(n)
+        elapsed = time.perf_counter() - start
+        if elapsed >= target_s / 10 or n >= 1 << 20:
+            break
+        n *= 10
+    n = max(1, int(n * target_s / max(elapsed, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(n)
+        timings.append((time.perf_counter() - start) / n * 1e6)
+    return {"us_per_op": statistics.median(timings), "min_us_per_op": min(timings)}
+
+
+def run_benchmarks(names: list[str] = None, repeat: int = 9, target_s: float = 0.05) -> dict:
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and not any(part in name for part in names):
+            continue
+        results[name] = measure(setup(), repeat, target_s)
+    return results
+
+
+def run_benchmarks_in_processes(names: list[str] = None, repeat: int = 9, processes: int = 5) -> dict:
+    """
+    Each round in a fresh process, one after another: hash seeds and memory layout differ between processes
+    and can move a result by 20% or more, within one process it stays where it happened to land.
+    """
+    rounds = []
+    for _ in range(processes):
+        # Not `multiprocessing`, it would import the `main.*.py` script again as `__mp_main__`
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), json.dumps({"names": names, "repeat": repeat})],
+                             capture_output=True, text=True, check=True)
+        rounds.append(json.loads(out.stdout.splitlines()[-1]))
+    return {name: {"us_per_op": statistics.median(r[name]["us_per_op"] for r in rounds),
+                   "min_us_per_op": min(r[name]["min_us_per_op"] for r in rounds)}
+            for name in rounds[0]}
+
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def make_entry(results: dict, label: str = None) -> dict:
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": _commit(),
+        "label": label,
+        "python": platform.python_version(),
+        "platform": f"{sys.platform} {platform.machine()}",
+        "results": results,
+    }
+
+
+def load_history(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(path: str, entry: dict):
+    with open(path, "at", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def find_baseline(history: list[dict], baseline: str = None) -> dict | None:
+    """The last entry if `baseline` is None, else the last one whose label or commit is `baseline`, or index into the history."""
+    if not history:
+        return None
+    if baseline is None:
+        return history[-1]
+    for entry in reversed(history):
+        if baseline in (entry.get("label"), entry.get("commit")):
+            return entry
+    try:
+        return history[int(baseline)]
+    except (ValueError, IndexError):
+        return None
+
+
+def compare(baseline: dict, current: dict, threshold_pct: float = 20) -> list[dict]:
+    """
+    Per benchmark in both: change of the median in %, regressed if the median and the best timing
+    are both slower by more than `threshold_pct`, a single lucky or unlucky timing does not decide it.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        change_pct = (result["us_per_op"] / before["us_per_op"] - 1) * 100
+        best_change_pct = (result["min_us_per_op"] / before["min_us_per_op"] - 1) * 100
+        rows.append({"name": name, "before_us": before["us_per_op"], "after_us": result["us_per_op"],
+                     "change_pct": change_pct, "best_change_pct": best_change_pct,
+                     "regressed": change_pct > threshold_pct and best_change_pct > threshold_pct})
+    return rows
+
+
+if __name__ == "__main__":
+    # One round of `run_benchmarks_in_processes`
+    #   python Microbench.py '{"names": null, "repeat": 9}'
+    logger.setLevel(logging.DEBUG)
+    params = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+    print(json.dumps(run_benchmarks(params.get("names"), params.get("repeat", 9))))
@@ -0,0 +1,341 @@
+import abc
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import urllib.parse
+from dataclasses import dataclass
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Bad home networks on demand, in front of the local stand-ins:
+#   `TcpImpairmentProxy` before `FakeDashscopeServer` (websocket) or `FakeAlimtServer` (HTTP),
+#   `UdpImpairmentProxy` before an OSC receiver such as `CaptureReplay.OscCollector`.
+# Clients are pointed at the proxy with `proxy.rewrite(url)`, e.g. `dashscope.base_websocket_api_url`,
+# the `url` of `DashscopeAsyncRecognition`, or `alicloud_endpoint`.
+# What the proxies do follows an `ImpairmentTimeline`, scripted as json:
+#   [{"at": 0, "latency_ms": 40, "jitter_ms": 10},
+#    {"at": 60, "latency_ms": 300, "loss": 0.05, "bandwidth_kbps": 128},
+#    {"at": 120, "latency_ms": 40, "disconnect": true},
+#    {"at": 180, "down": true},
+#    {"at": 190}]
+# Each entry holds from `at` seconds on until the next one, left out fields are 0.
+
+
+@dataclass
+class Impairment:
+    latency_ms: float = 0 # one way, added to every chunk or datagram
+    jitter_ms: float = 0 # the latency varies uniformly by up to this much either way
+    bandwidth_kbps: float = 0 # per direction, shared by all connections of a proxy like a home uplink, 0 for unlimited
+    loss: float = 0 # share of datagrams dropped; TCP does not lose data, a lost segment stalls its stream for a retransmission timeout
+    down: bool = False # open connections are cut, new ones refused, datagrams dropped
+
+
+@dataclass
+class Phase:
+    at_s: float
+    impairment: Impairment
+    disconnect: bool = False # cut every open connection when the phase begins
+
+
+class ImpairmentTimeline:
+    """
+    Which `Impairment` holds when, shared by the proxies of one test.
+
+    Args:
+        speed: The timeline runs this many times faster than the wall clock, like the audio of `SoakTest`. Latencies are not scaled.
+    """
+    def __init__(self, phases: list[Phase] = None, speed: float = 1.0):
+        self.phases = sorted(phases or [], key=lambda phase: phase.at_s)
+        self.speed = speed
+        self._start = time.perf_counter()
+
+    @staticmethod
+    def from_script(script: list[dict], speed: float = 1.0) -> "ImpairmentTimeline":
+        phases = []
+        for entry in script:
+            entry = dict(entry)
+            at_s = entry.pop("at", 0)
+            disconnect = entry.pop("disconnect", False)
+            phases.append(Phase(at_s, Impairment(**entry), disconnect))
+        return ImpairmentTimeline(phases, speed)
+
+    @staticmethod
+    def load(path: str, speed: float = 1.0) -> "ImpairmentTimeline":
+        with open(path, "rt", encoding="utf-8") as f:
+            return ImpairmentTimeline.from_script(json.load(f), speed)
+
+    @staticmethod
+    def constant(**kwargs) -> "ImpairmentTimeline":
+        return ImpairmentTimeline([Phase(0, Impairment(**kwargs))])
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def now(self) -> float:
+        return (time.perf_counter() - self._start) * self.speed
+
+    def index(self) -> int:
+        """Of the phase holding now, -1 before the first one."""
+        now = self.now()
+        index = -1
+        for i, phase in enumerate(self.phases):
+            if phase.at_s > now:
+                break
+            index = i
+        return index
+
+    def current(self) -> Impairment:
+        index = self.index()
+        return self.phases[index].impairment if index >= 0 else Impairment()
+
+
+class _Link:
+    # One direction of a proxy, shared by its connections
+    def __init__(self):
+        self.free_at = 0.0
+        self.lost = 0
+
+    def schedule(self, size: int, impairment: Impairment, now: float, rng: random.Random, reliable: bool) -> float | None:
+        """Loop time when `size` bytes arrive at the other end, None if lost."""
+        ready = now
+        if impairment.bandwidth_kbps > 0:
+            self.free_at = max(self.free_at, now) + size * 8 / (impairment.bandwidth_kbps * 1000)
+            ready = self.free_at
+        latency_ms = impairment.latency_ms + (rng.uniform(-1, 1) * impairment.jitter_ms if impairment.jitter_ms else 0)
+        due = ready + max(0.0, latency_ms) / 1000
+        if impairment.loss and rng.random() < impairment.loss:
+            self.lost += 1
+            if not reliable:
+                return None
+            # Sent again after a retransmission timeout of about two round trips, at least 200ms
+            due += max(0.2, 4 * impairment.latency_ms / 1000)
+        return due
+
+
+class _ImpairmentProxy(abc.ABC):
+    def __init__(self, target: tuple[str, int], timeline: ImpairmentTimeline = None, host: str = "127.0.0.1", port: int = 0,
+                 name: str = None, seed: int = None):
+        self.target = target
+        self.timeline = timeline or ImpairmentTimeline()
+        self.host = host
+        self.port = port
+        self.name = name or f"{type(self).__name__} to {target[0]}:{target[1]}"
+        self.random = random.Random(seed)
+        self._uplink = _Link() # client -> target
+        self._downlink = _Link()
+        self._phase = -1
+        self._watch_task: asyncio.Task = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: threading.Thread = None
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def rewrite(self, url: str) -> str:
+        """`url` of the target, through this proxy instead."""
+        return urllib.parse.urlsplit(url)._replace(netloc=self.address).geturl()
+
+    async def _watch(self):
+        while True:
+            index = self.timeline.index()
+            if index != self._phase:
+                self._phase = index
+                phase = self.timeline.phases[index]
+                logger.info(f"[Impairment] {self.name}: {phase.impairment}{', disconnect' if phase.disconnect else ''}")
+                if phase.disconnect or phase.impairment.down:
+                    self._cut()
+            await asyncio.sleep(0.01)
+
+    @abc.abstractmethod
+    def _cut(self):
+        """Drop whatever is open when the timeline goes down."""
+
+    @abc.abstractmethod
+    async def start(self) -> str:
+        """Listen, returning `address`."""
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+
+    def start_in_thread(self) -> str:
+        """Run on a dedicated loop, for synchronous callers."""
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+        self._thread = threading.Thread(target=run, daemon=True, name=type(self).__name__)
+        self._thread.start()
+        started.wait()
+        return self.address
+
+    def stop_in_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class TcpImpairmentProxy(_ImpairmentProxy):
+    """Forwards every connection to `target`, the bytes of each direction delayed, throttled and stalled by the timeline."""
+    def __init__(self, target: tuple[str, int], timeline: ImpairmentTimeline = None, host: str = "127.0.0.1", port: int = 0,
+                 name: str = None, seed: int = None):
+        super().__init__(target, timeline, host, port, name, seed)
+        self._server: asyncio.Server = None
+        self._connections: set[tuple[asyncio.StreamWriter, asyncio.StreamWriter]] = set()
+        self._handlers: set[asyncio.Task] = set()
+        # Stats
+        self.stats = {"connections": 0, "refused": 0, "cut": 0, "bytes_up": 0, "bytes_down": 0, "retransmits": 0}
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._watch_task = asyncio.create_task(self._watch())
+        logger.debug(f"{self.name} listening on {self.address}")
+        return self.address
+
+    async def stop(self):
+        await super().stop()
+        if self._server:
+            self._server.close()
+            self._server = None
+        self._cut()
+        for handler in self._handlers:
+            handler.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    def _cut(self):
+        # Like a dropped line: no close handshake, both ends see a reset
+        for client, upstream in list(self._connections):
+            client.transport.abort()
+            upstream.transport.abort()
+            self.stats["cut"] += 1
+        self._connections.clear()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            await self._forward(reader, writer)
+        except asyncio.CancelledError:
+            writer.transport.abort()
+        finally:
+            self._handlers.discard(handler)
+
+    async def _forward(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.timeline.current().down:
+            self.stats["refused"] += 1
+            writer.transport.abort()
+            return
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(*self.target)
+        except OSError:
+            writer.transport.abort()
+            return
+        connection = (writer, upstream_writer)
+        self._connections.add(connection)
+        self.stats["connections"] += 1
+        try:
+            await asyncio.gather(self._pump(reader, upstream_writer, self._uplink, "bytes_up"),
+                                 self._pump(upstream_reader, writer, self._downlink, "bytes_down"),
+                                 return_exceptions=True)
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+            upstream_writer.close()
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, link: _Link, counter: str):
+        loop = asyncio.get_running_loop()
+        pending: asyncio.Queue[tuple[float, bytes | None]] = asyncio.Queue()
+
+        async def deliver():
+            while True:
+                due, data = await pending.get()
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if data is None:
+                    if writer.can_write_eof():
+                        writer.write_eof()
+                    return
+                writer.write(data)
+                await writer.drain()
+
+        delivery = asyncio.create_task(deliver())
+        last_due = 0.0
+        try:
+            # Once the writing end failed there is nobody to deliver to, stop queueing
+            while not delivery.done():
+                data = await reader.read(65536)
+                if not data or delivery.done():
+                    break
+                self.stats[counter] += len(data)
+                lost = link.lost
+                due = link.schedule(len(data), self.timeline.current(), loop.time(), self.random, reliable=True)
+                self.stats["retransmits"] += link.lost - lost
+                # In order, a stalled chunk holds up everything behind it
+                last_due = max(due, last_due)
+                pending.put_nowait((last_due, data))
+            if not delivery.done():
+                pending.put_nowait((last_due, None))
+            # Raises what failed the delivery, if anything
+            await delivery
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            delivery.cancel()
+
+
+class _DatagramReceiver(asyncio.DatagramProtocol):
+    def __init__(self, on_datagram):
+        self.on_datagram = on_datagram
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.on_datagram(data)
+
+
+class UdpImpairmentProxy(_ImpairmentProxy):
+    """Forwards datagrams to `target` one way, e.g. OSC to VRChat: delayed, reordered by jitter, throttled and dropped by the timeline."""
+    def __init__(self, target: tuple[str, int], timeline: ImpairmentTimeline = None, host: str = "127.0.0.1", port: int = 0,
+                 name: str = None, seed: int = None):
+        super().__init__(target, timeline, host, port, name, seed)
+        self._inbound: asyncio.DatagramTransport = None
+        self._outbound: asyncio.DatagramTransport = None
+        # Stats
+        self.stats = {"datagrams": 0, "dropped": 0}
+
+    async def start(self) -> str:
+        loop = asyncio.get_running_loop()
+        self._outbound, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=self.target)
+        self._inbound, _ = await loop.create_datagram_endpoint(lambda: _DatagramReceiver(self._received), local_addr=(self.host, self.port))
+        self.port = self._inbound.get_extra_info("sockname")[1]
+        self._watch_task = asyncio.create_task(self._watch())
+        logger.debug(f"{self.name} listening on {self.address}")
+        return self.address
+
+    async def stop(self):
+        await super().stop()
+        for transport in (self._inbound, self._outbound):
+            if transport:
+                transport.close()
+
+    def _cut(self):
+        # No connections to drop, datagrams are dropped while down in `_received`
+        pass
+
+    def _received(self, data: bytes):
+        loop = asyncio.get_running_loop()
+        impairment = self.timeline.current()
+        self.stats["datagrams"] += 1
+        due = None if impairment.down else self._uplink.schedule(len(data), impairment, loop.time(), self.random, reliable=False)
+        if due is None:
+            self.stats["dropped"] += 1
+            return
+        loop.call_at(due, self._outbound.sendto, data)
@@ -0,0 +1,197 @@
+import queue
+import asyncio
+import logging
+import functools
+import multiprocessing
+from typing import Callable
+
+from core import Setting, ARSWorker, ARSWorkerAsync, CreateAudioSource, InitChildLogger
+from Supervisor import Supervisor
+from SharedAudioRing import SharedAudioRing, RingAudioSource
+from AudioLevel import pcm16_bytes_per_ms
+from Profiler import RuntimeMonitor, SamplingProfiler
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Optional process topology of `main.cmd.py --processes`:
+#   capture process: audio source -> `SharedAudioRing`, nothing else, so it never waits for the GIL of the others
+#   recognition process: ring -> `Supervisor`/worker -> recognition, translation, OSC
+#   parent process: logging, control channel to the setting panel
+# Between the recognition process and the parent only small messages go, through two queues:
+#   parent -> recognition: ("setting", setting json, changed keys), ("profile", seconds, path), ("stop",)
+#   recognition -> parent: what the worker publishes, plus {"type": "health", ...} every second
+
+
+def _capture_main(setting_json: str, ring_name: str, stop: multiprocessing.Event, log_queue: multiprocessing.Queue):
+    InitChildLogger(log_queue)
+    setting = Setting()
+    setting.deserialize(setting_json)
+    ring = SharedAudioRing.attach(ring_name)
+
+    async def run():
+        source = CreateAudioSource(setting)
+        source.start()
+        ring.reset_writer(source.realtime)
+        try:
+            while not stop.is_set():
+                frame = await source.read()
+                if frame is None:
+                    break
+                if source.realtime:
+                    ring.write_or_drop(frame)
+                else:
+                    await ring.write_async(frame)
+        finally:
+            if not stop.is_set():
+                ring.end()
+            source.stop()
+
+    try:
+        asyncio.run(run())
+    finally:
+        ring.close()
+
+
+def _recognition_main(setting_json: str, ring_name: str, inbox: multiprocessing.Queue, outbox: multiprocessing.Queue,
+                      log_queue: multiprocessing.Queue, runtime_monitor: bool = True, health_interval_s: float = 1.0):
+    InitChildLogger(log_queue)
+    setting = Setting()
+    setting.deserialize(setting_json)
+
+    async def run():
+        mic = RingAudioSource(ring_name)
+        mic.start()
+        publish = outbox.put_nowait
+        worker = functools.partial(ARSWorkerAsync if setting.asr_asyncio else ARSWorker, publish=publish)
+        supervisor = Supervisor(setting, worker, mic)
+        supervised = asyncio.create_task(supervisor.run())
+
+        async def receive():
+            while True:
+                try:
+                    message = await asyncio.to_thread(inbox.get, timeout=0.5)
+                except queue.Empty:
+                    continue
+                if message[0] == "stop":
+                    supervised.cancel()
+                    return
+                if message[0] == "profile":
+                    _, seconds, path = message
+                    if not profiler.profile_in_background(seconds, path):
+                        logger.warning("[Profiler] a profile is already being taken")
+                    continue
+                _, new_setting, changed = message
+                setting.deserialize(new_setting)
+                if all(key in Setting.LIVE_KEYS for key in changed):
+                    continue
+                # Audio source changes only restart the capture process, the ring stays
+                if all(key.startswith("audio_source") or key == "micro_device_id" for key in changed):
+                    continue
+                if "asr_asyncio" in changed:
+                    supervisor.worker = functools.partial(ARSWorkerAsync if setting.asr_asyncio else ARSWorker, publish=publish)
+                supervisor.restart()
+
+        async def report_health():
+            while True:
+                await asyncio.sleep(health_interval_s)
+                publish({"type": "health", **supervisor.health(), "ring": mic.ring.get_stats()})
+
+        profiler = SamplingProfiler()
+        tasks = [asyncio.create_task(receive()), asyncio.create_task(report_health())]
+        if runtime_monitor:
+            tasks.append(asyncio.create_task(RuntimeMonitor(publish).run()))
+        try:
+            await supervised
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            mic.close()
+
+    asyncio.run(run())
+
+
+class ProcessPipeline:
+    """
+    Runs in the parent, starts and stops the capture and recognition processes.
+
+    Args:
+        publish: Receives the messages of the recognition process, e.g. `ControlServer.publish`.
+        ring_seconds (float): Audio the ring holds while the recognition process is busy, nothing is dropped below that.
+        runtime_monitor (bool): The recognition process publishes its loop lag and thread CPU, see `Profiler.RuntimeMonitor`.
+    """
+    def __init__(self, setting: Setting, log_queue: multiprocessing.Queue, publish: Callable[[dict], None] = None, ring_seconds: float = 60,
+                 runtime_monitor: bool = True):
+        self.setting = setting
+        self.runtime_monitor = runtime_monitor
+        self.log_queue = log_queue
+        self.publish = publish
+        self.ring = SharedAudioRing.create(ring_seconds)
+        self.health: dict = {}
+        self._capture: multiprocessing.Process = None
+        self._capture_stop: multiprocessing.Event = None
+        self._recognition: multiprocessing.Process = None
+        self._inbox = multiprocessing.Queue()
+        self._outbox = multiprocessing.Queue()
+
+    def _start_capture(self):
+        self._capture_stop = multiprocessing.Event()
+        self._capture = multiprocessing.Process(target=_capture_main, name="capture", daemon=True,
+                                                args=(self.setting.serialize(), self.ring.name, self._capture_stop, self.log_queue))
+        self._capture.start()
+
+    def _stop_capture(self):
+        self._capture_stop.set()
+        self._capture.join(5)
+        if self._capture.is_alive():
+            self._capture.terminate()
+
+    def start(self):
+        self._start_capture()
+        self._recognition = multiprocessing.Process(target=_recognition_main, name="recognition", daemon=True,
+                                                    args=(self.setting.serialize(), self.ring.name, self._inbox, self._outbox, self.log_queue, self.runtime_monitor))
+        self._recognition.start()
+
+    def profile(self, seconds: float, path: str):
+        """Sample the recognition process for `seconds` and write the profile to `path`, see `Profiler.SamplingProfiler`."""
+        self._inbox.put(("profile", seconds, path))
+
+    def apply_setting(self, changed: list[str]) -> bool:
+        """Pass changed settings on, returns whether anything was restarted."""
+        if all(key in Setting.LIVE_KEYS for key in changed):
+            self._inbox.put(("setting", self.setting.serialize(), changed))
+            return False
+        if any(key.startswith("audio_source") or key == "micro_device_id" for key in changed):
+            self._stop_capture()
+            self._start_capture()
+        self._inbox.put(("setting", self.setting.serialize(), changed))
+        return True
+
+    async def run(self):
+        """Forward messages of the recognition process until it exits, e.g. after a file source has ended."""
+        while self._recognition.is_alive():
+            if not self._capture.is_alive() and self._capture.exitcode != 0 and not self.ring.ended:
+                logger.warning(f"Capture process exited with {self._capture.exitcode}, restarting it")
+                await asyncio.sleep(1)
+                self._start_capture()
+            try:
+                message = await asyncio.to_thread(self._outbox.get, timeout=0.5)
+            except queue.Empty:
+                continue
+            if message.get("type") == "health":
+                self.health = {k: v for k, v in message.items() if k != "type"}
+            elif self.publish:
+                self.publish(message)
+
+    def stop(self, timeout: float = 10):
+        self._inbox.put(("stop",))
+        self._recognition.join(timeout)
+        if self._recognition.is_alive():
+            logger.warning("Recognition process did not stop in time")
+            self._recognition.terminate()
+        self._stop_capture()
+        stats = self.ring.get_stats()
+        if stats["dropped_bytes"]:
+            logger.warning(f"Audio ring was full, dropped {stats['dropped_bytes'] / pcm16_bytes_per_ms(16000) / 1000:.1f}s of audio")
+        self.ring.close()
@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Optional, per-thread CPU on Windows and macOS, Linux reads /proc without it
+#   pip install psutil
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Where "subtitles lag" comes from:
+#   `RuntimeMonitor`: always on, how late the asyncio loop wakes up and the CPU each thread used, published as
+#       {"type": "runtime", "loop_lag_ms", "max_loop_lag_ms", "threads": {name: cpu %}}
+#   `SamplingProfiler`: on demand, stacks of every thread sampled for a while, written as a Chrome trace
+#       (chrome://tracing, ui.perfetto.dev, speedscope) or as collapsed stacks for flamegraph.pl
+# The threads to look at: "MainThread" runs the loop (capture of file/udp sources, `ARSWorkerAsync` callbacks),
+# "asyncio_N" the mic reads, "DashscopeReceive" the recognition callbacks of `ARSWorker`, "Translator" translation and OSC.
+
+
+class LoopLagMonitor:
+    """
+    Sleeps `interval_s` on the loop and measures how much later it wakes up,
+    which is how long something blocked the loop or how busy it was.
+    """
+    def __init__(self, interval_s: float = 0.25, warn_ms: float = 200):
+        self.interval_s = interval_s
+        self.warn_ms = warn_ms
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0 # since the last `take_max`
+
+    def take_max(self) -> float:
+        max_lag_ms, self.max_lag_ms = self.max_lag_ms, self.lag_ms
+        return max_lag_ms
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            self.lag_ms = max(0.0, (time.perf_counter() - start - self.interval_s) * 1000)
+            self.max_lag_ms = max(self.max_lag_ms, self.lag_ms)
+            if self.lag_ms > self.warn_ms:
+                logger.warning(f"[Runtime] event loop was blocked for {self.lag_ms:.0f}ms")
+
+
+def _thread_cpu_times() -> dict[int, float] | None:
+    # Native thread id -> user + system seconds, None if not available here
+    if psutil is not None:
+        return {thread.id: thread.user_time + thread.system_time for thread in psutil.Process().threads()}
+    if sys.platform.startswith("linux"):
+        ticks = os.sysconf("SC_CLK_TCK")
+        times = {}
+        for tid in os.listdir("/proc/self/task"):
+            try:
+                with open(f"/proc/self/task/{tid}/stat", "rb") as f:
+                    # Fields after the command name, which may contain spaces: utime and stime are the 12th and 13th
+                    fields = f.read().rsplit(b")", 1)[1].split()
+            except OSError:
+                continue # exited meanwhile
+            times[int(tid)] = (int(fields[11]) + int(fields[12])) / ticks
+        return times
+    return None
+
+
+class ThreadCpuSampler:
+    """CPU % of each thread between two `sample()` calls, 100 is one core. Threads not started by Python are summed as "native"."""
+    def __init__(self):
+        self._last_times: dict[int, float] = {}
+        self._last_process = time.process_time()
+        self._last_at = time.monotonic()
+        self.sample()
+
+    def sample(self) -> dict[str, float]:
+        now = time.monotonic()
+        elapsed = max(now - self._last_at, 1e-6)
+        self._last_at = now
+        times = _thread_cpu_times()
+        if times is None:
+            process = time.process_time()
+            usage = {"process": (process - self._last_process) / elapsed * 100}
+            self._last_process = process
+            return usage
+        names = {thread.native_id: thread.name for thread in threading.enumerate()}
+        usage: dict[str, float] = {}
+        for tid, seconds in times.items():
+            # A thread started since the last sample used all its CPU time since then
+            percent = (seconds - self._last_times.get(tid, 0.0)) / elapsed * 100
+            name = names.get(tid, "native")
+            usage[name] = usage.get(name, 0.0) + percent
+        self._last_times = times
+        return {name: round(percent, 1) for name, percent in usage.items()}
+
+
+class RuntimeMonitor:
+    """
+    Cheap enough to keep running: a few wakeups per second on the loop and a per-thread CPU read every `interval_s`.
+
+    Args:
+        publish: Receives the "runtime" message every `interval_s`, e.g. `ControlServer.publish`.
+    """
+    def __init__(self, publish: Callable[[dict], None] = None, interval_s: float = 5, lag_warn_ms: float = 200):
+        self.publish = publish
+        self.interval_s = interval_s
+        self.lag = LoopLagMonitor(warn_ms=lag_warn_ms)
+        self.cpu = ThreadCpuSampler()
+        self.last: dict = {}
+
+    async def run(self):
+        lag_task = asyncio.create_task(self.lag.run())
+        try:
+            while True:
+                await asyncio.sleep(self.interval_s)
+                self.last = {"loop_lag_ms": round(self.lag.lag_ms, 1), "max_loop_lag_ms": round(self.lag.take_max(), 1),
+                             "threads": self.cpu.sample()}
+                logger.debug(f"[Runtime] {self.last}")
+                if self.publish:
+                    self.publish({"type": "runtime", **self.last})
+        finally:
+            lag_task.cancel()
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads every `interval_ms` from a thread of its own, nothing is instrumented.
+    Costs a few % CPU while running, nothing otherwise.
+    `write(path)`: Chrome trace events for a ".json" path, collapsed stacks ("thread;outer;inner count") otherwise.
+    """
+    def __init__(self, interval_ms: float = 5):
+        self.interval_s = interval_ms / 1000
+        self.samples: list[tuple[float, dict[int, tuple[str, ...]]]] = [] # (seconds since start, thread id -> stack)
+        self.thread_names: dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._started_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.samples.clear()
+        self._stop.clear()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="SamplingProfiler")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        frame_names: dict = {} # code object -> frame name, stacks repeat a lot
+        while not self._stop.wait(self.interval_s):
+            at = time.perf_counter() - self._started_at
+            own = set()
+            for thread in threading.enumerate():
+                self.thread_names.setdefault(thread.ident, thread.name)
+                if thread.name.startswith("SamplingProfiler"):
+                    own.add(thread.ident)
+            stacks = {}
+            for ident, frame in sys._current_frames().items():
+                if ident in own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = frame_names.get(code)
+                    if name is None:
+                        name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                        frame_names[code] = name
+                    stack.append(name)
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[ident] = tuple(stack)
+            self.samples.append((at, stacks))
+
+    def _name(self, ident: int) -> str:
+        return self.thread_names.get(ident, f"thread {ident}")
+
+    def collapsed(self) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for _, stacks in self.samples:
+            for ident, stack in stacks.items():
+                key = ";".join((self._name(ident),) + stack)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def trace_events(self) -> list[dict]:
+        # A frame is open from the first sample it is on the stack until the first one it is not
+        events = [{"name": "thread_name", "ph": "M", "pid": 0, "tid": ident, "args": {"name": self._name(ident)}}
+                  for ident in {ident for _, stacks in self.samples for ident in stacks}]
+        open_stacks: dict[int, tuple[str, ...]] = {}
+        at_us = 0.0
+        for at, stacks in self.samples:
+            at_us = at * 1e6
+            for ident in set(open_stacks) | set(stacks):
+                old, new = open_stacks.get(ident, ()), stacks.get(ident, ())
+                common = 0
+                while common < min(len(old), len(new)) and old[common] == new[common]:
+                    common += 1
+                for name in reversed(old[common:]):
+                    events.append({"name": name, "ph": "E", "pid": 0, "tid": ident, "ts": at_us})
+                for name in new[common:]:
+                    events.append({"name": name, "ph": "B", "pid": 0, "tid": ident, "ts": at_us})
+                open_stacks[ident] = new
+        for ident, stack in open_stacks.items():
+            for name in reversed(stack):
+                events.append({"name": name, "ph": "E", "pid": 0, "tid": ident, "ts": at_us})
+        return events
+
+    def write(self, path: str):
+        if path.endswith(".json"):
+            with open(path, "wt", encoding="utf-8") as f:
+                json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+        else:
+            with open(path, "wt", encoding="utf-8") as f:
+                for key, count in sorted(self.collapsed().items()):
+                    f.write(f"{key} {count}\n")
+
+    def profile_in_background(self, seconds: float, path: str) -> bool:
+        """Sample for `seconds`, then write to `path`. False if a profile is already being taken."""
+        if self.running:
+            return False
+        self.start()
+
+        def finish():
+            self._stop.wait(seconds)
+            self.stop()
+            self.write(path)
+            logger.info(f"[Profiler] {len(self.samples)} samples over {seconds:.0f}s written to {path}")
+        threading.Thread(target=finish, daemon=True, name="SamplingProfilerWriter").start()
+        logger.info(f"[Profiler] sampling all threads for {seconds:.0f}s")
+        return True
+
+
+def profile_path(directory: str, trace_format: str) -> str:
+    os.makedirs(directory or ".", exist_ok=True)
+    return os.path.join(directory, time.strftime("profile-%Y%m%d-%H%M%S") + (".json" if trace_format == "chrome" else ".folded"))
+
+
+def install_profile_signal(on_signal: Callable[[], None]) -> str | None:
+    """Call `on_signal` on SIGUSR1 (`kill -USR1 <pid>`), or Ctrl+Break on Windows. Returns the signal name, None if there is none."""
+    import signal
+    signum = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+    if signum is None:
+        return None
+    signal.signal(signum, lambda *_: on_signal())
+    return signal.Signals(signum).name
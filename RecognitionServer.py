@@ -0,0 +1,384 @@
+import json
+import time
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.connection
+
+import aiohttp
+from aiohttp import web, WSMsgType
+from dashscope.audio.asr import RecognitionResult
+
+from DashscopeAsyncRecognition import DashscopeAsyncRecognition
+from DashscopeConnection import DashscopeConnectionPool
+from DashscopeCustomRecognition import DashscopeCustomRecognitionCallback
+from AudioLevel import pcm16_bytes_per_ms
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+# Recognition sessions for many clients, spread over several API keys
+class SessionPool:
+    def __init__(self, api_keys: list[str], max_sessions_per_key: int = 4, url: str = None,
+                 model: str = 'paraformer-realtime-v1', sample_rate: int = 16000, max_backlog_ms: int = 3000,
+                 keep_connections: bool = True, **kwargs):
+        self.api_keys = api_keys
+        self.max_sessions_per_key = max_sessions_per_key
+        self.url = url
+        self.model = model
+        self.sample_rate = sample_rate
+        self.max_backlog_ms = max_backlog_ms
+        self.kwargs = kwargs
+        self.active: dict[str, int] = {key: 0 for key in api_keys}
+        self._keys: dict[DashscopeAsyncRecognition, str] = {}
+        # Connections of finished sessions are kept for the next client on the same key
+        self.connections: dict[str, DashscopeConnectionPool] = {
+            key: DashscopeConnectionPool(url, key, max_idle=max_sessions_per_key) for key in api_keys
+        } if keep_connections else {}
+
+    @property
+    def capacity(self) -> int:
+        return len(self.api_keys) * self.max_sessions_per_key
+
+    @property
+    def in_use(self) -> int:
+        return sum(self.active.values())
+
+    async def acquire(self) -> DashscopeAsyncRecognition:
+        """Start a session on the least loaded key, None if all keys are saturated."""
+        candidates = [key for key in self.api_keys if self.active[key] < self.max_sessions_per_key]
+        if not candidates:
+            return None
+        key = min(candidates, key=lambda key: self.active[key])
+        self.active[key] += 1
+        recognition = DashscopeAsyncRecognition(
+            model=self.model,
+            format='pcm',
+            sample_rate=self.sample_rate,
+            api_key=key,
+            url=self.url,
+            max_backlog_ms=self.max_backlog_ms,
+            connection_pool=self.connections.get(key, None),
+            **self.kwargs,
+        )
+        try:
+            await recognition.start()
+        except BaseException:
+            self.active[key] -= 1
+            raise
+        self._keys[recognition] = key
+        return recognition
+
+    async def release(self, recognition: DashscopeAsyncRecognition):
+        key = self._keys.pop(recognition, None)
+        if key is None:
+            return
+        self.active[key] -= 1
+        if not recognition.is_stopped():
+            await recognition.stop()
+        else:
+            await recognition.close()
+
+    async def close(self):
+        for pool in self.connections.values():
+            await pool.close()
+
+
+class ClientCallback(DashscopeCustomRecognitionCallback):
+    """Forwards results to a client as json."""
+    def __init__(self, send):
+        self.send = send
+
+    def on_event(self, result: RecognitionResult) -> None:
+        sen = result.get_sentence()
+        # Events without a sentence, e.g. a task-started ack
+        if not sen:
+            return
+        self.send({
+            "type": "final" if result.is_sentence_end(sen) else "partial",
+            "text": sen["text"],
+            "begin_time": sen["begin_time"],
+            "end_time": sen["end_time"],
+        })
+
+    def on_error(self, result: RecognitionResult) -> None:
+        self.send({"type": "error", "code": result.code, "message": result.message})
+
+
+class PoolClient:
+    """One connected client, holding a session from the pool while it streams."""
+    def __init__(self, server: "RecognitionServer", name: str, send):
+        self.server = server
+        self.name = name
+        self.send = send
+        self.recognition: DashscopeAsyncRecognition = None
+        self.dispatcher: asyncio.Task = None
+        self.last_audio_time = time.monotonic()
+        # Pushes of one client run one at a time, in order, or several of them would start over a stopped session at once
+        self._lock = asyncio.Lock()
+        self._closed = False
+
+    async def open(self) -> bool | None:
+        """True once streaming, False if the pool is saturated, None if the session failed to start."""
+        async with self._lock:
+            return await self._open()
+
+    async def _open(self) -> bool | None:
+        try:
+            self.recognition = await self.server.pool.acquire()
+        except Exception as e:
+            # Connect or handshake failure, the client's next audio tries again
+            logger.error(f"Client {self.name} session failed to start: {e}")
+            self.send({"type": "error", "code": "SessionStartFailed", "message": str(e)})
+            return None
+        if self.recognition is None:
+            return False
+        self.dispatcher = asyncio.create_task(self.recognition.dispatch(ClientCallback(self.send)))
+        return True
+
+    async def push(self, pcm: bytes):
+        async with self._lock:
+            if self._closed:
+                return
+            self.last_audio_time = time.monotonic()
+            if self.recognition is None or self.recognition.is_stopped():
+                # Timed out or failed on the ASR side, start over transparently
+                await self._release()
+                opened = await self._open()
+                if opened is False:
+                    self.send({"type": "busy"})
+                if not opened:
+                    return
+            self.recognition.push_audio_frame(pcm)
+
+    async def close(self):
+        async with self._lock:
+            self._closed = True
+            await self._release()
+
+    async def _release(self):
+        if self.recognition is not None:
+            await self.server.pool.release(self.recognition)
+            self.recognition = None
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+            self.dispatcher = None
+
+
+class UdpIngest(asyncio.DatagramProtocol):
+    """Raw PCM datagrams in, json results back to the sender address."""
+    def __init__(self, server: "RecognitionServer"):
+        self.server = server
+        self.transport: asyncio.DatagramTransport = None
+        self.clients: dict[tuple, PoolClient] = {}
+        self.opening: dict[tuple, asyncio.Task] = {}
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        client = self.clients.get(addr)
+        if client is not None:
+            asyncio.create_task(client.push(data))
+        elif addr not in self.opening:
+            # Audio before the session is ready is dropped
+            self.opening[addr] = asyncio.create_task(self._open(addr))
+
+    async def _open(self, addr):
+        send = lambda message: self.transport.sendto(json.dumps(message, ensure_ascii=False).encode("utf-8"), addr)
+        client = PoolClient(self.server, f"udp://{addr[0]}:{addr[1]}", send)
+        try:
+            opened = await client.open()
+            if opened:
+                self.clients[addr] = client
+                logger.info(f"Client {client.name} connected")
+            elif opened is False:
+                self.server.shed += 1
+                send({"type": "busy"})
+        finally:
+            self.opening.pop(addr, None)
+
+    async def reap(self, idle_timeout_s: float):
+        for addr, client in list(self.clients.items()):
+            if time.monotonic() - client.last_audio_time > idle_timeout_s:
+                del self.clients[addr]
+                await client.close()
+                logger.info(f"Client {client.name} idle, released")
+
+
+# Receives pcm from many clients over websocket (binary frames) or UDP (raw datagrams),
+# and sends results back as json: {"type": "partial"|"final", "text", "begin_time", "end_time"},
+# {"type": "error", "code", "message"}, also when a session fails to start, or {"type": "busy"} when the pool is saturated.
+class RecognitionServer:
+    def __init__(self, pool: SessionPool, host: str = "0.0.0.0", port: int = 8765, udp_port: int = None, idle_timeout_s: float = 10):
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.udp_port = udp_port
+        self.idle_timeout_s = idle_timeout_s
+        self.shed = 0
+        self.clients = 0
+        self._runner: web.AppRunner = None
+        self._udp: UdpIngest = None
+        self._reaper: asyncio.Task = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/asr", self._handle_ws)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Recognition server listening on ws://{self.host}:{self.port}/asr, {self.pool.capacity} sessions")
+        if self.udp_port is not None:
+            loop = asyncio.get_running_loop()
+            _, self._udp = await loop.create_datagram_endpoint(lambda: UdpIngest(self), local_addr=(self.host, self.udp_port))
+            logger.info(f"Recognition server listening on udp://{self.host}:{self.udp_port}")
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self):
+        if self._reaper:
+            self._reaper.cancel()
+        if self._udp:
+            for client in self._udp.clients.values():
+                await client.close()
+            self._udp.transport.close()
+        if self._runner:
+            await self._runner.cleanup()
+        await self.pool.close()
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout_s / 2)
+            await self._udp.reap(self.idle_timeout_s)
+
+    async def _handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        outbox: asyncio.Queue = asyncio.Queue()
+        client = PoolClient(self, f"ws://{request.remote}", outbox.put_nowait)
+
+        async def send_worker():
+            # Until None
+            while (message := await outbox.get()) is not None:
+                await ws.send_str(json.dumps(message, ensure_ascii=False))
+        sender = asyncio.create_task(send_worker())
+        try:
+            opened = await client.open()
+            if opened is False:
+                # Saturated: tell the client to come back later
+                self.shed += 1
+                await ws.send_str(json.dumps({"type": "busy"}))
+                await ws.close(code=aiohttp.WSCloseCode.TRY_AGAIN_LATER)
+                return ws
+            if opened is None:
+                # Failed to start, close once the error went out
+                outbox.put_nowait(None)
+                await asyncio.gather(sender, return_exceptions=True)
+                await ws.close(code=aiohttp.WSCloseCode.TRY_AGAIN_LATER)
+                return ws
+            self.clients += 1
+            logger.info(f"Client {client.name} connected")
+            async for msg in ws:
+                if msg.type == WSMsgType.BINARY:
+                    await client.push(msg.data)
+        finally:
+            await client.close()
+            sender.cancel()
+        return ws
+
+
+# ==================
+# Load test
+# Simulated clients and the fake ASR server run in a child process,
+# so the CPU time of this process is the cost of the recognition server alone.
+def _load_generator(conn: multiprocessing.connection.Connection, sample_rate: int):
+    from FakeDashscopeServer import FakeDashscopeServer
+
+    async def simulated_client(url: str, seconds: float, stats: dict):
+        frame_ms = 100
+        frame = bytes(int(pcm16_bytes_per_ms(sample_rate) * frame_ms))
+        sent_at: dict[int, float] = {} # audio ms -> time sent
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(url) as ws:
+                async def receive():
+                    async for msg in ws:
+                        if msg.type != WSMsgType.TEXT:
+                            break
+                        message = json.loads(msg.data)
+                        if message["type"] == "busy":
+                            stats["shed"] += 1
+                            return
+                        stats["results"] += 1
+                        if message["type"] == "final":
+                            sent = sent_at.get(message["end_time"] // frame_ms * frame_ms)
+                            if sent is not None:
+                                stats["latencies"].append(time.perf_counter() - sent)
+                receiver = asyncio.create_task(receive())
+                start = time.perf_counter()
+                audio_ms = 0
+                while time.perf_counter() - start < seconds and not receiver.done():
+                    await ws.send_bytes(frame)
+                    audio_ms += frame_ms
+                    sent_at[audio_ms] = time.perf_counter()
+                    await asyncio.sleep(max(0, start + audio_ms / 1000 - time.perf_counter()))
+                if not receiver.done():
+                    stats["served"] += 1
+                receiver.cancel()
+
+    async def main():
+        fake = FakeDashscopeServer(sample_rate=sample_rate)
+        conn.send(await fake.start())
+        loop = asyncio.get_running_loop()
+        while True:
+            command = await loop.run_in_executor(None, conn.recv)
+            if command is None:
+                break
+            url, clients, seconds = command
+            stats = {"served": 0, "shed": 0, "results": 0, "latencies": []}
+            await asyncio.gather(*[simulated_client(url, seconds, stats) for _ in range(clients)], return_exceptions=True)
+            conn.send(stats)
+        await fake.stop()
+
+    asyncio.run(main())
+
+
+async def load_test(steps: list[int], seconds: float = 20, api_keys: list[str] = None, max_sessions_per_key: int = 1000, fast_events: bool = False) -> list[dict]:
+    """Ramp simulated clients step by step, reports server CPU usage and sessions per core."""
+    sample_rate = 16000
+    conn, child_conn = multiprocessing.Pipe()
+    generator = multiprocessing.Process(target=_load_generator, args=(child_conn, sample_rate), daemon=True)
+    generator.start()
+    loop = asyncio.get_running_loop()
+    fake_url = await loop.run_in_executor(None, conn.recv)
+
+    pool = SessionPool(api_keys or ["load-test"], max_sessions_per_key, url=fake_url, sample_rate=sample_rate, fast_events=fast_events)
+    server = RecognitionServer(pool, host="127.0.0.1", port=0)
+    await server.start()
+    reports = []
+    try:
+        for clients in steps:
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            conn.send((f"ws://127.0.0.1:{server.port}/asr", clients, seconds))
+            stats = await loop.run_in_executor(None, conn.recv)
+            cpu = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+            latencies = sorted(stats["latencies"])
+            report = {
+                "clients": clients,
+                "served": stats["served"],
+                "shed": stats["shed"],
+                "results": stats["results"],
+                "cpu_cores_used": cpu,
+                "sessions_per_core": stats["served"] / cpu if cpu > 0 else float("inf"),
+                "final_latency_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+                "final_latency_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else None,
+            }
+            logger.info(f"[LoadTest] {report}")
+            reports.append(report)
+    finally:
+        conn.send(None)
+        generator.join(10)
+        await server.stop()
+    return reports
@@ -0,0 +1,157 @@
+import struct
+import asyncio
+import logging
+from multiprocessing import shared_memory
+
+from AudioSource import AudioSource
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Single producer, single consumer pcm ring in shared memory, between the capture process and the recognition process
+# Header: total bytes written, total bytes read, bytes dropped because the ring was full, ended, realtime
+# Each side only ever writes its own counter, so no lock is needed.
+_HEADER = struct.Struct("<QQQBB")
+_HEADER_SIZE = 64
+_WRITTEN, _READ, _DROPPED, _ENDED, _REALTIME = 0, 8, 16, 24, 25
+
+
+class SharedAudioRing:
+    """
+    `create()` in the parent, `attach(name)` in the children.
+    The writer never blocks the capture: a frame that does not fit is dropped and counted,
+    unless the source is not realtime, then `write_async` waits for room.
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.capacity = shm.size - _HEADER_SIZE
+        self._buf = shm.buf
+
+    @staticmethod
+    def create(seconds: float = 60, sample_rate: int = 16000) -> "SharedAudioRing":
+        capacity = int(seconds * sample_rate) * 2
+        shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + capacity)
+        shm.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+        return SharedAudioRing(shm, owner=True)
+
+    @staticmethod
+    def attach(name: str) -> "SharedAudioRing":
+        return SharedAudioRing(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def _get(self, offset: int) -> int:
+        return struct.unpack_from("<Q", self._buf, offset)[0]
+
+    def _set(self, offset: int, value: int):
+        struct.pack_into("<Q", self._buf, offset, value)
+
+    @property
+    def ended(self) -> bool:
+        return self._buf[_ENDED] != 0
+
+    @property
+    def realtime(self) -> bool:
+        return self._buf[_REALTIME] != 0
+
+    def available(self) -> int:
+        return self._get(_WRITTEN) - self._get(_READ)
+
+    def get_stats(self) -> dict:
+        written, read, dropped, _, _ = _HEADER.unpack_from(self._buf, 0)
+        return {"written_bytes": written, "backlog_bytes": written - read, "dropped_bytes": dropped, "capacity_bytes": self.capacity}
+
+    # ========
+    # Writer
+
+    def reset_writer(self, realtime: bool):
+        """A new capture source starts writing, e.g. after the capture process was restarted."""
+        self._buf[_ENDED] = 0
+        self._buf[_REALTIME] = 1 if realtime else 0
+
+    def write(self, frame) -> bool:
+        """False if the ring is full, the frame is not written then."""
+        size = len(frame)
+        written = self._get(_WRITTEN)
+        if size > self.capacity - (written - self._get(_READ)):
+            return False
+        start = _HEADER_SIZE + written % self.capacity
+        first = min(size, _HEADER_SIZE + self.capacity - start)
+        self._buf[start:start + first] = frame[:first]
+        if first < size:
+            self._buf[_HEADER_SIZE:_HEADER_SIZE + size - first] = frame[first:]
+        # Published only after the data is in place
+        self._set(_WRITTEN, written + size)
+        return True
+
+    def write_or_drop(self, frame):
+        if not self.write(frame):
+            self._set(_DROPPED, self._get(_DROPPED) + len(frame))
+
+    async def write_async(self, frame, poll_s: float = 0.005):
+        while not self.write(frame):
+            await asyncio.sleep(poll_s)
+
+    def end(self):
+        self._buf[_ENDED] = 1
+
+    # ========
+    # Reader
+
+    def read(self, size: int, partial: bool = False) -> bytes | None:
+        """`size` bytes, None if not that many are written yet. With `partial`, whatever there is up to `size`."""
+        read = self._get(_READ)
+        available = self._get(_WRITTEN) - read
+        if available < size:
+            if not partial or available == 0:
+                return None
+            size = available
+        start = _HEADER_SIZE + read % self.capacity
+        first = min(size, _HEADER_SIZE + self.capacity - start)
+        frame = bytes(self._buf[start:start + first])
+        if first < size:
+            frame += bytes(self._buf[_HEADER_SIZE:_HEADER_SIZE + size - first])
+        self._set(_READ, read + size)
+        return frame
+
+    def close(self):
+        self._buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingAudioSource(AudioSource):
+    """Reads what the capture process writes into a `SharedAudioRing`, in the recognition process."""
+    def __init__(self, ring_name: str, poll_s: float = 0.01, **kwargs):
+        super().__init__(**kwargs)
+        self.ring_name = ring_name
+        self.poll_s = poll_s
+        self.ring: SharedAudioRing = None
+
+    def start(self):
+        if self.ring is None:
+            self.ring = SharedAudioRing.attach(self.ring_name)
+
+    def stop(self):
+        # Stays attached, a restarted worker carries on where the last one stopped
+        pass
+
+    def close(self):
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+
+    async def read(self) -> bytes | None:
+        while True:
+            ended = self.ring.ended
+            frame = self.ring.read(self.frame_bytes, partial=ended)
+            self.realtime = self.ring.realtime
+            if frame is not None:
+                return frame
+            if ended:
+                self.ended = True
+                return None
+            await asyncio.sleep(self.poll_s)
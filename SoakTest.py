@@ -0,0 +1,253 @@
+import gc
+import os
+import sys
+import math
+import time
+import array
+import asyncio
+import logging
+import tempfile
+import threading
+import functools
+
+import dashscope
+
+from core import Setting, ARSWorker, ARSWorkerAsync, VRChatOscCallback
+from Supervisor import Supervisor
+from FakeDashscopeServer import FakeDashscopeServer
+from FakeAlimtServer import FakeAlimtServer
+from CaptureReplay import SimulatedClock, OscCollector
+from NetworkImpairment import ImpairmentTimeline, TcpImpairmentProxy, UdpImpairmentProxy
+from DashscopeCustomRecognition import DashscopeCustomRecognition
+from DashscopeAsyncRecognition import DashscopeAsyncRecognition
+from DashscopeConnection import DashscopeConnectionPool
+from AudioBacklog import AudioBacklog
+from AudioSource import AudioSource
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Instances of these should not pile up across restarts
+TRACKED_CLASSES = {
+    "VRChatOscCallback": VRChatOscCallback,
+    "DashscopeCustomRecognition": DashscopeCustomRecognition,
+    "DashscopeAsyncRecognition": DashscopeAsyncRecognition,
+    "AudioBacklog": AudioBacklog,
+}
+
+# metric: allowed growth over the run (after warm-up), "rss_mb" is per simulated hour
+DEFAULT_LIMITS = {
+    "rss_mb": 8,
+    "threads": 2,
+    "fds": 4,
+    "translate_queue": 5,
+    "backlog_frames": 20,
+    **{name: 2 for name in TRACKED_CLASSES},
+}
+
+
+class SimulatedMic(AudioSource):
+    """Stands in for `MicCollector`: 1.5s tone, 1s silence, paced by `clock`."""
+    def __init__(self, clock: SimulatedClock, sample_rate: int = 16000, frame_ms: int = 200):
+        super().__init__(sample_rate, frame_ms)
+        self.clock = clock
+        samples = sample_rate * frame_ms // 1000
+        self.tone = array.array('h', [int(4000 * math.sin(2 * math.pi * 220 * i / sample_rate)) for i in range(samples)]).tobytes()
+        self.silence = bytes(samples * 2)
+        self.audio_s = 0.0
+
+    async def read(self) -> bytes:
+        await self.clock.sleep_until(self.audio_s)
+        frame = self.tone if self.audio_s % 2.5 < 1.5 else self.silence
+        self.audio_s += self.frame_ms / 1000
+        return frame
+
+
+def read_rss_mb() -> float:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # peak only
+
+
+def count_fds() -> int:
+    try:
+        import psutil
+        process = psutil.Process()
+        return process.num_handles() if sys.platform == "win32" else process.num_fds()
+    except ImportError:
+        pass
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def slope(xs: list[float], ys: list[float]) -> float:
+    # Least squares
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var if var else 0
+
+
+class SoakTest:
+    """
+    Runs the real worker under `Supervisor` for `hours` of simulated audio, `speed` times faster than real time,
+    against `FakeDashscopeServer` and a `FakeAlimtServer` failing `translator_failure_rate` of requests.
+    The worker is restarted every `reconnect_every_s` simulated seconds.
+    With `impairment`, the ASR, MT and OSC traffic goes through proxies following it, its times in simulated seconds.
+    """
+    def __init__(self, hours: float = 1, speed: float = 30, reconnect_every_s: float = 300, translator_failure_rate: float = 0.1,
+                 asyncio_worker: bool = False, sample_interval_s: float = 2, warm_up: float = 0.2, limits: dict = None,
+                 impairment: ImpairmentTimeline = None):
+        self.hours = hours
+        self.speed = speed
+        self.reconnect_every_s = reconnect_every_s
+        self.translator_failure_rate = translator_failure_rate
+        self.asyncio_worker = asyncio_worker
+        self.sample_interval_s = sample_interval_s
+        self.warm_up = warm_up
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.impairment = impairment
+        self.samples: list[dict] = []
+        self.pipeline: dict = {}
+
+    def _publish(self, message: dict):
+        if message["type"] == "pipeline":
+            self.pipeline = message
+
+    def _sample(self, audio_s: float, restarts: int, osc_messages: int) -> dict:
+        gc.collect()
+        sample = {
+            "audio_h": audio_s / 3600,
+            "rss_mb": read_rss_mb(),
+            "threads": threading.active_count(),
+            "fds": count_fds(),
+            "backlog_frames": self.pipeline.get("backlog_frames", 0),
+            "restarts": restarts,
+            "osc_messages": osc_messages,
+        }
+        counts = {name: 0 for name in TRACKED_CLASSES}
+        translate_queue = 0
+        for obj in gc.get_objects():
+            for name, cls in TRACKED_CLASSES.items():
+                if isinstance(obj, cls):
+                    counts[name] += 1
+            if isinstance(obj, VRChatOscCallback) and obj.pending_texts is not None:
+                translate_queue += obj.pending_texts.qsize()
+        sample.update(counts)
+        sample["translate_queue"] = translate_queue
+        return sample
+
+    async def run(self) -> dict:
+        asr_server = FakeDashscopeServer(latency_ms=50, speed=self.speed)
+        dashscope.base_websocket_api_url = asr_server.start_in_thread()
+        mt_server = FakeAlimtServer(latency_ms=30, failure_rate=self.translator_failure_rate)
+        mt_endpoint = mt_server.start_in_thread()
+
+        clock = SimulatedClock(self.speed)
+        loop = asyncio.get_running_loop()
+        transport, collector = await loop.create_datagram_endpoint(lambda: OscCollector(clock), local_addr=("127.0.0.1", 0))
+        work_dir = tempfile.mkdtemp(prefix="vrcpasr-soak-")
+
+        osc_port = transport.get_extra_info("sockname")[1]
+        proxies: dict[str, TcpImpairmentProxy | UdpImpairmentProxy] = {}
+        if self.impairment:
+            self.impairment.speed = self.speed
+            proxies["asr"] = TcpImpairmentProxy(("127.0.0.1", asr_server.port), self.impairment, name="asr")
+            proxies["mt"] = TcpImpairmentProxy(("127.0.0.1", mt_server.port), self.impairment, name="mt")
+            proxies["osc"] = UdpImpairmentProxy(("127.0.0.1", osc_port), self.impairment, name="osc")
+            for proxy in proxies.values():
+                proxy.start_in_thread()
+            dashscope.base_websocket_api_url = proxies["asr"].rewrite(dashscope.base_websocket_api_url)
+            mt_endpoint = proxies["mt"].rewrite(mt_endpoint)
+            osc_port = proxies["osc"].port
+
+        setting = Setting()
+        setting.vrchat_ip = "127.0.0.1"
+        setting.vrchat_port = osc_port
+        setting.api_key = "soak"
+        setting.enable_translate = True
+        setting.alicloud_access_key_id = "soak"
+        setting.alicloud_access_key_secret = "soak"
+        setting.alicloud_endpoint = mt_endpoint
+        setting.extra_dst_langs = ["en"]
+        setting.local_endpointing = True
+        setting.usage_db = os.path.join(work_dir, "usage.sqlite3")
+
+        mic = SimulatedMic(clock)
+        worker = functools.partial(ARSWorkerAsync if self.asyncio_worker else ARSWorker, publish=self._publish)
+        supervisor = Supervisor(setting, worker, mic, base_delay_s=0.1)
+        clock.start()
+        if self.impairment:
+            self.impairment.start()
+        supervised = asyncio.create_task(supervisor.run())
+        next_restart = self.reconnect_every_s
+        next_sample = 0
+        try:
+            while mic.audio_s < self.hours * 3600:
+                await asyncio.sleep(0.05)
+                if supervised.done():
+                    supervised.result()
+                if mic.audio_s >= next_restart:
+                    supervisor.restart()
+                    next_restart += self.reconnect_every_s
+                if time.perf_counter() >= next_sample:
+                    sample = self._sample(mic.audio_s, supervisor.restarts, len(collector.messages))
+                    self.samples.append(sample)
+                    logger.info(f"[Soak] {sample}")
+                    next_sample = time.perf_counter() + self.sample_interval_s
+        finally:
+            supervised.cancel()
+            await asyncio.gather(supervised, return_exceptions=True)
+            transport.close()
+            await DashscopeConnectionPool.close_shared()
+            for proxy in proxies.values():
+                proxy.stop_in_thread()
+            asr_server.stop_in_thread()
+            mt_server.stop_in_thread()
+        return self.report(mt_server.requests, mt_server.failures, {name: proxy.stats for name, proxy in proxies.items()})
+
+    def report(self, mt_requests: int = 0, mt_failures: int = 0, impairment: dict = None) -> dict:
+        """Growth of every metric after warm-up, and whether it stays within `limits`."""
+        samples = self.samples[int(len(self.samples) * self.warm_up):]
+        if len(samples) < 3:
+            raise RuntimeError("Too few samples, run longer or sample more often")
+        hours = [s["audio_h"] for s in samples]
+        span_h = hours[-1] - hours[0]
+        trends = {}
+        for metric, limit in self.limits.items():
+            values = [s[metric] for s in samples]
+            growth = slope(hours, values) * (1 if metric == "rss_mb" else span_h)
+            trends[metric] = {
+                "first": values[0],
+                "last": values[-1],
+                "max": max(values),
+                "growth": growth, # per simulated hour for rss_mb, over the run otherwise
+                "limit": limit,
+                "ok": growth <= limit,
+            }
+        return {
+            "simulated_hours": self.samples[-1]["audio_h"],
+            "restarts": self.samples[-1]["restarts"],
+            "osc_messages": self.samples[-1]["osc_messages"],
+            "mt_requests": mt_requests,
+            "mt_failures": mt_failures,
+            **({"impairment": impairment} if impairment else {}),
+            "trends": trends,
+            "ok": all(trend["ok"] for trend in trends.values()),
+        }
+
+    def write_csv(self, path: str):
+        with open(path, "wt") as f:
+            keys = list(self.samples[0].keys())
+            f.write(",".join(keys) + "\n")
+            for sample in self.samples:
+                f.write(",".join(str(sample[key]) for key in keys) + "\n")
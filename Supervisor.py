@@ -0,0 +1,184 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+from dashscope.audio.asr import RecognitionResult
+from dashscope.common.error import RequestFailure
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+class FailureKind:
+    TRANSIENT = 'transient' # network, server hiccup: retry soon
+    AUTH = 'auth' # bad or revoked API key: retrying does not help until the setting changes
+    QUOTA = 'quota' # throttled, quota exhausted or overdue payment: retry much later
+
+
+class HealthState:
+    STARTING = 'starting'
+    HEALTHY = 'healthy'
+    BACKING_OFF = 'backing_off'
+    CIRCUIT_OPEN = 'circuit_open'
+
+
+AUTH_CODES = {"InvalidApiKey", "AccessDenied", "Unauthorized", "Forbidden"}
+QUOTA_CODES = {"Throttling", "Throttling.RateQuota", "Throttling.AllocationQuota", "Arrearage", "QuotaExhausted"}
+
+
+def classify_failure(status_code: int = None, code: str = None, message: str = None) -> str:
+    code = code or ""
+    message = (message or "").lower()
+    if status_code in (401, 403) or code in AUTH_CODES or "api key" in message or "apikey" in message:
+        return FailureKind.AUTH
+    if status_code == 429 or code in QUOTA_CODES or code.startswith("Throttling") or "quota" in message or "arrearage" in message:
+        return FailureKind.QUOTA
+    return FailureKind.TRANSIENT
+
+
+def classify_exception(e: BaseException) -> str:
+    if isinstance(e, RequestFailure):
+        return classify_failure(e.http_code, e.name, e.message)
+    if isinstance(e, aiohttp.WSServerHandshakeError):
+        return classify_failure(e.status, None, e.message)
+    return classify_failure(None, type(e).__name__, str(e))
+
+
+# Restarts a recognition worker forever, without hammering the server when it keeps failing
+class Supervisor:
+    """
+    `worker(setting, mic)` runs one recognition session and returns the `RecognitionResult` of the error that ended it,
+    or None if it ended normally (e.g. the server timed out on silence). Exceptions are failures too.
+    `run` returns once `mic.ended`, e.g. at the end of a file.
+
+    Args:
+        base_delay_s, max_delay_s: Exponential backoff between failed restarts, with jitter.
+        failure_threshold (int): Consecutive transient failures opening the circuit, auth and quota failures open it at once.
+        open_s (dict): How long the circuit stays open per `FailureKind`, doubled each time the trial restart fails.
+        healthy_after_s (float): A worker running this long resets the failure count.
+    """
+    def __init__(self, setting: Any, worker: Callable[..., Awaitable[RecognitionResult]], mic: Any,
+                 base_delay_s: float = 1, max_delay_s: float = 60, failure_threshold: int = 5,
+                 open_s: dict[str, float] = None, max_open_s: float = 3600, healthy_after_s: float = 30):
+        self.setting = setting
+        self.worker = worker
+        self.mic = mic
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self.failure_threshold = failure_threshold
+        self.open_s = open_s or {FailureKind.TRANSIENT: 120, FailureKind.AUTH: 300, FailureKind.QUOTA: 900}
+        self.max_open_s = max_open_s
+        self.healthy_after_s = healthy_after_s
+        # Health
+        self.state = HealthState.STARTING
+        self.consecutive_failures = 0
+        self.circuit_opened = 0 # times opened since the last healthy run
+        self.last_failure_kind: str = None
+        self.last_error: str = None
+        self.retry_at: float = None # monotonic
+        self.restarts = 0
+        self._reset = asyncio.Event()
+        self._worker_task: asyncio.Task = None
+
+    def health(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "last_failure_kind": self.last_failure_kind,
+            "last_error": self.last_error,
+            "retry_in_s": max(0, self.retry_at - time.monotonic()) if self.retry_at else 0,
+            "restarts": self.restarts,
+        }
+
+    def reset(self):
+        """Retry now, e.g. after the API key was changed."""
+        self.consecutive_failures = 0
+        self.circuit_opened = 0
+        self._reset.set()
+
+    def restart(self):
+        """Stop the running worker and start a new one now, e.g. after a setting changed."""
+        self.reset()
+        if self._worker_task and not self._worker_task.done():
+            self._worker_task.cancel()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            logger.info(f"[Supervisor] {self.health()}")
+
+    def _backoff_s(self) -> float:
+        delay = min(self.max_delay_s, self.base_delay_s * 2 ** (self.consecutive_failures - 1))
+        # Equal jitter: never retry immediately, and spread clients restarting together
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _open_circuit_s(self, kind: str) -> float:
+        return min(self.max_open_s, self.open_s[kind] * 2 ** (self.circuit_opened - 1))
+
+    async def _wait(self, seconds: float):
+        # Keep reading the mic so the device stays open and does not overflow, recovery is then instant
+        self.retry_at = time.monotonic() + seconds
+        self._reset.clear()
+        try:
+            while time.monotonic() < self.retry_at and not self._reset.is_set() and not self.mic.ended:
+                await self.mic.read()
+        finally:
+            self.retry_at = None
+
+    def _healthy(self):
+        self.consecutive_failures = 0
+        self.circuit_opened = 0
+        self._set_state(HealthState.HEALTHY)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = time.monotonic()
+            self.restarts += 1
+            healthy_timer = loop.call_later(self.healthy_after_s, self._healthy)
+            self._worker_task = asyncio.create_task(self.worker(self.setting, self.mic))
+            try:
+                await asyncio.wait({self._worker_task})
+            except asyncio.CancelledError:
+                # The supervisor itself is cancelled, even if a restart was requested
+                self._worker_task.cancel()
+                healthy_timer.cancel()
+                raise
+            healthy_timer.cancel()
+            if self._worker_task.cancelled():
+                # Restart requested
+                continue
+            if self.mic.ended:
+                logger.info("[Supervisor] audio source ended")
+                return
+            try:
+                error = self._worker_task.result()
+                kind = classify_failure(error.status_code, error.code, error.message) if error else None
+                self.last_error = f"{error.code}: {error.message}" if error else None
+            except Exception as e:
+                kind = classify_exception(e)
+                self.last_error = f"{type(e).__name__}: {e}"
+            ran_s = time.monotonic() - started
+
+            if kind is None and ran_s >= self.base_delay_s:
+                # Normal end, restart at once
+                continue
+            # Ending normally right after start is treated as a transient failure, so it cannot spin
+            kind = kind or FailureKind.TRANSIENT
+            self.last_failure_kind = kind
+            self.consecutive_failures += 1
+
+            if kind != FailureKind.TRANSIENT or self.consecutive_failures >= self.failure_threshold:
+                self.circuit_opened += 1
+                wait_s = self._open_circuit_s(kind)
+                self.retry_at = time.monotonic() + wait_s
+                self._set_state(HealthState.CIRCUIT_OPEN)
+                logger.error(f"[Supervisor] {kind} failure ({self.last_error}), circuit open for {wait_s:.0f}s")
+            else:
+                wait_s = self._backoff_s()
+                self.retry_at = time.monotonic() + wait_s
+                self._set_state(HealthState.BACKING_OFF)
+                logger.warning(f"[Supervisor] {kind} failure ({self.last_error}), retry in {wait_s:.1f}s")
+            await self._wait(wait_s)
@@ -0,0 +1,308 @@
+import re
+import time
+import heapq
+import atexit
+import logging
+import sqlite3
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import List
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Recognition of the same phrase differs a little every time: punctuation, a filler, one character.
+# Past translations are looked up by similarity of the normalized source text instead of equality,
+# candidates come from an index of character bigrams and are checked for characters left out or added.
+
+# Interjections dropped before comparing, not words that may carry meaning
+FILLERS = ("嗯", "啊", "呃", "唔", "噢", "哦", "えっと", "えー", "あのー")
+# Latin ones only as whole words, not inside "umbrella" or "hurry"
+LATIN_FILLERS = re.compile(r"\b(?:um+|uh+|erm)\b")
+# A sentence with one of these more or less says the opposite, however close the rest is
+NEGATIONS = "不没别未非无"
+# Likewise a question or suggestion is not the statement: "你会来吗" and "你会来?" are not "你会来"
+FINAL_PARTICLES = "吗呢吧か"
+# Ends in a question mark, maybe followed by more punctuation, NFKC has made "？" a "?"
+_QUESTION = re.compile(r"\?[\W_]*$")
+# Of the `normalize` below, older entries are dropped
+_NORMALIZE_VERSION = 1
+
+
+def normalize(text: str) -> str:
+    """Without punctuation, spaces and fillers, but a question keeps its "?" at the end."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = LATIN_FILLERS.sub("", text)
+    for filler in FILLERS:
+        text = text.replace(filler, "")
+    question = _QUESTION.search(text) is not None
+    # Punctuation, symbols and spaces
+    text = "".join(c for c in text if unicodedata.category(c)[0] not in "PZS")
+    return text + "?" if text and question else text
+
+
+def _bigrams(text: str) -> set[str]:
+    # A one character text is its own gram
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def _digits(text: str) -> str:
+    return "".join(c for c in text if c.isdigit())
+
+
+def _negations(text: str) -> str:
+    return "".join(c for c in text if c in NEGATIONS)
+
+
+def _sentence_end(normalized: str) -> str:
+    # The "?" kept by `normalize` and a final particle before it
+    question = "?" if normalized.endswith("?") else ""
+    last = normalized[-2 if question else -1:][:1]
+    return (last if last and last in FINAL_PARTICLES else "") + question
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Length of the shorter / length of the longer one, if the longer is the shorter with characters added, else 0.
+    A replaced character (今天/昨天, 你/我) is usually a different sentence, so only insertions and deletions count.
+    """
+    if a == b:
+        return 1.0
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return 0.0
+    rest = iter(b)
+    if not all(c in rest for c in a):
+        return 0.0
+    return len(a) / len(b)
+
+
+@dataclass
+class _Entry:
+    src_lang: str
+    dst_lang: str
+    normalized: str
+    translation: str
+    last_used: float
+
+
+_shared_memories: dict[str, "TranslationMemory"] = {}
+_shared_memories_lock = threading.Lock()
+
+
+class TranslationMemory:
+    """
+    (source, translation) pairs per language pair, in sqlite and indexed in memory.
+
+    Args:
+        path (str): The sqlite file, kept across sessions.
+        threshold (float): Least `similarity` of the normalized texts to reuse a translation. At 0.85 a sentence needs
+            7 characters before one may be added or left out, shorter ones have to match exactly. A replaced character,
+            a number, a negation, a question mark or a final particle never matches.
+        max_entries (int): The least recently used are forgotten beyond this many.
+    """
+    def __init__(self, path: str = "translation_memory.sqlite3", threshold: float = 0.85, max_entries: int = 20000, candidates: int = 8):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.candidates = candidates
+        self._lock = threading.Lock()
+        self._entries: dict[int, _Entry] = {}
+        # (src_lang, dst_lang) -> normalized -> id, and -> bigram -> ids
+        self._exact: dict[tuple[str, str], dict[str, int]] = {}
+        self._grams: dict[tuple[str, str], dict[str, set[int]]] = {}
+        self._used: set[int] = set() # hits not written yet
+        # Stats
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS memory ("
+            "src_lang TEXT, dst_lang TEXT, normalized TEXT, source TEXT, translation TEXT, last_used REAL, "
+            "PRIMARY KEY (src_lang, dst_lang, normalized))"
+        )
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < _NORMALIZE_VERSION:
+            # Normalized differently, e.g. a question without its "?" would be taken for the statement
+            self._db.execute("DELETE FROM memory")
+            self._db.execute(f"PRAGMA user_version = {_NORMALIZE_VERSION}")
+        self._db.commit()
+        for rowid, src_lang, dst_lang, normalized, translation, last_used in self._db.execute(
+                "SELECT rowid, src_lang, dst_lang, normalized, translation, last_used FROM memory"):
+            self._index(rowid, _Entry(src_lang, dst_lang, normalized, translation, last_used))
+        self._evict()
+
+    @staticmethod
+    def get_shared(path: str, threshold: float = 0.85, max_entries: int = 20000) -> "TranslationMemory":
+        """Loaded once, kept across `ARSWorker` restarts, written out at exit."""
+        with _shared_memories_lock:
+            memory = _shared_memories.get(path, None)
+            if memory is None:
+                memory = TranslationMemory(path, threshold, max_entries)
+                atexit.register(memory.close)
+                _shared_memories[path] = memory
+            memory.threshold = threshold
+            memory.max_entries = max_entries
+        return memory
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _index(self, rowid: int, entry: _Entry):
+        key = (entry.src_lang, entry.dst_lang)
+        self._entries[rowid] = entry
+        self._exact.setdefault(key, {})[entry.normalized] = rowid
+        grams = self._grams.setdefault(key, {})
+        for gram in _bigrams(entry.normalized):
+            grams.setdefault(gram, set()).add(rowid)
+
+    def _unindex(self, rowid: int):
+        entry = self._entries.pop(rowid)
+        key = (entry.src_lang, entry.dst_lang)
+        del self._exact[key][entry.normalized]
+        grams = self._grams[key]
+        for gram in _bigrams(entry.normalized):
+            grams[gram].discard(rowid)
+            if not grams[gram]:
+                del grams[gram]
+        self._used.discard(rowid)
+
+    def lookup(self, src_lang: str, dst_lang: str, text: str) -> tuple[str, float] | None:
+        """(translation, similarity) of the closest remembered text, None if none passes `threshold`."""
+        normalized = normalize(text)
+        if not normalized:
+            return None
+        key = (src_lang, dst_lang)
+        with self._lock:
+            rowid = self._exact.get(key, {}).get(normalized)
+            score = 1.0
+            if rowid is None:
+                rowid, score = self._closest(key, normalized)
+            if rowid is None:
+                self.misses += 1
+                return None
+            entry = self._entries[rowid]
+            entry.last_used = time.time()
+            self._used.add(rowid)
+            self.hits += 1
+            if score < 1.0:
+                self.fuzzy_hits += 1
+        return entry.translation, score
+
+    def _closest(self, key: tuple[str, str], normalized: str) -> tuple[int | None, float]:
+        # Under `_lock`. The entries sharing the most bigrams, checked by `similarity`
+        grams = self._grams.get(key)
+        if not grams:
+            return None, 0.0
+        # Lengths further apart than this cannot pass the threshold
+        max_length_diff = (1 - self.threshold) * len(normalized) / self.threshold
+        query_grams = _bigrams(normalized)
+        shared: dict[int, int] = {}
+        for gram in query_grams:
+            for rowid in grams.get(gram, ()):
+                shared[rowid] = shared.get(rowid, 0) + 1
+        # An added or left out character changes at most two bigrams, sharing fewer than this cannot pass the threshold
+        length = len(normalized)
+        min_shared = len(query_grams) - 2 * int((1 - self.threshold) * (length + max_length_diff))
+        # Filtered first, so longer sentences containing this one do not crowd out the near duplicates
+        in_reach = (rowid for rowid, count in shared.items()
+                    if count >= min_shared and abs(len(self._entries[rowid].normalized) - length) <= max_length_diff)
+        # A different number, negation or kind of sentence is a different sentence, however close the rest is
+        digits = _digits(normalized)
+        negations = _negations(normalized)
+        sentence_end = _sentence_end(normalized)
+        best, best_score = None, self.threshold
+        for rowid in heapq.nlargest(self.candidates, in_reach, key=shared.get):
+            candidate = self._entries[rowid].normalized
+            if _digits(candidate) != digits or _negations(candidate) != negations or _sentence_end(candidate) != sentence_end:
+                continue
+            score = similarity(normalized, candidate)
+            if score >= best_score:
+                best, best_score = rowid, score
+        return best, best_score
+
+    def add(self, src_lang: str, dst_lang: str, text: str, translation: str):
+        normalized = normalize(text)
+        if not normalized or not translation:
+            return
+        now = time.time()
+        with self._lock:
+            if self._db is None:
+                return
+            rowid = self._exact.get((src_lang, dst_lang), {}).get(normalized)
+            if rowid is not None:
+                # The latest translation of the same text wins
+                self._entries[rowid].translation = translation
+                self._entries[rowid].last_used = now
+                self._db.execute("UPDATE memory SET source = ?, translation = ?, last_used = ? WHERE rowid = ?", (text, translation, now, rowid))
+            else:
+                cursor = self._db.execute("INSERT INTO memory VALUES (?, ?, ?, ?, ?, ?)", (src_lang, dst_lang, normalized, text, translation, now))
+                self._index(cursor.lastrowid, _Entry(src_lang, dst_lang, normalized, translation, now))
+                self._evict()
+            self._write_used()
+            self._db.commit()
+
+    def _evict(self):
+        # Under `_lock`. A tenth at once, so the sort does not run on every add
+        if len(self._entries) <= self.max_entries:
+            return
+        count = len(self._entries) - self.max_entries + self.max_entries // 10
+        oldest = sorted(self._entries, key=lambda rowid: self._entries[rowid].last_used)[:count]
+        for rowid in oldest:
+            self._unindex(rowid)
+        self._db.executemany("DELETE FROM memory WHERE rowid = ?", [(rowid,) for rowid in oldest])
+        logger.debug(f"[Memory] forgot the {count} least recently used translations")
+
+    def _write_used(self):
+        # Under `_lock`. Hits only change `last_used`, written along with the next add instead of one commit each
+        self._db.executemany("UPDATE memory SET last_used = ? WHERE rowid = ?",
+                             [(self._entries[rowid].last_used, rowid) for rowid in self._used])
+        self._used.clear()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._write_used()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+class MemoryTranslator:
+    """
+    Same `translate_multi` as `AlicloudApiTranslator`, answering from `memory` where it can
+    and asking `translator` only for the rest, whose answers are remembered.
+    """
+    def __init__(self, translator, memory: TranslationMemory):
+        self.translator = translator
+        self.memory = memory
+        # Whether the cloud was asked during the last request, for usage accounting
+        self.cloud_used = False
+
+    def translate_multi(self, source_language, target_languages: List[str], context, source_texts: List[str], read_timeout_ms=1000, connect_timeout_ms=1000) -> List[dict[str, str]]:
+        results: List[dict[str, str]] = [{} for _ in source_texts]
+        missing = []
+        for i, text in enumerate(source_texts):
+            for lang in target_languages:
+                found = self.memory.lookup(source_language, lang, text)
+                if found is None:
+                    break
+                results[i][lang] = found[0]
+                if found[1] < 1.0:
+                    logger.debug(f"[Memory] {text} ~ {found[1]:.2f}")
+            else:
+                continue
+            missing.append(i)
+        self.cloud_used = False
+        if not missing:
+            return results
+        # Sentences missing any language are translated to all of them, in one request as before
+        translated = self.translator.translate_multi(source_language, target_languages, context, [source_texts[i] for i in missing],
+                                                     read_timeout_ms, connect_timeout_ms)
+        self.cloud_used = getattr(self.translator, "cloud_used", True)
+        for i, translations in zip(missing, translated):
+            results[i] = translations
+            for lang, translation in translations.items():
+                self.memory.add(source_language, lang, source_texts[i], translation)
+        return results
@@ -0,0 +1,106 @@
+import threading
+import logging
+import concurrent.futures
+from typing import List
+
+from AlicloudApiTranslator import AlicloudApiTranslator
+from LocalMtTranslator import LocalMtTranslator
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+# Shared by every router, so routers created on each `ARSWorker` restart do not leave threads behind
+_race_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="router")
+
+
+class RoutingPolicy:
+    CLOUD = 'cloud'
+    LOCAL = 'local'
+    LOCAL_SHORT = 'local_short' # local for short sentences, cloud for long ones
+    RACE = 'race' # both at once, the first answer wins
+
+
+# Chooses between the cloud and the local translator per request, falling back to the other one on failure
+class TranslatorRouter:
+    """
+    Same `translate_multi` as `AlicloudApiTranslator`.
+
+    Args:
+        cloud: None when no Alicloud key is set, everything then goes local.
+        short_chars (int): The longest sentence still translated locally by `RoutingPolicy.LOCAL_SHORT`.
+    """
+    def __init__(self, cloud: AlicloudApiTranslator, local: LocalMtTranslator, policy: str = RoutingPolicy.LOCAL_SHORT, short_chars: int = 24):
+        self.cloud = cloud
+        self.local = local
+        self.policy = policy
+        self.short_chars = short_chars
+        # Whether the cloud was asked during the last request, for usage accounting
+        self.cloud_used = False
+        # Stats
+        self.stats = {"cloud": 0, "local": 0, "fallback": 0}
+        self._stats_lock = threading.Lock()
+        # Language pairs without a local model, reported once
+        self._unsupported: set[tuple[str, tuple[str, ...]]] = set()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _local_supports(self, source_language: str, target_languages: List[str]) -> bool:
+        return self.local is not None and all(self.local.supports(source_language, lang) for lang in target_languages)
+
+    def _route(self, source_language, target_languages: List[str], source_texts: List[str]) -> str:
+        if not self._local_supports(source_language, target_languages):
+            pair = (source_language, tuple(target_languages))
+            if self.cloud is None:
+                if pair not in self._unsupported:
+                    self._unsupported.add(pair)
+                    logger.error(f"No local translation model for {source_language} -> {', '.join(target_languages)} in {self.local.model_dir if self.local else 'local_mt_dir'}, and no Alicloud key for the cloud")
+                raise ValueError(f"Cannot translate {source_language} -> {', '.join(target_languages)}")
+            if self.policy == RoutingPolicy.LOCAL and pair not in self._unsupported:
+                self._unsupported.add(pair)
+                logger.warning(f"No local translation model for {source_language} -> {', '.join(target_languages)}, translating in the cloud")
+            return RoutingPolicy.CLOUD
+        if self.cloud is None or self.policy == RoutingPolicy.LOCAL:
+            return RoutingPolicy.LOCAL
+        if self.policy == RoutingPolicy.CLOUD:
+            return RoutingPolicy.CLOUD
+        if self.policy == RoutingPolicy.LOCAL_SHORT:
+            return RoutingPolicy.LOCAL if max(len(text) for text in source_texts) <= self.short_chars else RoutingPolicy.CLOUD
+        return RoutingPolicy.RACE
+
+    def translate_multi(self, source_language, target_languages: List[str], context, source_texts: List[str], read_timeout_ms=1000, connect_timeout_ms=1000) -> List[dict[str, str]]:
+        route = self._route(source_language, target_languages, source_texts)
+        self.cloud_used = route != RoutingPolicy.LOCAL
+        args = (source_language, target_languages, context, source_texts, read_timeout_ms, connect_timeout_ms)
+
+        if route == RoutingPolicy.LOCAL:
+            self._count("local")
+            return self.local.translate_multi(*args)
+
+        if route == RoutingPolicy.CLOUD:
+            try:
+                result = self.cloud.translate_multi(*args)
+                self._count("cloud")
+                return result
+            except Exception as e:
+                if not self._local_supports(source_language, target_languages):
+                    raise
+                logger.warning(f"Cloud translation failed, translating locally: {e}")
+                self._count("fallback")
+                return self.local.translate_multi(*args)
+
+        # Race: the first successful answer wins, the slower one finishes in the background
+        futures = {
+            _race_executor.submit(self.cloud.translate_multi, *args): "cloud",
+            _race_executor.submit(self.local.translate_multi, *args): "local",
+        }
+        error: Exception = None
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            self._count(futures[future])
+            return result
+        raise error
@@ -0,0 +1,183 @@
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+from typing import Callable
+
+from dashscope.audio.asr import RecognitionResult
+from DashscopeCustomRecognition import DashscopeCustomRecognitionCallback
+from AudioLevel import DEFAULT_SILENCE_RMS, pcm16_bytes_per_ms, is_silence
+
+logger = logging.getLogger("VRChatParaformerAsr")
+
+USAGE_FIELDS = ("captured_ms", "sent_ms", "speech_ms", "billed_s", "mt_chars")
+
+
+def mask_api_key(api_key: str) -> str:
+    # Only a recognizable suffix is persisted, never the key itself
+    return f"...{api_key[-4:]}" if len(api_key) > 4 else "..."
+
+
+class UsageSession:
+    """Counters of one recognition session, flushed into a `UsageLedger` every `flush_interval_s`."""
+    def __init__(self, ledger: "UsageLedger", api_key: str, sample_rate: int = 16000, silence_rms: float = DEFAULT_SILENCE_RMS, flush_interval_s: float = 10):
+        self.ledger = ledger
+        self.session_id = uuid.uuid4().hex[:12]
+        self.api_key = mask_api_key(api_key)
+        self.day = time.strftime("%Y-%m-%d")
+        self.started = time.time()
+        self.bytes_per_ms = pcm16_bytes_per_ms(sample_rate)
+        self.silence_rms = silence_rms
+        self.flush_interval_s = flush_interval_s
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self.captured_ms = 0.0 # read from the mic
+        self.sent_ms = 0.0 # taken from the local backlog to be sent, not acknowledged by the ASR server
+        self.speech_ms = 0.0 # captured and not silence
+        self.billed_s = 0.0 # `usage.duration` reported by the ASR server
+        self.mt_chars = 0 # characters sent to MT, once per destination language
+
+    def add_captured(self, buffer: bytes):
+        ms = len(buffer) / self.bytes_per_ms
+        with self._lock:
+            self.captured_ms += ms
+            if not is_silence(buffer, self.silence_rms):
+                self.speech_ms += ms
+        if time.monotonic() - self._last_flush >= self.flush_interval_s:
+            self.flush()
+
+    def set_sent_ms(self, sent_ms: float):
+        with self._lock:
+            self.sent_ms = sent_ms
+
+    def add_result(self, result: RecognitionResult):
+        usage = result.get_usage(result.get_sentence())
+        if usage and usage.get("duration"):
+            with self._lock:
+                self.billed_s += usage["duration"]
+
+    def add_mt_chars(self, chars: int):
+        with self._lock:
+            self.mt_chars += chars
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {field: getattr(self, field) for field in USAGE_FIELDS}
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        self.ledger.write(self)
+
+
+class UsageCallback(DashscopeCustomRecognitionCallback):
+    """Counts billed audio from every result before passing it to `callback`."""
+    def __init__(self, callback: DashscopeCustomRecognitionCallback, session: UsageSession):
+        self.callback = callback
+        self.session = session
+
+    def on_open(self) -> None:
+        self.callback.on_open()
+
+    def on_close(self) -> None:
+        self.callback.on_close()
+
+    def on_complete(self) -> None:
+        self.callback.on_complete()
+
+    def on_event(self, result: RecognitionResult) -> None:
+        self.session.add_result(result)
+        self.callback.on_event(result)
+
+    def on_error(self, result: RecognitionResult) -> None:
+        self.callback.on_error(result)
+
+    def on_response_timeout(self, result: RecognitionResult):
+        self.callback.on_response_timeout(result)
+
+
+# Usage per session persisted in sqlite, aggregated per day / API key on query
+class UsageLedger:
+    """
+    Args:
+        path (str): The sqlite file.
+        daily_budget_s (float): Soft limit of billed seconds per day and API key, 0 for none.
+            Exceeding it only logs a warning and calls `on_budget_exceeded(day, api_key, billed_s)`, once per day and key,
+            remembered in the file so restarts do not warn again.
+    """
+    def __init__(self, path: str, daily_budget_s: float = 0, on_budget_exceeded: Callable[[str, str, float], None] = None):
+        self.path = path
+        self.daily_budget_s = daily_budget_s
+        self.on_budget_exceeded = on_budget_exceeded
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "session_id TEXT PRIMARY KEY, day TEXT, api_key TEXT, started REAL, updated REAL, "
+            + ", ".join(f"{field} REAL" for field in USAGE_FIELDS) + ")"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS usage_day ON usage (day, api_key)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS budget_warned (day TEXT, api_key TEXT, PRIMARY KEY (day, api_key))")
+        self._db.commit()
+
+    def open_session(self, api_key: str, **kwargs) -> UsageSession:
+        return UsageSession(self, api_key, **kwargs)
+
+    def write(self, session: UsageSession):
+        counters = session.to_dict()
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                f"INSERT OR REPLACE INTO usage VALUES (?, ?, ?, ?, ?, {', '.join('?' * len(USAGE_FIELDS))})",
+                (session.session_id, session.day, session.api_key, session.started, time.time(), *counters.values()),
+            )
+            self._db.commit()
+        self._check_budget(session.day, session.api_key)
+
+    def query(self, group_by: str = "day", since_day: str = None) -> list[dict]:
+        """
+        @param group_by: "day", "api_key", "session_id", or "day, api_key"
+        @param since_day: "YYYY-MM-DD", inclusive
+        """
+        if group_by not in ("day", "api_key", "session_id", "day, api_key"):
+            raise ValueError(f"Cannot group usage by {group_by}")
+        sql = f"SELECT {group_by}, COUNT(*), " + ", ".join(f"SUM({field})" for field in USAGE_FIELDS) + " FROM usage"
+        params = ()
+        if since_day:
+            sql += " WHERE day >= ?"
+            params = (since_day,)
+        sql += f" GROUP BY {group_by} ORDER BY {group_by}"
+        keys = [key.strip() for key in group_by.split(",")] + ["sessions", *USAGE_FIELDS]
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [dict(zip(keys, row)) for row in rows]
+
+    def billed_seconds(self, day: str, api_key: str) -> float:
+        with self._lock:
+            row = self._db.execute("SELECT SUM(billed_s) FROM usage WHERE day = ? AND api_key = ?", (day, api_key)).fetchone()
+        return row[0] or 0
+
+    def _check_budget(self, day: str, api_key: str):
+        if self.daily_budget_s <= 0:
+            return
+        billed_s = self.billed_seconds(day, api_key)
+        if billed_s < self.daily_budget_s:
+            return
+        with self._lock:
+            if self._db is None:
+                return
+            # Ledgers of later sessions share the file, only the first one over the budget warns
+            warned = self._db.execute("INSERT OR IGNORE INTO budget_warned VALUES (?, ?)", (day, api_key)).rowcount == 0
+            self._db.commit()
+        if warned:
+            return
+        logger.warning(f"[Usage] {billed_s:.0f}s billed on {day} for key {api_key}, over the daily budget of {self.daily_budget_s:.0f}s")
+        if self.on_budget_exceeded:
+            self.on_budget_exceeded(day, api_key, billed_s)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -1,5 +1,22 @@
 from DashscopeApiAsr import DashscopeApiAsr, DashscopeCustomRecognitionCallback, RecognitionResult
+from DashscopeAsyncRecognition import DashscopeAsyncRecognition
+from DashscopeConnection import DashscopeConnectionPool, probe_handshake
+from HedgedAsr import HedgedDashscopeAsr
 from AlicloudApiTranslator import AlicloudApiTranslator
+from LocalMtTranslator import LocalMtTranslator
+from TranslatorRouter import TranslatorRouter, RoutingPolicy
+from TranslationMemory import TranslationMemory, MemoryTranslator
+from CaptureRecorder import CaptureRecorder, RecordingCallback, RecordingOscClient
+from LocalEndpointer import LocalEndpointer, EndpointEvent
+from UsageLedger import UsageLedger, UsageSession, UsageCallback
+from LocalParaformerAsr import LocalParaformerAsr
+from AudioSource import AudioSource, AudioSourceKind, FileSource, StdinSource, UdpSource, PulseMonitorSource
+from AudioLevel import pcm16_bytes_per_ms
+from ChatboxThrottle import ChatboxThrottle
+from EndpointSelector import EndpointSelector
+import functools
+import dashscope
+import urllib.parse
 import json
 import pythonosc
 import pythonosc.udp_client
@@ -7,10 +24,28 @@ import logging
 import asyncio
 import pyaudio
 import multiprocessing
+import atexit
+import threading
+import queue
+import time
+from collections import deque
+from typing import Callable, Awaitable
 logger = logging.getLogger("VRChatParaformerAsr")
 
 
 class Setting:
+    # Read on every use, applied over the control channel without restarting the worker
+    LIVE_KEYS = {"dark_mode", "osc_bypass_keyboard", "osc_enableSFX", "src_lang", "dst_lang", "extra_dst_langs", "control_port",
+                 "translate_deadline_ms", "translate_late_policy"}
+    # The setting panel may change these over the control channel: no credentials, file paths, or where audio and OSC go
+    REMOTE_KEYS = {"dark_mode", "osc_bypass_keyboard", "osc_enableSFX", "local_endpointing", "local_endpointing_offset_ms",
+                   "enable_translate", "src_lang", "dst_lang", "extra_dst_langs", "translate_engine", "local_mt_short_chars", "local_mt_num_threads",
+                   "translate_two_phase", "translate_deadline_ms", "translate_late_policy", "chatbox_min_interval_ms",
+                   "translation_memory_threshold", "translation_memory_max_entries", "micro_device_id", "audio_source_realtime",
+                   "disfluency_removal_enabled", "backlog_max_ms", "backlog_policy", "uplink_stall_timeout_ms", "usage_daily_budget_s",
+                   "asr_asyncio", "asr_keep_connection", "asr_fast_events", "asr_hedge", "asr_hedge_model", "endpoint_reprobe_s",
+                   "asr_engine", "local_num_threads", "local_fallback_recheck_s", "alicloud_keepalive_interval"}
+
     def __init__(self) -> None:
         # Setting ====
         # ui
@@ -21,19 +56,61 @@ class Setting:
         # osc
         self.osc_bypass_keyboard = True
         self.osc_enableSFX = True
+        # local endpointing: typing indicator on local speech onset, commit the partial text early on local offset
+        self.local_endpointing = False
+        self.local_endpointing_offset_ms = 600
         # translate
         self.enable_translate = False
         self.src_lang = "zh" # zh, en, ja, ko # https://help.aliyun.com/zh/machine-translation/support/supported-languages-and-codes?spm=api-workbench.api_explorer.0.0.3d374eecSIT7xn
         self.dst_lang = "ja"
+        self.extra_dst_langs = [] # more destination languages translated in the same round trip, e.g. ["en"]
+        self.translate_engine = "cloud" # cloud, local, local_short (local for short sentences, cloud for long ones), race (both, the first answer wins)
+        self.local_mt_dir = "" # quantized Opus-MT models per language pair for the local translator, see `LocalMtTranslator`
+        self.local_mt_short_chars = 24 # the longest sentence translated locally by `local_short`
+        self.local_mt_num_threads = 2
+        self.translate_two_phase = False # send the transcript as soon as the sentence ends, then update it in place with the translation
+        self.translate_deadline_ms = 3000 # two-phase: a translation later than this is not patched in, 0 for no deadline
+        self.translate_late_policy = "next" # two-phase: next (a late translation shows with the next update), drop
+        self.chatbox_min_interval_ms = 1500 # two-phase: at most one chatbox message per this long, updates in between are merged
+        self.translation_memory_db = "" # reuse translations of the same or nearly the same sentences, remembered in this sqlite file, empty to disable
+        self.translation_memory_threshold = 0.85 # least similarity (shorter / longer length, only added or left out characters) of a remembered sentence to reuse its translation
+        self.translation_memory_max_entries = 20000 # the least recently used translations are forgotten beyond this many
         # microphone: should recreate `MicCollector` after change
         self.micro_device_id = 3
+        # audio source: should recreate it after change, see `CreateAudioSource`
+        self.audio_source = "mic" # mic, file, stdin, udp, pulse_monitor
+        self.audio_source_path = "" # file: wav, flac or .vrccap path; udp: "host:port"; pulse_monitor: monitor source name, empty for the default output
+        self.audio_source_realtime = True # file: pace at real time, false for as fast as recognition goes
+        self.audio_source_rtp = False # udp: datagrams are RTP with L16 payload
         # dashscope api: should restart `DashscopeApiAsr` after change
         self.api_key = ""
         self.disfluency_removal_enabled = False
+        self.backlog_max_ms = 3000 # upper bound of unsent audio when the uplink is slow, 0 for unbounded
+        self.backlog_policy = "drop_silence" # drop_silence, drop_oldest, fast_forward
+        self.uplink_stall_timeout_ms = 2000
+        self.capture_dir = "" # record mic audio, server responses and OSC output into this directory for `main.replay.py`, empty to disable
+        self.usage_db = "" # record captured/sent/billed audio and MT characters into this sqlite file, e.g. "usage.sqlite3", see `main.usage.py`, empty to disable
+        self.usage_daily_budget_s = 0 # warn in the log and the setting panel once billed seconds of the day exceed this, 0 to disable
+        self.control_port = 8081 # localhost port of the control channel between the setting panel and `main.cmd.py`, 0 to disable
+        self.asr_asyncio = False # run recognition, translation and OSC on the asyncio loop (`ARSWorkerAsync`) instead of a receive thread
+        self.asr_keep_connection = True # `ARSWorkerAsync` runs each recognition task on a kept open connection instead of connecting every restart
+        self.asr_fast_events = False # hand callbacks the lightweight `RecognitionEvent` instead of the SDK `RecognitionResult`, see `RecognitionEvent.py`
+        self.asr_hedge = False # also recognize with a second session and show whichever final comes first, costs twice, see `HedgedAsr.py`
+        self.asr_hedge_model = "paraformer-realtime-v2" # model of the second session
+        self.asr_hedge_url = "" # websocket of the second session, e.g. another region, empty for the default endpoint
+        self.asr_endpoints = [] # candidate websockets (regions), the fastest answering one is used for the next connection, empty for the default endpoint
+        self.endpoint_reprobe_s = 600 # measure the candidate endpoints of recognition and translation again this often, and after a failure
+        # asr engine: should restart the worker after change
+        self.asr_engine = "cloud" # cloud, local, local_fallback (local while the cloud is unreachable)
+        self.local_model_dir = "" # streaming Paraformer onnx model for the local engine, see `LocalParaformerAsr`
+        self.local_num_threads = 2
+        self.local_fallback_recheck_s = 300 # seconds of audio on the fallback engine before trying the cloud again
         # alicloud api: should restart `AlicloudApiTranslator` after change
         self.alicloud_access_key_id = ""
         self.alicloud_access_key_secret = ""
         self.alicloud_endpoint = 'mt.cn-hangzhou.aliyuncs.com'
+        self.alicloud_keepalive_interval = 0 # seconds, probe the idle translation connection to keep it warm, each probe is a billed request, 0 to disable
+        self.alicloud_endpoints = [] # candidate endpoints (regions), the fastest answering one is used instead of `alicloud_endpoint`
 
     def copy_from(self, another: "Setting") -> None:
         for key, value in another.__dict__.items():
@@ -48,67 +125,345 @@ class Setting:
             self.__dict__[key] = value
 
 class VRChatOscCallback(DashscopeCustomRecognitionCallback):
-    def __init__(self, setting: Setting, translator: AlicloudApiTranslator = None):
+    # If `loop` is given, callbacks are expected to be invoked on it, and translation is awaited there too
+    def __init__(self, setting: Setting, translator: AlicloudApiTranslator | TranslatorRouter | MemoryTranslator = None, loop: asyncio.AbstractEventLoop = None):
         self.setting = setting
         self.translator = translator
         self.osc_client = pythonosc.udp_client.SimpleUDPClient(self.setting.vrchat_ip, self.setting.vrchat_port)
         self.last_text = ""
         self.last_translated_text = ""
+        # Completed sentences waiting for translation, drained in bursts by `translate_worker`
+        self.pending_texts: queue.Queue[str|None] | asyncio.Queue[str|None] = None
+        self.translate_worker: threading.Thread | asyncio.Task = None
+        self.translate_closed = False # given up on by `close_translate_worker`, nothing more is sent
+        self.loop = loop
+        self.set_translator(translator)
+        # Local endpointing, see `on_speech_offset`
+        self.endpoint_lock = threading.Lock()
+        self.partial_text = "" # latest unfinished sentence from the server
+        self.early_text: str = None # partial text committed at a local offset, waiting for the server final
+        self.early_time = 0
+        self.early_gains_ms: list[float] = []
+        self.quiet_next_update = False
+        # Two-phase output: the transcript at once, the translation patched in later, see `_show_transcript`
+        # Sentences on the chatbox as [text, translation or None while pending, perf_counter when shown]
+        self.two_phase = setting.enable_translate and setting.translate_two_phase
+        self.chatbox_lock = threading.Lock()
+        self.chatbox_lines: deque[list] = deque(maxlen=2)
+        self.chatbox_throttle: ChatboxThrottle = None
+        if self.two_phase:
+            self.chatbox_throttle = ChatboxThrottle(self._send_chatbox_now, setting.chatbox_min_interval_ms, loop)
+        # usage accounting
+        self.usage: UsageSession = None
+        # the error ending the session, for `Supervisor`
+        self.last_error: RecognitionResult = None
+        # transcripts and latency for the control channel, called from any thread
+        self.publish: Callable[[dict], None] = None
+
+    def set_translator(self, translator: AlicloudApiTranslator | TranslatorRouter | MemoryTranslator):
+        # Also after construction, when the translator is created while recognition starts, see `StartConcurrently`
+        self.translator = translator
+        if self.translator and self.loop:
+            self.pending_texts = asyncio.Queue()
+            self.translate_worker = self.loop.create_task(self._translate_worker_async())
+        elif self.translator:
+            self.pending_texts = queue.Queue()
+            self.translate_worker = threading.Thread(target=self._translate_worker, daemon=True, name="Translator")
+            self.translate_worker.start()
+
+    async def close_translate_worker(self, timeout_s: float = 3) -> None:
+        # Once the session ended: what is queued is still translated and shown for up to `timeout_s`,
+        # so no worker keeps translating behind the next session after a restart
+        if not self.translate_worker:
+            return
+        self.pending_texts.put_nowait(None)
+        if isinstance(self.translate_worker, threading.Thread):
+            await asyncio.to_thread(self.translate_worker.join, timeout_s)
+            finished = not self.translate_worker.is_alive()
+        else:
+            await asyncio.wait({self.translate_worker}, timeout=timeout_s)
+            finished = self.translate_worker.done()
+        if not finished:
+            logger.warning(f"Translate worker still busy after {timeout_s}s, dropping what it has not sent")
+            self.translate_closed = True
+            if isinstance(self.translate_worker, asyncio.Task):
+                self.translate_worker.cancel()
+
+    async def close_chatbox(self) -> None:
+        # After `close_translate_worker`: the last update may still be held back by the rate limit,
+        # it goes out before the session ends and nothing of this session after
+        if self.chatbox_throttle:
+            await asyncio.sleep(self.chatbox_throttle.wait_s())
+            self.chatbox_throttle.close()
 
     def on_open(self) -> None:
         logger.info('RecognitionCallback open.')
 
     def on_close(self) -> None:
         logger.info('RecognitionCallback close.')
+        if self.early_gains_ms:
+            logger.info(f"[Endpointing] {len(self.early_gains_ms)} sentences shown {sum(self.early_gains_ms) / len(self.early_gains_ms):.0f}ms earlier on average")
+        if self.pending_texts:
+            self.pending_texts.put_nowait(None)
 
     def on_response_timeout(self, result: RecognitionResult):
         logger.info("RecognitionCallback is shutdown by the ASR server.")
 
     def on_error(self, result: RecognitionResult) -> None:
         logger.error(result)
+        self.last_error = result
 
     def on_complete(self) -> None:
         pass
 
+    def on_speech_onset(self) -> None:
+        # Local speech onset, show the typing indicator before the server reacts
+        self.osc_client.send_message("/chatbox/typing", [True])
+
+    def on_speech_offset(self) -> None:
+        # Local speech offset, commit the latest partial text now
+        # It will be quietly replaced if the server final differs
+        with self.endpoint_lock:
+            if not self.partial_text or self.early_text is not None:
+                return
+            self.early_text = self.partial_text
+            self.early_time = time.perf_counter()
+        logger.info(f"[Early] {self.early_text}")
+        if self.translator and self.two_phase:
+            with self.chatbox_lock:
+                lines = list(self.chatbox_lines)[-1:] + [[self.early_text, None, 0]]
+            self.send_chatbox(self._render_chatbox(lines))
+        elif self.translator:
+            self.send_chatbox(f"{self.last_text}({self.last_translated_text})\n{self.early_text}")
+        else:
+            self.send_chatbox(f"{self.last_text}\n{self.early_text}")
+
     def on_event(self, result: RecognitionResult) -> None:
         try:
             # Get full sentence
             self.osc_client.send_message("/chatbox/typing", [True])
             sen = result.get_sentence()
             logger.debug(f'RecognitionCallback sentence: {sen}', )
+            # Events without a sentence, e.g. a task-started ack
+            if not sen:
+                return
+            # If the sentence is not completed, remember it for local endpointing
+            if not result.is_sentence_end(sen):
+                self.partial_text = sen["text"]
             # If the sentence is completed, update last_text
-            if result.is_sentence_end(sen):
+            else:
                 # Extract the text
                 cur_text = sen["text"]
                 logger.info(f"[Transcribed] {cur_text}")
-                # If translator is presented, translate it
-                cur_translated_text = ""
+                if self.publish and not self.translator:
+                    self.publish({"type": "transcript", "text": cur_text, "translated": None})
+                with self.endpoint_lock:
+                    early_text, self.early_text = self.early_text, None
+                    self.partial_text = ""
+                if early_text is not None:
+                    gain = (time.perf_counter() - self.early_time) * 1000
+                    self.early_gains_ms.append(gain)
+                    logger.debug(f"[Endpointing] shown {gain:.0f}ms before the server final")
+                    if self.publish:
+                        self.publish({"type": "latency", "early_gain_ms": gain})
+                # If translator is presented, let the worker translate it
                 if self.translator:
-                    cur_translated_text = self.translator.translate(
-                        self.setting.src_lang,
-                        self.setting.dst_lang,
-                        self.last_text,
-                        cur_text,
-                    )
-                    logger.info(f"[Translated] {cur_translated_text}")
+                    if self.two_phase:
+                        self._show_transcript(cur_text, early_text)
+                    else:
+                        self.quiet_next_update = early_text is not None
+                    self.pending_texts.put_nowait(cur_text)
+                    return
+                # Already shown at the local offset
+                if early_text == cur_text:
+                    self.osc_client.send_message("/chatbox/typing", [False])
+                    self.last_text = cur_text
+                    return
                 # Merge with the last complete text
-                text = ""
-                if self.translator:
-                    text = f"{self.last_text}({self.last_translated_text})\n{cur_text}({cur_translated_text})"
-                else:
-                    text = f"{self.last_text}\n{cur_text}"
+                text = f"{self.last_text}\n{cur_text}"
                 # Send to VRChat
-                self.osc_client.send_message("/chatbox/typing", [False])
-                self.osc_client.send_message("/chatbox/input", [text, self.setting.osc_bypass_keyboard, self.setting.osc_enableSFX])
+                self.send_chatbox(text, quiet=early_text is not None)
                 # Update last_text
                 self.last_text = cur_text
-                self.last_translated_text = cur_translated_text
         except Exception as e:
             logger.error(e)
             raise e
 
-class MicCollector:
+    def send_chatbox(self, text: str, quiet: bool = False) -> None:
+        # `quiet` for replacing text already shown, without the sound effect
+        sfx = self.setting.osc_enableSFX and not quiet
+        if self.chatbox_throttle:
+            self.chatbox_throttle.send(text, sfx)
+        else:
+            self._send_chatbox_now(text, sfx)
+
+    def _send_chatbox_now(self, text: str, sfx: bool) -> None:
+        self.osc_client.send_message("/chatbox/typing", [False])
+        self.osc_client.send_message("/chatbox/input", [text, self.setting.osc_bypass_keyboard, sfx])
+
+    @staticmethod
+    def _render_chatbox(lines) -> str:
+        return "\n".join(f"{text}({translated})" if translated else text for text, translated, _ in lines)
+
+    def _show_transcript(self, cur_text: str, early_text: str | None) -> None:
+        # Two-phase, first phase: the transcript without waiting for its translation, see `_patch_translated`
+        with self.chatbox_lock:
+            self.chatbox_lines.append([cur_text, None, time.perf_counter()])
+            text = self._render_chatbox(self.chatbox_lines)
+        # Already shown at the local offset
+        if early_text == cur_text:
+            self.osc_client.send_message("/chatbox/typing", [False])
+            return
+        self.send_chatbox(text, quiet=early_text is not None)
+
+    def _patch_translated(self, cur_texts: list[str], cur_translated_texts: list[str]) -> None:
+        # Two-phase, second phase: update the shown sentences in place, if their translations made the deadline
+        deadline_ms = self.setting.translate_deadline_ms
+        now = time.perf_counter()
+        patched = False
+        waits = []
+        with self.chatbox_lock:
+            for cur_text, translated_text in zip(cur_texts, cur_translated_texts):
+                line = next((line for line in self.chatbox_lines if line[0] == cur_text and line[1] is None), None)
+                if line is None:
+                    continue # scrolled off the chatbox already
+                waited_ms = (now - line[2]) * 1000
+                late = deadline_ms > 0 and waited_ms > deadline_ms
+                if not late:
+                    line[1] = translated_text
+                    patched = True
+                else:
+                    # "next": not sent now, but part of whatever the chatbox shows next
+                    line[1] = "" if self.setting.translate_late_policy == "drop" else translated_text
+                waits.append((waited_ms, late))
+            text = self._render_chatbox(self.chatbox_lines)
+        for waited_ms, late in waits:
+            if late:
+                logger.info(f"[Translated] {waited_ms:.0f}ms after the transcript, over the {deadline_ms}ms deadline ({self.setting.translate_late_policy})")
+            if self.publish:
+                self.publish({"type": "latency", "translation_patch_ms": waited_ms, "translation_late": late})
+        if patched:
+            self.send_chatbox(text, quiet=True)
+
+    def _take_burst(self, cur_text: str) -> tuple[list[str], bool]:
+        # Collect `cur_text` with all sentences already queued behind it
+        # @return: (texts, whether the end marker was seen)
+        cur_texts = [cur_text]
+        while True:
+            try:
+                cur_text = self.pending_texts.get_nowait()
+            except (queue.Empty, asyncio.QueueEmpty):
+                return cur_texts, False
+            if cur_text is None:
+                return cur_texts, True
+            cur_texts.append(cur_text)
+
+    def _translate(self, cur_texts: list[str]) -> list[str]:
+        # Translate to every destination language at once (block)
+        dst_langs = [self.setting.dst_lang] + [lang for lang in self.setting.extra_dst_langs if lang != self.setting.dst_lang]
+        start = time.perf_counter()
+        translations = self.translator.translate_multi(
+            self.setting.src_lang,
+            dst_langs,
+            self.last_text,
+            cur_texts,
+        )
+        # Only the cloud is billed
+        if self.usage and getattr(self.translator, "cloud_used", True):
+            self.usage.add_mt_chars(sum(len(text) for text in cur_texts) * len(dst_langs))
+        if self.publish:
+            self.publish({"type": "latency", "mt_ms": (time.perf_counter() - start) * 1000, "sentences": len(cur_texts)})
+        return [" / ".join(t[lang] for lang in dst_langs) for t in translations]
+
+    def _send_translated(self, cur_texts: list[str], cur_translated_texts: list[str]) -> None:
+        for cur_text, translated_text in zip(cur_texts, cur_translated_texts):
+            logger.info(f"[Translated] {translated_text}")
+            if self.publish:
+                self.publish({"type": "transcript", "text": cur_text, "translated": translated_text})
+        if self.two_phase:
+            self._patch_translated(cur_texts, cur_translated_texts)
+        else:
+            self._show_burst(cur_texts, cur_translated_texts)
+            self.quiet_next_update = False
+        # Update last_text
+        self.last_text = cur_texts[-1]
+        self.last_translated_text = cur_translated_texts[-1]
+
+    def _send_untranslated(self, cur_texts: list[str]) -> None:
+        # The translation failed: the sentences still reach the chatbox, as without a translator
+        if self.publish:
+            for cur_text in cur_texts:
+                self.publish({"type": "transcript", "text": cur_text, "translated": None})
+        if self.two_phase:
+            # Already shown, just not waiting for a translation any more
+            with self.chatbox_lock:
+                for line in self.chatbox_lines:
+                    if line[0] in cur_texts and line[1] is None:
+                        line[1] = ""
+        else:
+            self._show_burst(cur_texts, [""] * len(cur_texts))
+            self.quiet_next_update = False
+        self.last_text = cur_texts[-1]
+        self.last_translated_text = ""
+
+    def _show_burst(self, cur_texts: list[str], cur_translated_texts: list[str]) -> None:
+        # Merge with the last complete text, a burst of several sentences is shown whole instead
+        lines = [(self.last_text, self.last_translated_text, None)] + list(zip(cur_texts, cur_translated_texts, [None] * len(cur_texts)))
+        # Send to VRChat
+        self.send_chatbox(self._render_chatbox(lines[-max(2, len(cur_texts)):]), quiet=self.quiet_next_update)
+
+    def _translate_worker(self) -> None:
+        # Translate all sentences completed during the last round trip together
+        while True:
+            cur_text = self.pending_texts.get()
+            if cur_text is None:
+                break
+            cur_texts, stop = self._take_burst(cur_text)
+            try:
+                cur_translated_texts = self._translate(cur_texts)
+            except Exception as e:
+                logger.error(e)
+                cur_translated_texts = None
+            if self.translate_closed:
+                return
+            try:
+                if cur_translated_texts is None:
+                    self._send_untranslated(cur_texts)
+                else:
+                    self._send_translated(cur_texts, cur_translated_texts)
+            except Exception as e:
+                logger.error(e)
+            if stop:
+                break
+
+    async def _translate_worker_async(self) -> None:
+        # Same as `_translate_worker`, but only the blocking MT request leaves the loop,
+        # since it goes through the translator's pooled keep-alive connection
+        while True:
+            cur_text = await self.pending_texts.get()
+            if cur_text is None:
+                break
+            cur_texts, stop = self._take_burst(cur_text)
+            try:
+                cur_translated_texts = await asyncio.to_thread(self._translate, cur_texts)
+            except Exception as e:
+                logger.error(e)
+                cur_translated_texts = None
+            if self.translate_closed:
+                return
+            try:
+                if cur_translated_texts is None:
+                    self._send_untranslated(cur_texts)
+                else:
+                    self._send_translated(cur_texts, cur_translated_texts)
+            except Exception as e:
+                logger.error(e)
+            if stop:
+                break
+
+class MicCollector(AudioSource):
     def __init__(self, setting: Setting):
+        super().__init__()
         self.setting = setting
         self.mic: pyaudio.PyAudio = None
         self.stream: pyaudio.Stream = None
@@ -135,43 +490,389 @@ class MicCollector:
             self.mic = None
 
     async def read(self):
-        return await asyncio.to_thread(self.stream.read, 3200)
+        return await asyncio.to_thread(self._read)
 
-# Audio and Speech Recognition Workhorse
-# Keep running until `Stop`
-async def ARSWorker(setting: Setting):
-    mic = MicCollector(setting)
-    mic.start()
+    def _read(self):
+        with self.read_lock:
+            return self.stream.read(3200)
 
-    try:
-        # Init translator: text(src_language) -> text(dst_language)
-        translator = None
-        if setting.enable_translate:
-            try:
-                translator = AlicloudApiTranslator()
-                translator.init_client(
+def CreateAudioSource(setting: Setting) -> AudioSource:
+    # Not started yet
+    if setting.audio_source == AudioSourceKind.FILE:
+        return FileSource(setting.audio_source_path, setting.audio_source_realtime)
+    if setting.audio_source == AudioSourceKind.STDIN:
+        return StdinSource()
+    if setting.audio_source == AudioSourceKind.UDP:
+        host, _, port = setting.audio_source_path.rpartition(":")
+        return UdpSource(host or "0.0.0.0", int(port or 8766), setting.audio_source_rtp)
+    if setting.audio_source == AudioSourceKind.PULSE_MONITOR:
+        return PulseMonitorSource(setting.audio_source_path)
+    return MicCollector(setting)
+
+def DispatchEndpointEvents(events: list[str], callback: VRChatOscCallback):
+    for event in events:
+        if event == EndpointEvent.ONSET:
+            callback.on_speech_onset()
+        elif event == EndpointEvent.OFFSET:
+            callback.on_speech_offset()
+
+def InitTranslator(setting: Setting) -> AlicloudApiTranslator | TranslatorRouter | MemoryTranslator:
+    # Init translator: text(src_language) -> text(dst_language)
+    translator = None
+    if setting.enable_translate:
+        try:
+            # Shared between restarts, so the warmed keep-alive connection is reused
+            if setting.translate_engine == RoutingPolicy.CLOUD or setting.alicloud_access_key_id:
+                translator = AlicloudApiTranslator.get_shared(
                     setting.alicloud_access_key_id,
                     setting.alicloud_access_key_secret,
                     setting.alicloud_endpoint,
+                    setting.alicloud_keepalive_interval,
+                    MtEndpointSelector(setting),
                 )
-            except Exception as e:
-                logger.error(e)
-                raise e
+            if setting.translate_engine != RoutingPolicy.CLOUD:
+                # Models are loaded and warmed up once, in the background
+                dst_langs = [setting.dst_lang] + setting.extra_dst_langs
+                local = LocalMtTranslator.get_shared(
+                    setting.local_mt_dir,
+                    setting.local_mt_num_threads,
+                    warm_up_pairs=[(setting.src_lang, lang) for lang in dst_langs],
+                )
+                translator = TranslatorRouter(translator, local, setting.translate_engine, setting.local_mt_short_chars)
+            if setting.translation_memory_db:
+                memory = TranslationMemory.get_shared(setting.translation_memory_db, setting.translation_memory_threshold, setting.translation_memory_max_entries)
+                translator = MemoryTranslator(translator, memory)
+        except Exception as e:
+            logger.error(e)
+            raise e
+    return translator
 
-        # Init asr: audio -> text
-        asr_callback = VRChatOscCallback(setting, translator)
-        asr = DashscopeApiAsr()
-        asr.start(api_key=setting.api_key, callback=asr_callback)
+def AsrEndpointSelector(setting: Setting) -> EndpointSelector | None:
+    # Ranks `asr_endpoints` in the background, None if there are none
+    if not setting.asr_endpoints:
+        EndpointSelector.stop_shared("asr")
+        return None
+    probe = functools.partial(probe_handshake, api_key=setting.api_key)
+    return EndpointSelector.get_shared("asr", setting.asr_endpoints, probe, setting.endpoint_reprobe_s)
 
-        while True:
+def MtEndpointSelector(setting: Setting) -> EndpointSelector | None:
+    if not setting.alicloud_endpoints:
+        EndpointSelector.stop_shared("mt")
+        return None
+    probe = functools.partial(AlicloudApiTranslator.probe, setting.alicloud_access_key_id, setting.alicloud_access_key_secret)
+    return EndpointSelector.get_shared("mt", setting.alicloud_endpoints, probe, setting.endpoint_reprobe_s)
+
+class AsrEngine:
+    CLOUD = 'cloud'
+    LOCAL = 'local'
+    LOCAL_FALLBACK = 'local_fallback'
+
+async def CloudReachable(timeout_s: float = 2.0, url: str = None) -> bool:
+    # Only a TCP connect to the ASR server, the session itself may still fail
+    url = urllib.parse.urlparse(url or dashscope.base_websocket_api_url)
+    port = url.port or (443 if url.scheme == "wss" else 80)
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(url.hostname, port), timeout_s)
+        writer.close()
+        return True
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+async def ChooseAsrEngine(setting: Setting) -> str:
+    # `AsrEngine.CLOUD` or `AsrEngine.LOCAL` for this session
+    if setting.asr_engine == AsrEngine.LOCAL_FALLBACK:
+        selector = AsrEndpointSelector(setting)
+        if await CloudReachable(url=selector.best() if selector else None):
+            return AsrEngine.CLOUD
+        logger.warning(f"ASR server unreachable, recognizing locally for {setting.local_fallback_recheck_s}s")
+        return AsrEngine.LOCAL
+    return AsrEngine.LOCAL if setting.asr_engine == AsrEngine.LOCAL else AsrEngine.CLOUD
+
+def InitUsage(setting: Setting, publish: Callable[[dict], None] = None) -> tuple[UsageLedger, UsageSession]:
+    # Usage accounting of one recognition session, (None, None) if disabled
+    if not setting.usage_db:
+        return None, None
+    on_budget_exceeded = None
+    if publish:
+        on_budget_exceeded = lambda day, api_key, billed_s: publish({"type": "usage", "budget_exceeded": True, "day": day, "api_key": api_key, "billed_s": billed_s})
+    ledger = UsageLedger(setting.usage_db, setting.usage_daily_budget_s, on_budget_exceeded)
+    return ledger, ledger.open_session(setting.api_key)
+
+def TrackCapturedFrame(backlog_stats: dict, audio_data: bytes, usage: UsageSession, publish: Callable[[dict], None]):
+    # Per captured frame
+    if usage:
+        usage.set_sent_ms(backlog_stats["sent_ms"])
+        usage.add_captured(audio_data)
+    if publish:
+        publish({"type": "pipeline", **backlog_stats})
+
+def CloseUsage(ledger: UsageLedger, usage: UsageSession):
+    if usage:
+        usage.flush()
+    if ledger:
+        ledger.close()
+
+async def StartConcurrently(steps: dict[str, Awaitable], mic: AudioSource, open_mic: bool, publish: Callable[[dict], None]) -> tuple[list, bool]:
+    # Startup steps run together, so getting ready takes as long as the slowest one instead of all of them
+    # Returns the audio read meanwhile, to be sent once everything is ready, and whether the source has ended
+    start = time.perf_counter()
+    timings: dict[str, float] = {}
+    async def timed(name: str, step: Awaitable):
+        step_start = time.perf_counter()
+        try:
+            return await step
+        finally:
+            timings[f"{name}_ms"] = (time.perf_counter() - step_start) * 1000
+    tasks = [asyncio.create_task(timed(name, step)) for name, step in steps.items()]
+    audio, ended = [], False
+    try:
+        if open_mic:
+            await timed("mic", asyncio.to_thread(mic.start))
+        # A file or pipe loses nothing by waiting, only a live source is read meanwhile
+        while mic.realtime and not all(task.done() for task in tasks):
+            if any(task.done() and not task.cancelled() and task.exception() for task in tasks):
+                break
             audio_data = await mic.read()
-            if asr.is_stopped():
+            if audio_data is None:
+                ended = True
                 break
+            audio.append(audio_data)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    timings["ready_ms"] = (time.perf_counter() - start) * 1000
+    buffered_ms = sum(len(audio_data) for audio_data in audio) / pcm16_bytes_per_ms(mic.sample_rate)
+    logger.info(f"[Startup] ready in {timings['ready_ms']:.0f}ms (" + ", ".join(f"{k[:-3]} {v:.0f}ms" for k, v in timings.items() if k != "ready_ms")
+                + f"), {buffered_ms:.0f}ms of audio buffered meanwhile")
+    if publish:
+        publish({"type": "latency", **timings, "buffered_ms": buffered_ms})
+    return audio, ended
+
+# Audio and Speech Recognition Workhorse
+# Keep running until `Stop`
+# Returns the error ending the session, None if it ended normally
+# `mic` is left open if given, so `Supervisor` keeps capturing between restarts
+# `publish` receives transcripts, latency and pipeline stats for the control channel
+# `engine` is one of `AsrEngine`, chosen by `setting.asr_engine` if None
+async def ARSWorker(setting: Setting, mic: AudioSource = None, publish: Callable[[dict], None] = None, engine: str = None) -> RecognitionResult:
+    own_mic = mic is None
+    if own_mic:
+        mic = CreateAudioSource(setting)
+
+    asr: DashscopeApiAsr | LocalParaformerAsr = None
+    asr_selector, asr_url = None, None
+    osc_callback: VRChatOscCallback = None
+    recorder: CaptureRecorder = None
+    usage_ledger, usage = None, None
+    try:
+        # Init asr: audio -> text, the translator is set once created
+        osc_callback = VRChatOscCallback(setting)
+        asr_callback = osc_callback
+        if setting.capture_dir:
+            recorder = CaptureRecorder.open_in(setting.capture_dir)
+            osc_callback.osc_client = RecordingOscClient(osc_callback.osc_client, recorder)
+            asr_callback = RecordingCallback(asr_callback, recorder)
+        usage_ledger, usage = InitUsage(setting, publish)
+        if usage:
+            osc_callback.usage = usage
+            if not setting.asr_hedge:
+                # Hedged sessions are counted each by `HedgedDashscopeAsr`, before the slower final is dropped
+                asr_callback = UsageCallback(asr_callback, usage)
+        osc_callback.publish = publish
+
+        async def init_translator():
+            osc_callback.set_translator(await asyncio.to_thread(InitTranslator, setting))
+
+        async def start_asr():
+            nonlocal asr, asr_selector, asr_url
+            chosen = engine or await ChooseAsrEngine(setting)
+            if chosen == AsrEngine.LOCAL:
+                asr = LocalParaformerAsr(setting.local_model_dir, setting.local_num_threads)
+                await asyncio.to_thread(
+                    asr.start,
+                    callback=asr_callback,
+                    max_backlog_ms=setting.backlog_max_ms or None,
+                    backlog_policy=setting.backlog_policy,
+                    stall_timeout_ms=setting.uplink_stall_timeout_ms,
+                    # Ends normally, so `Supervisor` restarts it and the cloud is tried again
+                    max_duration_s=setting.local_fallback_recheck_s if setting.asr_engine == AsrEngine.LOCAL_FALLBACK else None,
+                )
+            else:
+                asr_selector = AsrEndpointSelector(setting)
+                asr_url = asr_selector.best() if asr_selector else None
+                if setting.asr_hedge:
+                    asr = HedgedDashscopeAsr([('paraformer-realtime-v1', asr_url), (setting.asr_hedge_model, setting.asr_hedge_url or None)], publish, usage)
+                    url_arg = {}
+                else:
+                    asr = DashscopeApiAsr()
+                    url_arg = {"url": asr_url}
+                asr.start(
+                    api_key=setting.api_key,
+                    callback=asr_callback,
+                    max_backlog_ms=setting.backlog_max_ms or None,
+                    backlog_policy=setting.backlog_policy,
+                    stall_timeout_ms=setting.uplink_stall_timeout_ms,
+                    fast_events=setting.asr_fast_events,
+                    **url_arg,
+                )
+                await asyncio.to_thread(asr.wait_ready)
+
+        pending_audio, ended = await StartConcurrently({"translator": init_translator(), "asr": start_asr()}, mic, own_mic, publish)
+
+        endpointer = LocalEndpointer(offset_ms=setting.local_endpointing_offset_ms) if setting.local_endpointing else None
+
+        async def send(audio_data):
+            if recorder:
+                recorder.record_audio(audio_data)
             asr.send_audio_frame(audio_data)
+            if not mic.realtime:
+                # Nothing is dropped from a file or pipe, wait for the uplink instead
+                while asr.get_backlog_stats()["backlog_frames"] > 1 and not asr.is_stopped():
+                    await asyncio.sleep(0.005)
+            if usage or publish:
+                TrackCapturedFrame(asr.get_backlog_stats(), audio_data, usage, publish)
+            if endpointer:
+                DispatchEndpointEvents(endpointer.process(audio_data), osc_callback)
+
+        for audio_data in pending_audio:
+            await send(audio_data)
+        while not ended:
+            audio_data = await mic.read()
+            if audio_data is None or asr.is_stopped():
+                # The source ended, or the server did
+                break
+            await send(audio_data)
     finally:
-        mic.stop()
+        if own_mic:
+            mic.stop()
         if asr and not asr.is_stopped():
             asr.stop()
+        if osc_callback:
+            await osc_callback.close_translate_worker()
+            await osc_callback.close_chatbox()
+        if recorder:
+            recorder.close()
+        CloseUsage(usage_ledger, usage)
+        if asr_selector and osc_callback and osc_callback.last_error:
+            asr_selector.report_failure(asr_url, osc_callback.last_error.message)
+    return osc_callback.last_error
+
+# Same as `ARSWorker`, but capture, recognition, translation and OSC all run on the current loop
+# Keep running until `Stop`, cancelling it closes the connection immediately
+async def ARSWorkerAsync(setting: Setting, mic: AudioSource = None, publish: Callable[[dict], None] = None) -> RecognitionResult:
+    engine = await ChooseAsrEngine(setting)
+    if engine == AsrEngine.LOCAL or setting.asr_hedge:
+        # The local engine decodes on its own thread anyway, hedging runs on `DashscopeApiAsr` sessions
+        return await ARSWorker(setting, mic, publish, engine)
+    own_mic = mic is None
+    if own_mic:
+        mic = CreateAudioSource(setting)
+
+    osc_callback: VRChatOscCallback = None
+    recognition: DashscopeAsyncRecognition = None
+    recorder: CaptureRecorder = None
+    usage_ledger, usage = None, None
+    tasks: list[asyncio.Task] = []
+    asr_selector = AsrEndpointSelector(setting)
+    asr_url = asr_selector.best() if asr_selector else None
+    try:
+        # Init asr: audio -> text, the translator is set once created
+        osc_callback = VRChatOscCallback(setting, loop=asyncio.get_running_loop())
+        asr_callback = osc_callback
+        if setting.capture_dir:
+            recorder = CaptureRecorder.open_in(setting.capture_dir)
+            osc_callback.osc_client = RecordingOscClient(osc_callback.osc_client, recorder)
+            asr_callback = RecordingCallback(asr_callback, recorder)
+        usage_ledger, usage = InitUsage(setting, publish)
+        if usage:
+            osc_callback.usage = usage
+            asr_callback = UsageCallback(asr_callback, usage)
+        osc_callback.publish = publish
+        recognition = DashscopeAsyncRecognition(
+            model='paraformer-realtime-v1',
+            format='pcm',
+            sample_rate=16000,
+            api_key=setting.api_key,
+            url=asr_url,
+            max_backlog_ms=setting.backlog_max_ms or None,
+            backlog_policy=setting.backlog_policy,
+            stall_timeout_ms=setting.uplink_stall_timeout_ms,
+            fast_events=setting.asr_fast_events,
+            connection_pool=DashscopeConnectionPool.get_shared(url=asr_url, api_key=setting.api_key) if setting.asr_keep_connection else None,
+        )
+
+        async def init_translator():
+            osc_callback.set_translator(await asyncio.to_thread(InitTranslator, setting))
+
+        async def start_asr():
+            try:
+                await recognition.start()
+            except Exception as e:
+                if asr_selector:
+                    asr_selector.report_failure(asr_url, str(e))
+                raise
+
+        pending_audio, ended = await StartConcurrently({"translator": init_translator(), "asr": start_asr()}, mic, own_mic, publish)
+        logger.info(f"Recognition started in {recognition.start_ms:.0f}ms" + (f", handshake {recognition.handshake_ms:.0f}ms" if recognition.handshake_ms else ", on the kept connection"))
+        if publish:
+            publish({"type": "latency", "task_start_ms": recognition.start_ms, "handshake_ms": recognition.handshake_ms})
+        asr_callback.on_open()
+
+        endpointer = LocalEndpointer(offset_ms=setting.local_endpointing_offset_ms) if setting.local_endpointing else None
+
+        # Capture only queues into the bounded backlog, so a slow uplink never blocks the mic
+        async def capture():
+            while True:
+                audio_data = pending_audio.pop(0) if pending_audio else None if ended else await mic.read()
+                if recognition.is_stopped():
+                    break
+                if audio_data is None:
+                    # The source ended, finish with the remaining results
+                    await recognition.stop()
+                    break
+                if recorder:
+                    recorder.record_audio(audio_data)
+                recognition.push_audio_frame(audio_data)
+                if not mic.realtime:
+                    while recognition.get_backlog_stats()["backlog_frames"] > 1 and not recognition.is_stopped():
+                        await asyncio.sleep(0.005)
+                if usage or publish:
+                    TrackCapturedFrame(recognition.get_backlog_stats(), audio_data, usage, publish)
+                if endpointer:
+                    DispatchEndpointEvents(endpointer.process(audio_data), osc_callback)
+        capture_task = asyncio.create_task(capture())
+        dispatch_task = asyncio.create_task(recognition.dispatch(asr_callback))
+        tasks += [capture_task, dispatch_task]
+
+        # Returns once the server finishes, times out or fails, or the audio source fails
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        if capture_task.done():
+            # Raises what failed the source, or it ended and the remaining results follow
+            capture_task.result()
+        await dispatch_task
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Out of the websocket before `close` reads the rest of the task from it
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_mic:
+            mic.stop()
+        if recognition:
+            running = not recognition.is_stopped()
+            # A restart finishes the task first, so the next one starts on the same connection
+            await recognition.close(finish_timeout=0.5)
+            if running:
+                asr_callback.on_close()
+        if osc_callback:
+            await osc_callback.close_translate_worker()
+            await osc_callback.close_chatbox()
+        if recorder:
+            recorder.close()
+        CloseUsage(usage_ledger, usage)
+        if asr_selector and osc_callback and osc_callback.last_error:
+            asr_selector.report_failure(asr_url, osc_callback.last_error.message)
+    return osc_callback.last_error
 
 
 def InitLogger():
@@ -201,6 +902,17 @@ def InitLogger():
     # Add the handlers to the listener
     queue_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
     queue_listener.start()
+    # Write out what is still queued before exiting, e.g. the report of a command line tool right before `sys.exit`
+    atexit.register(queue_listener.stop)
+    return log_queue
+
+
+def InitChildLogger(log_queue: multiprocessing.Queue):
+    # Child processes of `ProcessPipeline` log into the queue of the parent's `InitLogger`
+    logger.setLevel(logging.DEBUG)
+    logger.handlers.clear()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
 
 
 
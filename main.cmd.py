@@ -1,4 +1,10 @@
-from core import InitLogger, Setting, ARSWorker
+from core import InitLogger, Setting, ARSWorker, ARSWorkerAsync, CreateAudioSource
+from Supervisor import Supervisor
+from ControlChannel import ControlServer, issue_control_token
+from DashscopeConnection import DashscopeConnectionPool
+from ProcessPipeline import ProcessPipeline
+from Profiler import RuntimeMonitor, SamplingProfiler, profile_path, install_profile_signal
+import functools
 import asyncio
 import argparse
 import logging
@@ -9,12 +15,22 @@ logger = logging.getLogger("VRChatParaformerAsr")
 if __name__ in {"__main__", "__mp_main__"}:
     # ============
     # Logger
-    InitLogger()
+    log_queue = InitLogger()
 
     # =======================
     # Commandline arguments
     parser = argparse.ArgumentParser(description='VRChatParaformerAsr')
     parser.add_argument('--setting', type=str, default='setting.json', help='The path to `setting.json` which should be the serialized `core.Setting` object. Default `setting.json`.')
+    parser.add_argument('--capture', type=str, default=None, help='Record a capture for `main.replay.py` into this directory, overriding `capture_dir` in the setting.')
+    parser.add_argument('--audio-source', type=str, default=None, choices=['mic', 'file', 'stdin', 'udp', 'pulse_monitor'], help='Where audio comes from, overriding `audio_source` in the setting.')
+    parser.add_argument('--audio-source-path', type=str, default=None, help='The file, "host:port" or monitor source name of `--audio-source`, overriding `audio_source_path`.')
+    parser.add_argument('--unpaced', action='store_true', help='Read a file source as fast as recognition goes instead of at real time.')
+    parser.add_argument('--processes', action='store_true', help='Run capture and recognition in processes of their own, this one only logs and talks to the setting panel. See `ProcessPipeline`.')
+    parser.add_argument('--profile', type=float, default=None, metavar='SECONDS', help='Sample the stacks of all threads for the first SECONDS, see `Profiler.py`. SIGUSR1 (Ctrl+Break on Windows) takes one any time.')
+    parser.add_argument('--profile-length', type=float, default=30, help='Seconds sampled on SIGUSR1. Default 30.')
+    parser.add_argument('--profile-format', type=str, default='chrome', choices=['chrome', 'folded'], help='Chrome trace events (chrome://tracing, Perfetto, speedscope) or collapsed stacks for flamegraph.pl. Default chrome.')
+    parser.add_argument('--profile-dir', type=str, default='profiles', help='Where profiles are written. Default `profiles`.')
+    parser.add_argument('--no-runtime-monitor', action='store_true', help='Do not measure event loop lag and per-thread CPU.')
     args = parser.parse_args()
 
     setting_filepath = args.setting
@@ -27,13 +43,118 @@ if __name__ in {"__main__", "__mp_main__"}:
         setting_str = f.read()
     setting: Setting = Setting()
     setting.deserialize(setting_str)
+    if args.capture is not None:
+        setting.capture_dir = args.capture
+    if args.audio_source is not None:
+        setting.audio_source = args.audio_source
+    if args.audio_source_path is not None:
+        setting.audio_source_path = args.audio_source_path
+    if args.unpaced:
+        setting.audio_source_realtime = False
+    # A new token every run, the panel reads it from next to the setting file
+    control_token = issue_control_token(setting_filepath) if setting.control_port else ""
 
     # =======================
     # Main job for launching async ARS worker
+    # Restarts back off on failures, the mic stays open in between
+    # Returns once a file or pipe source has ended
     async def main():
-        while True:
-            await ARSWorker(setting)
+        mic = CreateAudioSource(setting)
+        mic.start()
+        control: ControlServer = None
+        publish = None
+        if setting.control_port:
+            control = ControlServer(setting, setting.control_port, control_token, Setting.REMOTE_KEYS)
+            publish = control.publish
+        worker = functools.partial(ARSWorkerAsync if setting.asr_asyncio else ARSWorker, publish=publish)
+        supervisor = Supervisor(setting, worker, mic)
+
+        # Settings pushed by the panel: live keys take effect at once, others restart the worker
+        async def on_setting(changed: list[str]) -> bool:
+            if all(key in Setting.LIVE_KEYS for key in changed):
+                return False
+            nonlocal mic
+            old_mic = None
+            if any(key.startswith("audio_source") for key in changed):
+                old_mic, mic = mic, CreateAudioSource(setting)
+                mic.start()
+                supervisor.mic = mic
+            elif "micro_device_id" in changed:
+                await asyncio.to_thread(mic.reopen)
+            if "asr_asyncio" in changed:
+                supervisor.worker = functools.partial(ARSWorkerAsync if setting.asr_asyncio else ARSWorker, publish=publish)
+            supervisor.restart()
+            if old_mic:
+                # After the read in progress, like `reopen`
+                def stop_old_mic():
+                    with old_mic.read_lock:
+                        old_mic.stop()
+                await asyncio.to_thread(stop_old_mic)
+            return True
+
+        # Profiling
+        profiler = SamplingProfiler()
+        def take_profile(seconds: float):
+            if not profiler.profile_in_background(seconds, profile_path(args.profile_dir, args.profile_format)):
+                logger.warning("[Profiler] a profile is already being taken")
+        loop = asyncio.get_running_loop()
+        install_profile_signal(lambda: loop.call_soon_threadsafe(take_profile, args.profile_length))
+        if args.profile:
+            take_profile(args.profile)
+        monitor_task = asyncio.create_task(RuntimeMonitor(publish).run()) if not args.no_runtime_monitor else None
+
+        try:
+            if control:
+                control.on_setting = on_setting
+                control.status = supervisor.health
+                try:
+                    await control.start()
+                except OSError as e:
+                    logger.error(f"Control channel disabled: {e}")
+                    control = None
+            await supervisor.run()
+        finally:
+            if monitor_task:
+                monitor_task.cancel()
+            if control:
+                await control.stop()
+            await DashscopeConnectionPool.close_shared()
+            mic.stop()
+
+    # =======================
+    # Same with capture and recognition in child processes, audio passed through a shared memory ring
+    async def main_processes():
+        control: ControlServer = None
+        if setting.control_port:
+            control = ControlServer(setting, setting.control_port, control_token, Setting.REMOTE_KEYS)
+        pipeline = ProcessPipeline(setting, log_queue, publish=control.publish if control else None, runtime_monitor=not args.no_runtime_monitor)
+        pipeline.start()
+
+        # Profiles are taken in the recognition process, where the work is
+        def take_profile(seconds: float):
+            pipeline.profile(seconds, profile_path(args.profile_dir, args.profile_format))
+        install_profile_signal(lambda: take_profile(args.profile_length))
+        if args.profile:
+            take_profile(args.profile)
+
+        async def on_setting(changed: list[str]) -> bool:
+            return await asyncio.to_thread(pipeline.apply_setting, changed)
+
+        try:
+            if control:
+                control.on_setting = on_setting
+                control.status = lambda: pipeline.health
+                try:
+                    await control.start()
+                except OSError as e:
+                    logger.error(f"Control channel disabled: {e}")
+                    control = None
+            await pipeline.run()
+        finally:
+            if control:
+                await control.stop()
+            await asyncio.to_thread(pipeline.stop)
 
     # =======================
     # Infinite Loop
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main_processes() if args.processes else main())
\ No newline at end of file
@@ -0,0 +1,70 @@
+from core import InitLogger, Setting
+from DashscopeAsyncRecognition import DashscopeAsyncRecognition
+from DashscopeConnection import DashscopeConnectionPool
+from FakeDashscopeServer import FakeDashscopeServer
+import asyncio
+import argparse
+import logging
+import logging.handlers
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+async def run_tasks(api_key: str, url: str, tasks: int, pool: DashscopeConnectionPool) -> list[tuple[float, float]]:
+    # (task start ms, handshake ms) of tasks with a little silence each
+    timings = []
+    for _ in range(tasks):
+        recognition = DashscopeAsyncRecognition('paraformer-realtime-v1', 'pcm', 16000, api_key=api_key, url=url, connection_pool=pool)
+        await recognition.start()
+        consumer = asyncio.create_task(_drain(recognition))
+        await recognition.send_audio_frame(bytes(6400))
+        await recognition.stop()
+        await consumer
+        timings.append((recognition.start_ms, recognition.handshake_ms))
+    return timings
+
+
+async def _drain(recognition: DashscopeAsyncRecognition):
+    async for _ in recognition:
+        pass
+
+
+if __name__ in {"__main__", "__mp_main__"}:
+    # ============
+    # Logger
+    InitLogger()
+
+    # =======================
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description='Compare recognition task start latency with and without a kept open connection')
+    parser.add_argument('--setting', type=str, default='setting.json', help='The path to `setting.json` with the Dashscope API key. Default `setting.json`.')
+    parser.add_argument('--tasks', type=int, default=5, help='Tasks started one after another in each mode. Default 5.')
+    parser.add_argument('--fake', action='store_true', help='Against a local fake server instead of Dashscope, no API key needed.')
+    args = parser.parse_args()
+
+    # =======================
+    # Benchmark
+    async def main():
+        api_key, url, fake = None, None, None
+        if args.fake:
+            fake = FakeDashscopeServer(speed=0)
+            url = await fake.start()
+            api_key = "fake"
+        else:
+            setting = Setting()
+            with open(args.setting, "rt") as f:
+                setting.deserialize(f.read())
+            api_key = setting.api_key
+        try:
+            for name, pool in [("new connection per task", None), ("kept connection", DashscopeConnectionPool(url, api_key))]:
+                timings = await run_tasks(api_key, url, args.tasks, pool)
+                for i, (start_ms, handshake_ms) in enumerate(timings):
+                    logger.info(f"[{name}] task {i}: started in {start_ms:.1f}ms, of which handshake {handshake_ms:.1f}ms")
+                later = timings[1:] or timings
+                logger.info(f"[{name}] after the first task: {sum(t[0] for t in later) / len(later):.1f}ms to start on average")
+                if pool:
+                    logger.info(f"[{name}] {pool.stats}")
+                    await pool.close()
+        finally:
+            if fake:
+                await fake.stop()
+    asyncio.run(main())
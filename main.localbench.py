@@ -0,0 +1,50 @@
+from core import InitLogger
+from LocalParaformerAsr import benchmark
+from CaptureRecorder import CaptureReader, RECORD_AUDIO
+import wave
+import argparse
+import logging
+import logging.handlers
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+def read_audio(path: str) -> bytes:
+    # 16kHz mono 16bit pcm from a wav file or the audio of a capture
+    if path.endswith(".vrccap"):
+        reader = CaptureReader(path)
+        try:
+            return b"".join(bytes(payload) for kind, _, payload in reader if kind == RECORD_AUDIO)
+        finally:
+            reader.close()
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != 16000 or f.getnchannels() != 1 or f.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16kHz mono 16bit")
+        return f.readframes(f.getnframes())
+
+
+if __name__ in {"__main__", "__mp_main__"}:
+    # ============
+    # Logger
+    InitLogger()
+
+    # =======================
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description='Real-time factor and latency of the local ASR engine on this CPU')
+    parser.add_argument('audio', type=str, help='A 16kHz mono 16bit `.wav` file, or a `.vrccap` capture.')
+    parser.add_argument('--model-dir', type=str, required=True, help='The streaming Paraformer onnx model directory.')
+    parser.add_argument('--threads', type=str, default="1,2,4", help='Comma separated thread counts to compare. Default 1,2,4.')
+    parser.add_argument('--frame-ms', type=int, default=200, help='Audio fed per step, like the mic. Default 200.')
+    args = parser.parse_args()
+
+    # =======================
+    # Benchmark
+    audio = read_audio(args.audio)
+    for num_threads in [int(n) for n in args.threads.split(",")]:
+        report = benchmark(args.model_dir, audio, num_threads, args.frame_ms)
+        logger.info(
+            f"[{report['cpu']} x{report['cpu_count']}] {num_threads} threads: "
+            f"RTF {report['rtf']:.3f}, per {args.frame_ms}ms frame p50 {report['frame_p50_ms']:.1f}ms p95 {report['frame_p95_ms']:.1f}ms max {report['frame_max_ms']:.1f}ms, "
+            f"finalize {report['finalize_ms']:.1f}ms, load {report['load_s']:.1f}s, {report['audio_s']:.1f}s audio"
+        )
+    for sentence in report["sentences"]:
+        logger.info(f"[Local] {sentence}")
@@ -0,0 +1,71 @@
+from core import InitLogger
+from Microbench import BENCHMARKS, run_benchmarks_in_processes, make_entry, load_history, append_history, find_baseline, compare
+import sys
+import argparse
+import logging
+import logging.handlers
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+if __name__ in {"__main__", "__mp_main__"}:
+    # ============
+    # Logger
+    InitLogger()
+
+    # =======================
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the per-frame and per-event hot paths, with a history to catch regressions')
+    parser.add_argument('--filter', type=str, default=None, help=f'Comma separated parts of benchmark names to run. Benchmarks: {", ".join(BENCHMARKS)}.')
+    parser.add_argument('--repeat', type=int, default=9, help='Timings per benchmark, the median and the best are kept. Default 9.')
+    parser.add_argument('--processes', type=int, default=5, help='Rounds, each in a fresh process, the median and the best of them are kept. Default 5.')
+    parser.add_argument('--history', type=str, default='microbench_history.jsonl', help='History file, one json line per saved run. Default `microbench_history.jsonl`.')
+    parser.add_argument('--save', action='store_true', help='Append this run to the history.')
+    parser.add_argument('--label', type=str, default=None, help='Name of this run in the history, e.g. "before-refactor". The git commit is stored anyway.')
+    parser.add_argument('--compare', nargs='?', const='', default=None, metavar='BASELINE', help='Compare with a saved run: a label, a commit or an index, the last saved run if empty.')
+    parser.add_argument('--no-run', action='store_true', help='Only compare the last saved run with `--compare`, without running anything.')
+    parser.add_argument('--threshold', type=float, default=20, help='Median and best timing both slower by more than this many %% is a regression, the exit code is 1 then. Default 20.')
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    baseline = None
+    if args.compare is not None:
+        baseline = find_baseline(history[:-1] if args.no_run else history, args.compare or None)
+        if baseline is None:
+            logger.error(f"No run {args.compare!r} in {args.history}")
+            sys.exit(2)
+
+    # =======================
+    # Run
+    if args.no_run:
+        if not history:
+            logger.error(f"Nothing saved in {args.history} yet")
+            sys.exit(2)
+        current = history[-1]
+    else:
+        names = args.filter.split(",") if args.filter else None
+        results = run_benchmarks_in_processes(names, args.repeat, args.processes)
+        if baseline:
+            # Whatever looks slower is measured once more, and the better of both kept, before calling it a regression
+            suspects = [row["name"] for row in compare(baseline, make_entry(results), args.threshold) if row["regressed"]]
+            if suspects:
+                logger.info(f"Measuring {', '.join(suspects)} again")
+                for name, result in run_benchmarks_in_processes(suspects, args.repeat, args.processes).items():
+                    if name in results:
+                        results[name] = {key: min(value, results[name][key]) for key, value in result.items()}
+        for name, result in results.items():
+            logger.info(f"{name:<40} {result['us_per_op']:10.2f}us/op (best {result['min_us_per_op']:.2f}us)")
+        current = make_entry(results, args.label)
+        if args.save:
+            append_history(args.history, current)
+            logger.info(f"Saved to {args.history}")
+
+    # =======================
+    # Compare
+    if baseline:
+        logger.info(f"Compared with {baseline.get('label') or baseline.get('commit') or 'a run'} of {baseline['time']}")
+        rows = compare(baseline, current, args.threshold)
+        for row in rows:
+            logger.info(f"{'SLOWER' if row['regressed'] else 'ok    '} {row['name']:<40} {row['before_us']:10.2f} -> {row['after_us']:10.2f}us/op {row['change_pct']:+6.1f}% (best {row['best_change_pct']:+.1f}%)")
+        if baseline.get("platform") != current.get("platform") or baseline.get("python") != current.get("python"):
+            logger.warning("The baseline was measured on another platform or python, differences may not come from the code")
+        sys.exit(1 if any(row["regressed"] for row in rows) else 0)
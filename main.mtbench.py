@@ -0,0 +1,83 @@
+from core import InitLogger, Setting
+from AlicloudApiTranslator import AlicloudApiTranslator
+from LocalMtTranslator import LocalMtTranslator
+import time
+import argparse
+import logging
+import logging.handlers
+logger = logging.getLogger("VRChatParaformerAsr")
+
+SAMPLE_TEXTS = {
+    "zh": ["你好。", "今天晚上一起去那个世界看看吧。", "等一下，我的麦克风好像有点问题。", "这个地图的灯光做得真好看，作者花了很多心思吧。", "我先去喝口水，马上回来。", "你是从哪里来的？", "明天同一时间还在这里集合，别忘了叫上大家。", "谢谢！"],
+    "en": ["Hello.", "Let's visit that world together tonight.", "Wait, my microphone seems to have a problem.", "The lighting in this map is beautiful, the author must have put a lot of work into it.", "I'll grab some water and be right back.", "Where are you from?", "Let's meet here again at the same time tomorrow, don't forget to bring everyone.", "Thanks!"],
+}
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def bench(translator, src_lang: str, dst_lang: str, texts: list[str], rounds: int, batch_size: int) -> dict:
+    # Warm up, so model loading and connection setup are not counted
+    translator.translate(src_lang, dst_lang, "", texts[0])
+    latencies = []
+    for _ in range(rounds):
+        for text in texts:
+            start = time.perf_counter()
+            translator.translate(src_lang, dst_lang, "", text)
+            latencies.append((time.perf_counter() - start) * 1000)
+    batch = (texts * (batch_size // len(texts) + 1))[:batch_size]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        translator.translate_batch(src_lang, dst_lang, batch)
+    batch_s = time.perf_counter() - start
+    return {
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "sentences_per_s": len(latencies) / (sum(latencies) / 1000),
+        "batch_sentences_per_s": rounds * batch_size / batch_s,
+        "sample": translator.translate(src_lang, dst_lang, "", texts[-2]),
+    }
+
+
+if __name__ in {"__main__", "__mp_main__"}:
+    # ============
+    # Logger
+    InitLogger()
+
+    # =======================
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description='Compare latency and throughput of the cloud and the local translator')
+    parser.add_argument('--setting', type=str, default='setting.json', help='The path to `setting.json` with the Alicloud keys and `local_mt_dir`. Default `setting.json`.')
+    parser.add_argument('--src', type=str, default='zh', help='Source language. Default zh.')
+    parser.add_argument('--dst', type=str, default='en', help='Destination language. Default en.')
+    parser.add_argument('--texts', type=str, default=None, help='A text file with one sentence per line, instead of the built-in samples.')
+    parser.add_argument('--rounds', type=int, default=3, help='Times every sentence is translated. Default 3.')
+    parser.add_argument('--batch-size', type=int, default=16, help='Sentences per batch for the throughput test. Default 16.')
+    parser.add_argument('--engines', type=str, default='cloud,local', help='Comma separated engines to compare. Default cloud,local.')
+    args = parser.parse_args()
+
+    setting = Setting()
+    with open(args.setting, "rt") as f:
+        setting.deserialize(f.read())
+    if args.texts:
+        with open(args.texts, "rt", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = SAMPLE_TEXTS[args.src]
+
+    # =======================
+    # Benchmark
+    for engine in args.engines.split(","):
+        if engine == "cloud":
+            translator = AlicloudApiTranslator()
+            translator.init_client(setting.alicloud_access_key_id, setting.alicloud_access_key_secret, setting.alicloud_endpoint)
+        else:
+            translator = LocalMtTranslator(setting.local_mt_dir, setting.local_mt_num_threads)
+        report = bench(translator, args.src, args.dst, texts, args.rounds, args.batch_size)
+        logger.info(
+            f"[{engine}] {args.src}->{args.dst}: p50 {report['p50_ms']:.1f}ms p95 {report['p95_ms']:.1f}ms, "
+            f"{report['sentences_per_s']:.1f} sentences/s one by one, {report['batch_sentences_per_s']:.1f} sentences/s in batches of {args.batch_size}"
+        )
+        logger.info(f"[{engine}] {report['sample']}")
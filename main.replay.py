@@ -0,0 +1,28 @@
+from core import InitLogger
+from CaptureReplay import replay
+import asyncio
+import argparse
+import logging
+import logging.handlers
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+if __name__ in {"__main__", "__mp_main__"}:
+    # ============
+    # Logger
+    InitLogger()
+
+    # =======================
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description='Replay a capture recorded by VRChatParaformerAsr against a local fake ASR server')
+    parser.add_argument('capture', type=str, help='The `.vrccap` file to replay.')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay N times faster than real time, 0 for as fast as possible. Default 1.')
+    parser.add_argument('--osc-port', type=int, default=9001, help='Local UDP port receiving the OSC output. Default 9001.')
+    parser.add_argument('--local-endpointing', action='store_true', help='Replay with local endpointing and report how much earlier text is shown.')
+    args = parser.parse_args()
+
+    # =======================
+    # Replay
+    report = asyncio.run(replay(args.capture, args.speed, args.osc_port, args.local_endpointing))
+    for key, value in report.items():
+        logger.info(f"{key}: {value}")
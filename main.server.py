@@ -0,0 +1,56 @@
+from core import InitLogger, Setting
+from RecognitionServer import SessionPool, RecognitionServer, load_test
+import asyncio
+import argparse
+import logging
+import logging.handlers
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+if __name__ in {"__main__", "__mp_main__"}:
+    # ============
+    # Logger
+    InitLogger()
+
+    # =======================
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description='Headless recognition server for many clients streaming pcm over websocket or UDP')
+    parser.add_argument('--setting', type=str, default='setting.json', help='The path to `setting.json`, its `api_key` is used when `--api-keys` is not given. Default `setting.json`.')
+    parser.add_argument('--host', type=str, default='0.0.0.0', help='Listen address. Default 0.0.0.0.')
+    parser.add_argument('--port', type=int, default=8765, help='Websocket port, clients connect to ws://host:port/asr. Default 8765.')
+    parser.add_argument('--udp-port', type=int, default=None, help='Also accept raw pcm datagrams on this UDP port.')
+    parser.add_argument('--api-keys', type=str, default=None, help='Comma separated Dashscope API keys to spread sessions over.')
+    parser.add_argument('--sessions-per-key', type=int, default=4, help='Concurrent sessions allowed per API key, further clients are told to come back later. Default 4.')
+    parser.add_argument('--idle-timeout', type=float, default=10, help='Seconds without audio before a UDP client is released. Default 10.')
+    parser.add_argument('--load-test', type=str, default=None, help='Comma separated client counts, e.g. `10,50,100`: ramp simulated clients against a local fake ASR server and report sessions per core.')
+    parser.add_argument('--load-test-seconds', type=float, default=20, help='Duration of each load test step. Default 20.')
+    parser.add_argument('--fast-events', action='store_true', help='Parse recognition responses into the lightweight `RecognitionEvent` instead of SDK objects.')
+    args = parser.parse_args()
+
+    # =======================
+    # Load test
+    if args.load_test is not None:
+        steps = [int(n) for n in args.load_test.split(",")]
+        asyncio.run(load_test(steps, args.load_test_seconds, fast_events=args.fast_events))
+    else:
+        # =======================
+        # API keys
+        if args.api_keys:
+            api_keys = [key.strip() for key in args.api_keys.split(",") if key.strip()]
+        else:
+            with open(args.setting, "rt") as f:
+                setting: Setting = Setting()
+                setting.deserialize(f.read())
+            api_keys = [setting.api_key]
+
+        # =======================
+        # Serve forever
+        async def main():
+            pool = SessionPool(api_keys, args.sessions_per_key, fast_events=args.fast_events)
+            server = RecognitionServer(pool, args.host, args.port, args.udp_port, args.idle_timeout)
+            await server.start()
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await server.stop()
+        asyncio.run(main())
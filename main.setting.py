@@ -1,19 +1,53 @@
 from core import Setting, InitLogger, get_micro_id2name
+from ControlChannel import ControlClient, read_control_token, format_message
 import nicegui.elements
 import nicegui.elements.input
 from nicegui import ui, app
 import re
+import json
+import asyncio
 import os
 import platform
 import hashlib
 import pyaudio
 import argparse
+import collections
 import logging
 import logging.handlers
 
 logger = logging.getLogger("VRChatParaformerAsr")
 setting_filepath = None
 
+# ===============
+# Live state of the running recognizer, from the control channel
+control_client: ControlClient = None
+live_status: dict = {}
+live_messages: collections.deque[tuple[int, dict]] = collections.deque(maxlen=100)
+live_message_count = 0
+
+def on_control_message(message: dict):
+    global live_message_count
+    if message["type"] == "status":
+        live_status.clear()
+        live_status.update(message)
+    elif message["type"] in ("transcript", "latency", "applied", "usage"):
+        live_message_count += 1
+        live_messages.append((live_message_count, message))
+
+def format_live_status() -> str:
+    if not control_client or not control_client.connected:
+        return "Recognizer not running"
+    health = live_status.get("health", {})
+    pipeline = live_status.get("pipeline", {})
+    text = f"{health.get('state', '?')}"
+    if health.get("last_error"):
+        text += f" | last error: {health['last_error']}"
+    if health.get("retry_in_s"):
+        text += f" | retry in {health['retry_in_s']:.0f}s"
+    if pipeline:
+        text += f" | backlog {pipeline.get('backlog_ms', 0):.0f}ms, sent {pipeline.get('sent_ms', 0) / 1000:.0f}s" + (" | uplink stalled" if pipeline.get("stalled") else "")
+    return text
+
 # ===============
 # UI
 def is_valid_ip(ip):
@@ -61,9 +95,20 @@ async def homepage():
             ctl_api_key = ui.input(
                 label="Dashscope API Key",
             )
+        with ui.row():
+            ctl_asr_engine = ui.select(
+                options={"cloud": "Cloud", "local": "Local", "local_fallback": "Local when cloud unreachable"},
+                label="ASR Engine",
+                value="cloud",
+            ).tooltip("Local recognizes on this PC without network, it needs `pip install sherpa-onnx numpy` and a model.")
+            ctl_local_model_dir = ui.input(
+                label="Local Model Directory",
+                placeholder="sherpa-onnx-streaming-paraformer-bilingual-zh-en",
+            ).tooltip("Directory with tokens.txt, encoder.int8.onnx and decoder.int8.onnx")
 
     with ui.row():
         ctl_enable_translate = ui.checkbox("Enable translation")
+        ctl_translate_two_phase = ui.checkbox("Show transcript first").tooltip("Send the transcript when the sentence ends and add the translation when it arrives, instead of waiting for it.")
     with ui.card():
         with ui.row():
             langs = {
@@ -84,6 +129,13 @@ async def homepage():
                 new_value_mode="add-unique",
                 value="ja",
             ).tooltip("Language of the translated text.")
+            ctl_extra_dst_langs = ui.select(
+                options=langs,
+                label="Extra Destination Languages",
+                new_value_mode="add-unique",
+                multiple=True,
+                value=[],
+            ).tooltip("More languages translated in the same round trip.")
             ui.link("Complete language code list", "https://help.aliyun.com/zh/machine-translation/support/supported-languages-and-codes?spm=api-workbench.api_explorer.0.0.3d374eecSIT7xn")
         with ui.row():
             ctl_alicloud_access_key_id = ui.input(
@@ -99,6 +151,15 @@ async def homepage():
                 placeholder='mt.cn-hangzhou.aliyuncs.com',
             ).tooltip("Service endpoint to access. Generally no modification is necessary.")
             ui.link("Complete endpoint list", "https://help.aliyun.com/zh/machine-translation/developer-reference/api-alimt-2018-10-12-endpoint?spm=a2c4g.11186623.0.0.1067c747e9ZNcY")
+        with ui.row():
+            ctl_translate_engine = ui.select(
+                options={"cloud": "Cloud", "local": "Local", "local_short": "Local for short sentences", "race": "Whichever answers first"},
+                label="Translation Engine",
+                value="cloud",
+            ).tooltip("Local translates on this PC, it needs `pip install ctranslate2 sentencepiece` and models. Cloud failures fall back to local.")
+            ctl_local_mt_dir = ui.input(
+                label="Local MT Model Directory",
+            ).tooltip("One converted Opus-MT model per language pair, e.g. zh-en, zh-ja")
 
     with ui.row():
         btn_save = ui.button("Save", color="green")
@@ -106,7 +167,12 @@ async def homepage():
         with ui.row():
             btn_load_default_setting = ui.button("Load Default Setting")
             ctl_disfluency_removal_enabled = ui.checkbox("disfluency_removal_enabled")
+            ctl_local_endpointing = ui.checkbox("Local endpointing").tooltip("Show typing and commit the text as soon as your voice stops locally, the server result replaces it quietly if different.")
             ctl_dark_mode = ui.checkbox("UI dark mode")
+    with ui.card():
+        ui.label("Live:")
+        ctl_live_status = ui.label(format_live_status())
+        ctl_live_log = ui.log(max_lines=100)
     with ui.card():
         ui.label("Log:")
         ctl_log = ui.log(max_lines=100)
@@ -127,16 +193,23 @@ async def homepage():
     ctl_osc_enableSFX.bind_value(setting, "osc_enableSFX")
     ctl_micro_device_id.bind_value(setting, "micro_device_id")
     ctl_api_key.bind_value(setting, "api_key")
+    ctl_asr_engine.bind_value(setting, "asr_engine")
+    ctl_local_model_dir.bind_value(setting, "local_model_dir")
     ctl_disfluency_removal_enabled.bind_value(setting, "disfluency_removal_enabled")
+    ctl_local_endpointing.bind_value(setting, "local_endpointing")
     ctl_enable_translate.bind_value(setting, "enable_translate")
+    ctl_translate_two_phase.bind_value(setting, "translate_two_phase")
     ctl_src_lang.bind_value(setting, "src_lang")
     ctl_dst_lang.bind_value(setting, "dst_lang")
+    ctl_extra_dst_langs.bind_value(setting, "extra_dst_langs")
     ctl_alicloud_access_key_id.bind_value(setting, "alicloud_access_key_id")
     ctl_alicloud_access_key_secret.bind_value(setting, "alicloud_access_key_secret")
     ctl_alicloud_endpoint.bind_value(setting, "alicloud_endpoint")
+    ctl_translate_engine.bind_value(setting, "translate_engine")
+    ctl_local_mt_dir.bind_value(setting, "local_mt_dir")
 
     # Bind enabled
-    for ctl in [ctl_src_lang, ctl_dst_lang, ctl_alicloud_access_key_id, ctl_alicloud_access_key_secret, ctl_alicloud_endpoint]:
+    for ctl in [ctl_translate_two_phase, ctl_src_lang, ctl_dst_lang, ctl_extra_dst_langs, ctl_alicloud_access_key_id, ctl_alicloud_access_key_secret, ctl_alicloud_endpoint, ctl_translate_engine, ctl_local_mt_dir]:
         ctl: nicegui.elements.input.DisableableElement
         ctl.bind_enabled_from(setting, "enable_translate")
 
@@ -158,7 +231,31 @@ async def homepage():
         logger.info(f"Save setting into {setting_filepath}")
         with open(setting_filepath, "wt") as f:
             f.write(s)
-    btn_save.on_click(on_clicked_save_btn)
+    async def on_clicked_save_btn_and_apply():
+        on_clicked_save_btn()
+        # Apply to the running recognizer without restarting it
+        try:
+            applied = await control_client.push_setting(setting.__dict__) if control_client else None
+        except asyncio.TimeoutError:
+            applied = None
+        if applied is None:
+            ui.notify("Saved, restart the recognizer to apply")
+        elif applied["changed"]:
+            ui.notify(f"Applied in {applied['elapsed_ms']:.0f}ms" + (" (recognition restarted)" if applied["restarted"] else ""))
+        if applied and applied["rejected"]:
+            ui.notify(f"Restart the recognizer to apply {', '.join(applied['rejected'])}")
+    btn_save.on_click(on_clicked_save_btn_and_apply)
+
+    # Refresh live state
+    last_seen = live_message_count
+    def refresh_live():
+        nonlocal last_seen
+        ctl_live_status.set_text(format_live_status())
+        for n, message in live_messages:
+            if n > last_seen:
+                ctl_live_log.push(format_message(message))
+                last_seen = n
+    ui.timer(0.5, refresh_live)
 
     # Attach to logger
     class LogElementHandler(logging.Handler):
@@ -222,6 +319,15 @@ if __name__ in {"__main__", "__mp_main__"}:
     if not storage_key:
         storage_key = get_machine_identifier() # Otherwise use machine identifier
 
+    # Control channel to the running recognizer
+    control_port = Setting().control_port
+    if os.path.exists(setting_filepath):
+        with open(setting_filepath) as f:
+            control_port = json.loads(f.read()).get("control_port", control_port)
+    if control_port:
+        control_client = ControlClient(control_port, lambda: read_control_token(setting_filepath), on_message=on_control_message)
+        app.on_startup(control_client.run)
+
     # Register NiceGUI's events
     app.on_startup(lambda: logger.debug("NiceGUI startup"))
     app.on_connect(lambda: logger.debug("NiceGUI connect"))
@@ -0,0 +1,45 @@
+from core import InitLogger
+from SoakTest import SoakTest
+from NetworkImpairment import ImpairmentTimeline
+import sys
+import asyncio
+import argparse
+import logging
+import logging.handlers
+logger = logging.getLogger("VRChatParaformerAsr")
+
+
+if __name__ in {"__main__", "__mp_main__"}:
+    # ============
+    # Logger
+    InitLogger()
+
+    # =======================
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description='Soak the recognition pipeline against local fake ASR and MT servers, and check for leaks')
+    parser.add_argument('--hours', type=float, default=1, help='Simulated hours of audio. Default 1.')
+    parser.add_argument('--speed', type=float, default=30, help='Run N times faster than real time. Default 30.')
+    parser.add_argument('--reconnect-every', type=float, default=300, help='Force a reconnect every N simulated seconds. Default 300.')
+    parser.add_argument('--translator-failure-rate', type=float, default=0.1, help='Share of MT requests failing. Default 0.1.')
+    parser.add_argument('--asyncio', action='store_true', help='Soak `ARSWorkerAsync` instead of `ARSWorker`.')
+    parser.add_argument('--sample-interval', type=float, default=2, help='Seconds between samples. Default 2.')
+    parser.add_argument('--impairment', type=str, default=None, help='Json script of network latency, jitter, bandwidth, loss and disconnects over simulated time, see `NetworkImpairment.py`.')
+    parser.add_argument('--csv', type=str, default=None, help='Write every sample into this csv file.')
+    args = parser.parse_args()
+
+    # =======================
+    # Soak
+    soak = SoakTest(args.hours, args.speed, args.reconnect_every, args.translator_failure_rate, args.asyncio, args.sample_interval,
+                    impairment=ImpairmentTimeline.load(args.impairment) if args.impairment else None)
+    report = asyncio.run(soak.run())
+    if args.csv:
+        soak.write_csv(args.csv)
+
+    # =======================
+    # Trend report
+    for key, value in report.items():
+        if key != "trends":
+            logger.info(f"{key}: {value}")
+    for metric, trend in report["trends"].items():
+        logger.info(f"{'OK  ' if trend['ok'] else 'LEAK'} {metric}: {trend['first']:.1f} -> {trend['last']:.1f} (max {trend['max']:.1f}), growth {trend['growth']:+.2f} / limit {trend['limit']}")
+    sys.exit(0 if report["ok"] else 1)
@@ -0,0 +1,36 @@
+from UsageLedger import UsageLedger
+import argparse
+import datetime
+
+
+if __name__ in {"__main__", "__mp_main__"}:
+    # =======================
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description='Show the usage recorded by VRChatParaformerAsr: captured, sent, speech and billed audio, and MT characters')
+    parser.add_argument('--db', type=str, default='usage.sqlite3', help='The usage sqlite file, `usage_db` in the setting. Default `usage.sqlite3`.')
+    parser.add_argument('--by', type=str, default='day', choices=['day', 'api_key', 'session_id', 'day, api_key'], help='Group by. Default day.')
+    parser.add_argument('--days', type=int, default=None, help='Only the last N days.')
+    args = parser.parse_args()
+
+    since_day = None
+    if args.days is not None:
+        since_day = (datetime.date.today() - datetime.timedelta(days=args.days - 1)).isoformat()
+
+    # =======================
+    # Print a table
+    ledger = UsageLedger(args.db)
+    rows = ledger.query(args.by, since_day)
+    ledger.close()
+    keys = [key.strip() for key in args.by.split(",")]
+    print(" | ".join(keys + ["sessions", "captured(s)", "sent(s)", "speech(s)", "billed(s)", "billed/speech", "MT chars"]))
+    for row in rows:
+        ratio = row["billed_s"] / (row["speech_ms"] / 1000) if row["speech_ms"] else 0
+        print(" | ".join([str(row[key]) for key in keys] + [
+            str(row["sessions"]),
+            f"{row['captured_ms'] / 1000:.0f}",
+            f"{row['sent_ms'] / 1000:.0f}",
+            f"{row['speech_ms'] / 1000:.0f}",
+            f"{row['billed_s']:.0f}",
+            f"{ratio:.2f}",
+            f"{row['mt_chars']:.0f}",
+        ]))
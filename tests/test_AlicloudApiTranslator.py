@@ -0,0 +1,56 @@
+import time
+import socket
+import unittest
+
+from core import Setting
+from FakeAlimtServer import FakeAlimtServer
+from AlicloudApiTranslator import AlicloudApiTranslator
+
+
+class KeepaliveTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAlimtServer()
+        self.endpoint = self.server.start_in_thread()
+        self.translator = AlicloudApiTranslator()
+        self.translator.init_client("test", "test", self.endpoint)
+
+    def tearDown(self):
+        self.translator.stop_keepalive()
+        self.server.stop_in_thread()
+
+    def test_off_by_default(self):
+        # Every probe is a billed request
+        self.assertEqual(Setting().alicloud_keepalive_interval, 0)
+        translator = AlicloudApiTranslator.get_shared("keepalive-test", "test", self.endpoint)
+        # Only the warm-up, in the background
+        time.sleep(0.3)
+        self.assertIsNone(translator._keepalive_thread)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_warm_up(self):
+        self.assertGreater(self.translator.warm_up(), 0)
+        self.assertEqual(self.server.requests, 1)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            closed = f"http://127.0.0.1:{s.getsockname()[1]}"
+        self.translator.init_client("test", "test", closed)
+        with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+            self.assertEqual(self.translator.warm_up(connect_timeout_ms=500), -1)
+
+    def test_probes_only_while_idle(self):
+        self.translator.start_keepalive(0.2)
+        # Busy: a request more often than the interval
+        deadline = time.monotonic() + 0.6
+        while time.monotonic() < deadline:
+            self.translator.translate_multi("zh", ["ja"], "", ["你好"])
+            time.sleep(0.05)
+        busy_requests = self.server.requests
+        # Idle: a probe every interval or so
+        time.sleep(0.7)
+        self.translator.stop_keepalive()
+        probes = self.server.requests - busy_requests
+        self.assertTrue(2 <= probes <= 4, probes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import time
+import struct
+import unittest
+
+from AudioBacklog import AudioBacklog, BacklogPolicy
+
+FRAME_MS = 100
+SAMPLES = 16 * FRAME_MS
+
+
+def speech(level: int) -> bytes:
+    # A loud frame, told apart from others by its level
+    return struct.pack(f"<{SAMPLES}h", *([level] * SAMPLES))
+
+
+def silence() -> bytes:
+    return bytes(SAMPLES * 2)
+
+
+class TrimPolicyTest(unittest.TestCase):
+    def backlog(self, policy: str, max_backlog_ms: int = 300) -> AudioBacklog:
+        return AudioBacklog(sample_rate=16000, max_backlog_ms=max_backlog_ms, policy=policy)
+
+    def drain(self, backlog: AudioBacklog) -> list[bytes]:
+        frames = []
+        while (frame := backlog.pop()) is not None:
+            frames.append(frame)
+        return frames
+
+    def test_drop_silence_keeps_speech(self):
+        backlog = self.backlog(BacklogPolicy.DROP_SILENCE)
+        for frame in (speech(1000), silence(), speech(2000), silence(), speech(3000)):
+            backlog.append(frame)
+        self.assertEqual(self.drain(backlog), [speech(1000), speech(2000), speech(3000)])
+        self.assertEqual(backlog.get_stats()["dropped_ms"], 2 * FRAME_MS)
+
+    def test_drop_silence_then_oldest_speech(self):
+        backlog = self.backlog(BacklogPolicy.DROP_SILENCE)
+        for level in range(1000, 6000, 1000):
+            backlog.append(speech(level))
+        self.assertEqual(self.drain(backlog), [speech(3000), speech(4000), speech(5000)])
+
+    def test_drop_oldest(self):
+        backlog = self.backlog(BacklogPolicy.DROP_OLDEST)
+        for frame in (speech(1000), silence(), speech(2000), speech(3000), silence()):
+            backlog.append(frame)
+        self.assertEqual(self.drain(backlog), [speech(2000), speech(3000), silence()])
+
+    def test_fast_forward_keeps_only_the_newest(self):
+        backlog = self.backlog(BacklogPolicy.FAST_FORWARD)
+        for level in range(1000, 5000, 1000):
+            backlog.append(speech(level))
+        self.assertEqual(self.drain(backlog), [speech(4000)])
+        self.assertEqual(backlog.get_stats()["dropped_ms"], 3 * FRAME_MS)
+
+    def test_newest_frame_is_kept_even_if_over_the_bound(self):
+        backlog = self.backlog(BacklogPolicy.DROP_OLDEST, max_backlog_ms=50)
+        backlog.append(speech(1000))
+        backlog.append(speech(2000))
+        self.assertEqual(self.drain(backlog), [speech(2000)])
+
+    def test_unbounded_without_sample_rate(self):
+        backlog = AudioBacklog(sample_rate=None, max_backlog_ms=100)
+        for level in range(1000, 5000, 1000):
+            backlog.append(speech(level))
+        self.assertEqual(len(backlog), 4)
+
+    def test_stats(self):
+        backlog = self.backlog(BacklogPolicy.DROP_OLDEST, max_backlog_ms=1000)
+        for level in (1000, 2000, 3000):
+            backlog.append(speech(level))
+        backlog.pop()
+        stats = backlog.get_stats()
+        self.assertEqual((stats["backlog_frames"], stats["backlog_ms"], stats["sent_ms"], stats["dropped_ms"]), (2, 200, 100, 0))
+
+
+class StallTest(unittest.TestCase):
+    def test_nothing_sent_while_audio_waits(self):
+        backlog = AudioBacklog(sample_rate=16000, stall_timeout_ms=50)
+        backlog.append(silence())
+        self.assertFalse(backlog.is_stalled())
+        time.sleep(0.08)
+        self.assertTrue(backlog.is_stalled())
+        backlog.pop()
+        self.assertFalse(backlog.is_stalled())
+
+    def test_speech_sent_without_response(self):
+        backlog = AudioBacklog(sample_rate=16000, stall_timeout_ms=150)
+        time.sleep(0.2)
+        for _ in range(2):
+            backlog.append(speech(1000))
+            backlog.pop()
+        self.assertTrue(backlog.is_stalled())
+        backlog.ack()
+        self.assertFalse(backlog.is_stalled())
+
+    def test_silence_sent_without_response_is_not_a_stall(self):
+        backlog = AudioBacklog(sample_rate=16000, stall_timeout_ms=150)
+        time.sleep(0.2)
+        for _ in range(3):
+            backlog.append(silence())
+            backlog.pop()
+        self.assertFalse(backlog.is_stalled())
+
+
+if __name__ == "__main__":
+    unittest.main()
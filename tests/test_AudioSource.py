@@ -0,0 +1,168 @@
+import io
+import os
+import time
+import socket
+import struct
+import tempfile
+import unittest
+
+from AudioSource import FileSource, StdinSource, UdpSource, parse_rtp, _find_wav_data
+from CaptureRecorder import CaptureRecorder
+
+
+def pcm(samples: int) -> bytes:
+    return struct.pack(f"<{samples}h", *range(samples))
+
+
+def wav(data: bytes, sample_rate: int = 16000, channels: int = 1, extra_chunk: bytes = b"") -> bytes:
+    fmt = struct.pack("<HHIIHH", 1, channels, sample_rate, sample_rate * 2 * channels, 2 * channels, 16)
+    chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    if extra_chunk:
+        # Odd sized, followed by a pad byte
+        chunks += b"LIST" + struct.pack("<I", len(extra_chunk)) + extra_chunk + b"\x00" * (len(extra_chunk) & 1)
+    chunks += b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+
+def rtp(payload: bytes, csrcs: int = 0, extension_words: int = 0, padding: int = 0) -> bytes:
+    first = 0x80 | csrcs | (0x10 if extension_words else 0) | (0x20 if padding else 0)
+    packet = struct.pack("!BBHII", first, 96, 1, 160, 0x1234) + bytes(4 * csrcs)
+    if extension_words:
+        packet += struct.pack("!HH", 0xbede, extension_words) + bytes(4 * extension_words)
+    packet += payload
+    if padding:
+        packet += bytes(padding - 1) + bytes([padding])
+    return packet
+
+
+class WavTest(unittest.TestCase):
+    def test_data_after_other_chunks(self):
+        data = pcm(10)
+        buffer = wav(data, extra_chunk=b"abc")
+        offset, size = _find_wav_data(buffer)
+        self.assertEqual(buffer[offset:offset + size], data)
+
+    def test_only_16k_mono(self):
+        with self.assertRaises(ValueError):
+            _find_wav_data(wav(pcm(10), sample_rate=44100))
+        with self.assertRaises(ValueError):
+            _find_wav_data(wav(pcm(10), channels=2))
+        with self.assertRaises(ValueError):
+            _find_wav_data(b"RIFF\x00\x00\x00\x00AVI LIST")
+
+
+class FileSourceTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_wav(self, data: bytes) -> str:
+        path = os.path.join(self.directory.name, "a.wav")
+        with open(path, "wb") as f:
+            f.write(wav(data))
+        return path
+
+    async def read_all(self, source, limit: int = 100) -> list[bytes]:
+        frames = []
+        while len(frames) < limit and (frame := await source.read()) is not None:
+            frames.append(bytes(frame))
+        return frames
+
+    async def test_wav_in_frames(self):
+        # 2.5 frames of 10ms
+        data = pcm(400)
+        source = FileSource(self.write_wav(data), realtime=False, frame_ms=10)
+        source.start()
+        frames = await self.read_all(source)
+        source.stop()
+        self.assertEqual([len(frame) for frame in frames], [320, 320, 160])
+        self.assertEqual(b"".join(frames), data)
+        self.assertTrue(source.ended)
+
+    async def test_loop(self):
+        data = pcm(320)
+        source = FileSource(self.write_wav(data), realtime=False, loop=True, frame_ms=10)
+        source.start()
+        frames = await self.read_all(source, limit=5)
+        source.stop()
+        self.assertEqual(b"".join(frames), data * 2 + data[:320])
+        self.assertIsNone(await source.read())
+        self.assertTrue(source.ended)
+
+    async def test_realtime_paces_frames(self):
+        source = FileSource(self.write_wav(pcm(1600)), realtime=True, frame_ms=20)
+        source.start()
+        started = time.monotonic()
+        frames = await self.read_all(source)
+        elapsed = time.monotonic() - started
+        source.stop()
+        self.assertEqual(len(frames), 5)
+        # The last frame is due after 4 frames of audio
+        self.assertGreaterEqual(elapsed, 0.075)
+
+    async def test_capture_audio(self):
+        path = os.path.join(self.directory.name, "a.vrccap")
+        recorder = CaptureRecorder(path, sample_rate=16000)
+        recorder.record_audio(pcm(100))
+        recorder.record_osc("/chatbox/input", ["x", True, True])
+        recorder.record_audio(pcm(50))
+        recorder.close()
+        source = FileSource(path, realtime=False)
+        source.start()
+        frames = await self.read_all(source)
+        source.stop()
+        self.assertEqual(frames, [pcm(100), pcm(50)])
+
+
+class StdinSourceTest(unittest.IsolatedAsyncioTestCase):
+    async def test_whole_frames_then_the_rest(self):
+        data = pcm(800)
+        source = StdinSource(io.BytesIO(data), frame_ms=20)
+        source.start()
+        frames = [await source.read() for _ in range(3)]
+        self.assertEqual([len(frame) for frame in frames], [640, 640, 320])
+        self.assertEqual(b"".join(frames), data)
+        self.assertIsNone(await source.read())
+        self.assertTrue(source.ended)
+
+
+class RtpTest(unittest.TestCase):
+    def test_payload(self):
+        payload = pcm(4)
+        self.assertEqual(bytes(parse_rtp(rtp(payload))), payload)
+        self.assertEqual(bytes(parse_rtp(rtp(payload, csrcs=2, extension_words=1, padding=4))), payload)
+
+    def test_not_rtp(self):
+        with self.assertRaises(ValueError):
+            parse_rtp(b"\x00" * 20)
+        with self.assertRaises(ValueError):
+            parse_rtp(b"\x80\x60")
+
+
+class UdpSourceTest(unittest.IsolatedAsyncioTestCase):
+    def source(self, **kwargs) -> tuple[UdpSource, socket.socket]:
+        source = UdpSource(host="127.0.0.1", port=0, frame_ms=20, **kwargs)
+        source.start()
+        self.addCleanup(source.stop)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(sender.close)
+        return source, sender
+
+    async def test_raw_pcm_and_silence_while_nothing_arrives(self):
+        source, sender = self.source()
+        self.assertEqual(await source.read(), bytes(640))
+        sender.sendto(pcm(100), ("127.0.0.1", source.port))
+        self.assertEqual(await source.read(), pcm(100))
+
+    async def test_rtp_is_converted_to_little_endian(self):
+        source, sender = self.source(rtp=True)
+        sender.sendto(b"not rtp", ("127.0.0.1", source.port))
+        sender.sendto(rtp(struct.pack("!3h", 1, -2, 300)), ("127.0.0.1", source.port))
+        self.assertEqual(bytes(await source.read()), struct.pack("<3h", 1, -2, 300))
+        self.assertEqual((source.datagrams, source.invalid), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
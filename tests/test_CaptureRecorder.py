@@ -0,0 +1,76 @@
+import os
+import json
+import tempfile
+import unittest
+
+from CaptureRecorder import CaptureRecorder, CaptureReader, RECORD_AUDIO, RECORD_RESPONSE, RECORD_OSC, FILE_HEADER, SEGMENT_HEADER
+from CaptureReplay import load_capture
+from RecognitionEvent import RecognitionEvent
+
+
+class CaptureRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "a.vrccap")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self, segment_bytes: int = 256 * 1024):
+        recorder = CaptureRecorder(self.path, sample_rate=16000, segment_bytes=segment_bytes)
+        recorder.record_audio(bytes(3200))
+        recorder.record_audio(b"\x01\x00" * 1600)
+        sentence = {"begin_time": 0, "end_time": 200, "text": "你好"}
+        recorder.record_response(RecognitionEvent(200, "task", {"sentence": sentence}))
+        recorder.record_osc("/chatbox/input", ["你好", True, True])
+        recorder.close()
+        # Nothing after close
+        recorder.record_audio(bytes(3200))
+
+    def read(self) -> list[tuple[int, float, bytes]]:
+        reader = CaptureReader(self.path)
+        try:
+            return [(kind, t, bytes(payload)) for kind, t, payload in reader]
+        finally:
+            reader.close()
+
+    def test_records_come_back_in_order(self):
+        self.record()
+        records = self.read()
+        self.assertEqual([kind for kind, _, _ in records], [RECORD_AUDIO, RECORD_AUDIO, RECORD_RESPONSE, RECORD_OSC])
+        self.assertEqual(records[1][2], b"\x01\x00" * 1600)
+        self.assertEqual(json.loads(records[2][2])["output"]["sentence"]["text"], "你好")
+        self.assertEqual(json.loads(records[3][2]), ["/chatbox/input", ["你好", True, True]])
+        times = [t for _, t, _ in records]
+        self.assertEqual(times, sorted(times))
+
+    def test_cut_off_capture_reads_up_to_its_last_segment(self):
+        # One record per segment
+        self.record(segment_bytes=1)
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 5)
+        with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+            records = self.read()
+        self.assertEqual([kind for kind, _, _ in records], [RECORD_AUDIO, RECORD_AUDIO, RECORD_RESPONSE])
+
+    def test_not_a_capture(self):
+        with open(self.path, "wb") as f:
+            f.write(bytes(FILE_HEADER.size + SEGMENT_HEADER.size))
+        with self.assertRaises(ValueError):
+            CaptureReader(self.path)
+
+    def test_responses_are_scripted_by_audio_position(self):
+        self.record()
+        reader = CaptureReader(self.path)
+        audio, script, osc = load_capture(reader)
+        self.assertEqual(len(audio), 2)
+        self.assertEqual(len(script), 1)
+        self.assertEqual(script[0].audio_ms, 200)
+        self.assertGreaterEqual(script[0].delay_s, 0)
+        self.assertEqual(osc[0][1:], ("/chatbox/input", ["你好", True, True]))
+        audio.clear()
+        reader.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
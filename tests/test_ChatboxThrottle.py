@@ -0,0 +1,66 @@
+import time
+import asyncio
+import unittest
+
+from ChatboxThrottle import ChatboxThrottle
+
+
+class ChatboxThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.sent: list[tuple[str, bool, float]] = []
+        self.throttle = ChatboxThrottle(lambda text, sfx: self.sent.append((text, sfx, time.monotonic())), min_interval_ms=100)
+
+    def test_latest_message_replaces_waiting_ones(self):
+        self.throttle.send("a", True)
+        self.throttle.send("b", True)
+        self.throttle.send("c", False)
+        self.throttle.send("d", False)
+        self.assertEqual([text for text, _, _ in self.sent], ["a"])
+        time.sleep(0.2)
+        self.assertEqual([(text, sfx) for text, sfx, _ in self.sent], [("a", True), ("d", True)])
+        self.assertGreaterEqual(self.sent[1][2] - self.sent[0][2], 0.09)
+        self.assertEqual((self.throttle.sent, self.throttle.replaced), (2, 2))
+
+    def test_spaced_messages_go_out_at_once(self):
+        self.throttle.send("a", False)
+        time.sleep(0.12)
+        self.throttle.send("b", False)
+        self.assertEqual([text for text, _, _ in self.sent], ["a", "b"])
+        self.assertEqual(self.throttle.wait_s(), 0.0)
+
+    def test_close_sends_the_waiting_message_and_nothing_after(self):
+        self.throttle.send("a", False)
+        self.throttle.send("b", False)
+        self.assertGreater(self.throttle.wait_s(), 0)
+        self.throttle.close()
+        self.assertEqual([text for text, _, _ in self.sent], ["a", "b"])
+        self.throttle.send("c", False)
+        time.sleep(0.2)
+        self.assertEqual([text for text, _, _ in self.sent], ["a", "b"])
+
+    def test_close_without_flush_drops_the_waiting_message(self):
+        self.throttle.send("a", False)
+        self.throttle.send("b", False)
+        self.throttle.close(flush=False)
+        time.sleep(0.2)
+        self.assertEqual([text for text, _, _ in self.sent], ["a"])
+
+
+class ChatboxThrottleLoopTest(unittest.IsolatedAsyncioTestCase):
+    async def test_waits_on_the_loop_and_close_cancels(self):
+        sent = []
+        throttle = ChatboxThrottle(lambda text, sfx: sent.append(text), min_interval_ms=100, loop=asyncio.get_running_loop())
+        throttle.send("a", False)
+        throttle.send("b", False)
+        await asyncio.sleep(0.2)
+        self.assertEqual(sent, ["a", "b"])
+        throttle.send("c", False)
+        throttle.send("d", False)
+        await asyncio.sleep(0)
+        throttle.close(flush=False)
+        await asyncio.sleep(0.2)
+        self.assertEqual(sent, ["a", "b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
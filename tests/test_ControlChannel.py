@@ -0,0 +1,99 @@
+import os
+import json
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import aiohttp
+
+from ControlChannel import ControlServer, issue_control_token, read_control_token, control_token_path, format_message
+from HedgedAsr import SentenceHedge
+from RecognitionEvent import RecognitionEvent
+
+
+class ControlTokenTest(unittest.TestCase):
+    def test_issued_next_to_the_setting_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            setting_path = os.path.join(directory, "setting.json")
+            with open(setting_path, "wt") as f:
+                f.write('{"api_key": "sk"}')
+            first = issue_control_token(setting_path)
+            second = issue_control_token(setting_path)
+            self.assertNotEqual(first, second)
+            self.assertEqual(read_control_token(setting_path), second)
+            # Left as the user wrote it
+            with open(setting_path) as f:
+                self.assertEqual(f.read(), '{"api_key": "sk"}')
+            self.assertEqual(sorted(os.listdir(directory)), ["setting.control_token", "setting.json"])
+
+    def test_missing_token_reads_empty(self):
+        with tempfile.TemporaryDirectory() as directory:
+            setting_path = os.path.join(directory, "setting.json")
+            self.assertFalse(os.path.exists(control_token_path(setting_path)))
+            self.assertEqual(read_control_token(setting_path), "")
+
+
+class FormatMessageTest(unittest.TestCase):
+    def test_every_latency_message(self):
+        # One of each `publish({"type": "latency", ...})` in the repo
+        messages = [
+            {"type": "latency", "early_gain_ms": 420.5},
+            {"type": "latency", "translation_patch_ms": 812.0, "translation_late": True},
+            {"type": "latency", "mt_ms": 95.3, "sentences": 2},
+            {"type": "latency", "translator_ms": 120.0, "asr_ms": 310.2, "mic_ms": 15.0, "ready_ms": 310.9, "buffered_ms": 300.0},
+            {"type": "latency", "task_start_ms": 80.1, "handshake_ms": None},
+        ]
+        hedge = SentenceHedge(SimpleNamespace(on_event=lambda result: None), ["cn", "intl"], publish=messages.append)
+        final = {"begin_time": 0, "end_time": 1000, "text": "你好"}
+        hedge.on_event(1, RecognitionEvent(200, "task", {"sentence": final}))
+        hedge.on_event(0, RecognitionEvent(200, "task", {"sentence": final}))
+        self.assertEqual(messages[-1]["hedge_winner"], "intl")
+        for message in messages:
+            with self.subTest(message=message):
+                line = format_message(message)
+                self.assertNotIn("type=", line)
+        self.assertIn("hedge_winner=intl", format_message(messages[-1]))
+        self.assertEqual(format_message(messages[1]), "translation_patch_ms=812 translation_late=True")
+        self.assertEqual(format_message(messages[4]), "task_start_ms=80 handshake_ms=None")
+
+    def test_other_messages(self):
+        self.assertEqual(format_message({"type": "transcript", "text": "你好", "translated": "hello"}), "你好 (hello)")
+        self.assertEqual(format_message({"type": "transcript", "text": "你好", "translated": None}), "你好")
+        self.assertEqual(format_message({"type": "applied", "changed": ["dst_lang"], "rejected": [], "restarted": False, "elapsed_ms": 3.2}),
+                         "applied ['dst_lang'] in 3ms")
+
+
+class ControlServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.setting = SimpleNamespace(dst_lang="ja", api_key="sk")
+        self.server = ControlServer(self.setting, 0, "secret", {"dst_lang"}, status_interval_s=60)
+        await self.server.start()
+        self.url = f"ws://127.0.0.1:{self.server.port}/control"
+        self.session = aiohttp.ClientSession()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.server.stop()
+
+    async def test_handshake_needs_token_and_no_origin(self):
+        for headers in ({}, {"Authorization": "Bearer wrong"}, {"Authorization": "Bearer secret", "Origin": "http://example.com"}):
+            with self.subTest(headers=headers):
+                with self.assertRaises(aiohttp.WSServerHandshakeError) as raised:
+                    await self.session.ws_connect(self.url, headers=headers)
+                self.assertEqual(raised.exception.status, 403)
+
+    async def test_malformed_frames_are_ignored(self):
+        async with self.session.ws_connect(self.url, headers={"Authorization": "Bearer secret"}) as ws:
+            for frame in ("{not json", "[1, 2]", '{"type": "setting", "setting": "dst_lang"}'):
+                await ws.send_str(frame)
+            await ws.send_str(json.dumps({"type": "setting", "setting": {"dst_lang": "en", "api_key": "stolen"}}))
+            applied = await ws.receive_json(timeout=5)
+        self.assertEqual(applied["type"], "applied")
+        self.assertEqual(applied["changed"], ["dst_lang"])
+        self.assertEqual(applied["rejected"], ["api_key"])
+        self.assertEqual(self.setting.dst_lang, "en")
+        self.assertEqual(self.setting.api_key, "sk")
+
+
+if __name__ == "__main__":
+    unittest.main()
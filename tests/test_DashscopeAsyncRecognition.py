@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+
+from FakeDashscopeServer import FakeDashscopeServer
+from DashscopeAsyncRecognition import DashscopeAsyncRecognition
+from DashscopeCustomRecognition import DashscopeCustomRecognitionCallback
+
+
+class RecordingCallback(DashscopeCustomRecognitionCallback):
+    def __init__(self):
+        self.sentences = []
+        self.completed = False
+
+    def on_event(self, result) -> None:
+        self.sentences.append(result.get_sentence())
+
+    def on_complete(self) -> None:
+        self.completed = True
+
+
+class FinishedPayloadTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fake = FakeDashscopeServer()
+        self.url = await self.fake.start()
+
+    async def asyncTearDown(self):
+        await self.fake.stop()
+
+    async def recognize(self, fast_events: bool) -> RecordingCallback:
+        recognition = DashscopeAsyncRecognition("paraformer-realtime-v1", "pcm", 16000, api_key="test", url=self.url, fast_events=fast_events)
+        await recognition.start()
+        callback = RecordingCallback()
+        dispatch = asyncio.create_task(recognition.dispatch(callback))
+        await recognition.send_audio_frame(bytes(3200))
+        await recognition.stop()
+        await dispatch
+        return callback
+
+    async def test_last_sentence_in_task_finished(self):
+        last = {"begin_time": 0, "end_time": 100, "text": "最后一句", "words": []}
+        self.fake.finished_payload = {"output": {"sentence": last}, "usage": {"duration": 1}}
+        for fast_events in (False, True):
+            with self.subTest(fast_events=fast_events):
+                callback = await self.recognize(fast_events)
+                self.assertEqual(callback.sentences[-1]["text"], "最后一句")
+                self.assertTrue(callback.completed)
+
+    async def test_empty_task_finished_only_completes(self):
+        callback = await self.recognize(False)
+        self.assertEqual(callback.sentences, [])
+        self.assertTrue(callback.completed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+
+from FakeDashscopeServer import FakeDashscopeServer
+from DashscopeAsyncRecognition import DashscopeAsyncRecognition
+from DashscopeConnection import DashscopeConnectionPool, build_headers
+from DashscopeCustomRecognition import DashscopeCustomRecognitionCallback
+
+
+class ConnectionPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fake = FakeDashscopeServer()
+        self.url = await self.fake.start()
+        self.pool = DashscopeConnectionPool(self.url, api_key="test")
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        await self.fake.stop()
+
+    async def recognize(self, finish: bool = True) -> DashscopeAsyncRecognition:
+        recognition = DashscopeAsyncRecognition("paraformer-realtime-v1", "pcm", 16000, connection_pool=self.pool)
+        await recognition.start()
+        dispatch = asyncio.create_task(recognition.dispatch(DashscopeCustomRecognitionCallback()))
+        await recognition.send_audio_frame(bytes(3200))
+        if finish:
+            await recognition.stop()
+        else:
+            await recognition.close()
+        await dispatch
+        return recognition
+
+    async def test_tasks_share_one_connection(self):
+        first = await self.recognize()
+        second = await self.recognize()
+        self.assertEqual((self.fake.connections, self.fake.tasks), (1, 2))
+        self.assertEqual((self.pool.stats["connects"], self.pool.stats["reuses"]), (1, 1))
+        self.assertGreater(first.handshake_ms, 0)
+        self.assertEqual(second.handshake_ms, 0)
+
+    async def test_unfinished_task_does_not_give_its_connection_back(self):
+        await self.recognize(finish=False)
+        await self.recognize()
+        self.assertEqual(self.fake.connections, 2)
+        self.assertEqual(self.pool.stats["reuses"], 0)
+
+    async def test_closed_or_old_idle_connections_are_replaced(self):
+        connection = await self.pool.acquire()
+        await self.pool.release(connection)
+        await connection.ws.close()
+        self.assertIsNot(await self.pool.acquire(), connection)
+        self.pool.idle_timeout_s = 0
+        connection = await self.pool.acquire()
+        await self.pool.release(connection)
+        self.assertIsNot(await self.pool.acquire(), connection)
+        self.assertEqual(self.pool.stats["reuses"], 0)
+
+    async def test_fresh_and_max_idle(self):
+        first, second = await self.pool.acquire(), await self.pool.acquire()
+        await self.pool.release(first)
+        await self.pool.release(second)
+        self.assertFalse(first.ws.closed)
+        self.assertTrue(second.ws.closed)
+        self.assertIsNot(await self.pool.acquire(fresh=True), first)
+        reused = await self.pool.acquire()
+        self.assertIs(reused, first)
+        self.assertTrue(reused.reused)
+
+    async def test_shared_per_loop_and_credentials(self):
+        pool = DashscopeConnectionPool.get_shared(self.url, "test")
+        self.assertIs(DashscopeConnectionPool.get_shared(self.url, "test"), pool)
+        self.assertIsNot(DashscopeConnectionPool.get_shared(self.url, "other"), pool)
+        await DashscopeConnectionPool.close_shared()
+        self.assertIsNot(DashscopeConnectionPool.get_shared(self.url, "test"), pool)
+        await DashscopeConnectionPool.close_shared()
+
+
+class HeadersTest(unittest.TestCase):
+    def test_headers(self):
+        headers = build_headers("sk-test", "ws-1")
+        self.assertEqual(headers["Authorization"], "bearer sk-test")
+        self.assertEqual(headers["X-DashScope-WorkSpace"], "ws-1")
+        self.assertNotIn("X-DashScope-WorkSpace", build_headers("sk-test"))
+
+
+if __name__ == "__main__":
+    unittest.main()
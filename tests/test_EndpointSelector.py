@@ -0,0 +1,124 @@
+import math
+import unittest
+
+from EndpointSelector import EndpointSelector
+
+
+class Probe:
+    """Round trip seconds per endpoint, an exception to fail."""
+    def __init__(self, **rtts):
+        self.rtts = rtts
+        self.calls = []
+
+    def __call__(self, endpoint: str) -> float:
+        self.calls.append(endpoint)
+        rtt = self.rtts[endpoint]
+        if isinstance(rtt, Exception):
+            raise rtt
+        return rtt
+
+
+class EndpointSelectorTest(unittest.TestCase):
+    def selector(self, probe: Probe, **kwargs) -> EndpointSelector:
+        return EndpointSelector("test", ["a", "b", "c"], probe, **kwargs)
+
+    def test_first_candidate_until_probed(self):
+        selector = self.selector(Probe(a=0.1, b=0.05, c=0.2))
+        self.assertEqual(selector.best(), "a")
+        self.assertTrue(math.isinf(selector.score("b")))
+
+    def test_fastest_wins(self):
+        probe = Probe(a=0.1, b=0.05, c=0.2)
+        selector = self.selector(probe)
+        selector.probe_round()
+        self.assertEqual(selector.best(), "b")
+        self.assertEqual([endpoint for endpoint, _ in selector.ranking()], ["b", "a", "c"])
+        # Interleaved
+        self.assertEqual(probe.calls, ["a", "b", "c"] * 3)
+
+    def test_failing_endpoint_is_not_chosen(self):
+        selector = self.selector(Probe(a=ConnectionError("refused"), b=0.2, c=0.3))
+        selector.probe_round()
+        self.assertEqual(selector.best(), "b")
+        self.assertEqual(selector.stats["a"].last_error, "refused")
+        self.assertEqual(selector.stats["a"].failures, 3)
+
+    def test_all_failing_keeps_the_current(self):
+        selector = self.selector(Probe(a=OSError(), b=OSError(), c=OSError()))
+        selector.probe_round()
+        self.assertEqual(selector.best(), "a")
+
+    def test_error_rate_counts_against_the_score(self):
+        selector = self.selector(Probe(a=0.1, b=0.1, c=0.1), error_penalty_ms=1000, smoothing=0.5)
+        selector.probe_round()
+        for _ in range(2):
+            selector.report_failure("a", "reset")
+        self.assertGreater(selector.score("a"), selector.score("b"))
+        self.assertAlmostEqual(selector.score("b"), 100)
+
+    def test_switches_only_for_a_clear_margin(self):
+        probe = Probe(a=0.1, b=0.2, c=0.3)
+        selector = self.selector(probe, switch_margin=0.2, smoothing=1)
+        selector.probe_round()
+        self.assertEqual(selector.best(), "a")
+        # 15% better is within the margin
+        probe.rtts["b"] = 0.085
+        selector.probe_round()
+        self.assertEqual(selector.best(), "a")
+        # 25% better is not
+        probe.rtts["b"] = 0.075
+        selector.probe_round()
+        self.assertEqual(selector.best(), "b")
+        # Nor back for the same 15%
+        probe.rtts["a"] = 0.064
+        selector.probe_round()
+        self.assertEqual(selector.best(), "b")
+
+    def test_reported_failure_switches_at_once(self):
+        selector = self.selector(Probe(a=0.1, b=0.11, c=0.3))
+        selector.probe_round()
+        self.assertEqual(selector.best(), "a")
+        selector.report_failure("a", "session failed")
+        self.assertEqual(selector.best(), "b")
+        # Unknown endpoints are ignored
+        selector.report_failure("z")
+
+    def test_coroutine_probe(self):
+        async def probe(endpoint: str) -> float:
+            return {"a": 0.2, "b": 0.1, "c": 0.3}[endpoint]
+        selector = self.selector(probe)
+        selector.probe_round()
+        self.assertEqual(selector.best(), "b")
+
+    def test_no_candidates(self):
+        with self.assertRaises(ValueError):
+            EndpointSelector("test", [], Probe())
+
+
+class SharedSelectorTest(unittest.TestCase):
+    def tearDown(self):
+        EndpointSelector.stop_shared("shared-test")
+
+    def test_kept_until_the_candidates_change(self):
+        first = EndpointSelector.get_shared("shared-test", ["a", "b"], Probe(a=0.1, b=0.2))
+        newer_probe = Probe(a=0.1, b=0.2)
+        self.assertIs(EndpointSelector.get_shared("shared-test", ["a", "b"], newer_probe), first)
+        self.assertIs(first.probe, newer_probe)
+        second = EndpointSelector.get_shared("shared-test", ["b", "c"], Probe(b=0.2, c=0.1))
+        self.assertIsNot(second, first)
+        self.assertTrue(first._stop.is_set())
+        self.assertEqual(second.candidates, ["b", "c"])
+
+    def test_stop_shared(self):
+        selector = EndpointSelector.get_shared("shared-test", ["a"], Probe(a=0.1))
+        EndpointSelector.stop_shared("shared-test")
+        self.assertTrue(selector._stop.is_set())
+        selector._thread.join(2)
+        self.assertFalse(selector._thread.is_alive())
+        self.assertIsNot(EndpointSelector.get_shared("shared-test", ["a"], Probe(a=0.1)), selector)
+        # Nothing to stop
+        EndpointSelector.stop_shared("other")
+
+
+if __name__ == "__main__":
+    unittest.main()
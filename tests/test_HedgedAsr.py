@@ -0,0 +1,91 @@
+import unittest
+
+from HedgedAsr import SentenceHedge
+from RecognitionEvent import RecognitionEvent
+
+
+def sentence(text: str, begin_time: int, end_time: int = None) -> RecognitionEvent:
+    return RecognitionEvent(200, "task", {"sentence": {"begin_time": begin_time, "end_time": end_time, "text": text}})
+
+
+def error(message: str) -> RecognitionEvent:
+    return RecognitionEvent(500, "task", None, code="InternalError", message=message)
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def texts(self) -> list[str]:
+        return [args[0].text for name, args in self.calls if name == "on_event"]
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+
+class SentenceHedgeTest(unittest.TestCase):
+    def setUp(self):
+        self.callback = Recorder()
+        self.published = []
+        self.hedge = SentenceHedge(self.callback, ["v1", "v2"], self.published.append)
+
+    def test_first_final_wins_and_the_other_is_dropped(self):
+        self.hedge.on_event(1, sentence("你好。", 0, 1000))
+        self.hedge.on_event(0, sentence("你好", 20, 980))
+        self.hedge.on_event(0, sentence("再见。", 1500, 2500))
+        self.hedge.on_event(1, sentence("再见", 1480, 2520))
+        self.assertEqual(self.callback.texts(), ["你好。", "再见。"])
+        stats = self.hedge.get_stats()
+        self.assertEqual((stats["wins"], stats["matched_sentences"]), ({"v1": 1, "v2": 1}, 2))
+        self.assertEqual([message["hedge_winner"] for message in self.published], ["v2", "v1"])
+
+    def test_partials_only_from_the_leader(self):
+        self.hedge.on_event(0, sentence("你", 0))
+        self.hedge.on_event(1, sentence("你", 0))
+        self.hedge.on_event(1, sentence("你好。", 0, 1000))
+        # v2 leads now, v1 still on the old sentence is ignored
+        self.hedge.on_event(0, sentence("你好", 0))
+        self.hedge.on_event(1, sentence("再", 1200))
+        self.assertEqual(self.callback.texts(), ["你", "你好。", "再"])
+
+    def test_partial_of_a_delivered_sentence_is_dropped(self):
+        self.hedge.on_event(0, sentence("你好。", 0, 1000))
+        self.hedge.on_event(0, sentence("你好", 500))
+        self.assertEqual(self.callback.texts(), ["你好。"])
+
+    def test_overlap_is_relative_to_the_shorter_sentence(self):
+        self.hedge.on_event(0, sentence("你好。", 0, 1000))
+        # Covers all of the delivered one, so the same sentence cut later
+        self.hedge.on_event(1, sentence("你好今天天气。", 0, 3000))
+        # Overlaps 0.2 of it, another sentence
+        self.hedge.on_event(1, sentence("天气。", 800, 3000))
+        self.assertEqual(self.callback.texts(), ["你好。", "天气。"])
+
+    def test_failed_session_hands_over(self):
+        self.hedge.on_event(0, sentence("你好。", 0, 1000))
+        with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+            self.hedge.on_error(0, error("v1 down"))
+        self.hedge.on_event(1, sentence("再", 1200))
+        self.assertEqual(self.callback.texts(), ["你好。", "再"])
+        # The last one failing is an error
+        self.hedge.on_error(1, error("v2 down"))
+        self.assertEqual([args[0].message for name, args in self.callback.calls if name == "on_error"], ["v2 down"])
+
+    def test_lifecycle_once(self):
+        for leg in (0, 1):
+            self.hedge.on_open(leg)
+        self.hedge.on_complete(0)
+        self.hedge.on_close(0)
+        self.hedge.on_response_timeout(1, error("timeout"))
+        self.assertEqual([name for name, _ in self.callback.calls], ["on_open", "on_response_timeout"])
+        self.hedge.on_complete(1)
+        self.hedge.on_close(1)
+        self.assertEqual([name for name, _ in self.callback.calls], ["on_open", "on_response_timeout", "on_complete", "on_close"])
+
+    def test_without_sentence(self):
+        self.hedge.on_event(0, RecognitionEvent(200, "task", {}))
+        self.assertEqual(self.callback.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import struct
+import unittest
+
+from LocalEndpointer import LocalEndpointer, EndpointEvent
+
+
+def frame(ms: int, level: int) -> bytes:
+    samples = 16 * ms
+    # A square wave, so the rms is `level`
+    return struct.pack(f"<{samples}h", *([level, -level] * (samples // 2)))
+
+
+class LocalEndpointerTest(unittest.TestCase):
+    def feed(self, endpointer: LocalEndpointer, *frames: bytes) -> list[str]:
+        events = []
+        for buffer in frames:
+            events += endpointer.process(buffer)
+        return events
+
+    def test_onset_then_offset(self):
+        endpointer = LocalEndpointer()
+        events = self.feed(endpointer, frame(200, 0), frame(500, 3000), frame(700, 0))
+        self.assertEqual(events, [EndpointEvent.ONSET, EndpointEvent.OFFSET])
+        self.assertFalse(endpointer.in_speech)
+
+    def test_onset_needs_onset_ms_of_voice(self):
+        endpointer = LocalEndpointer(onset_ms=60)
+        self.assertEqual(self.feed(endpointer, frame(40, 3000), frame(100, 0)), [])
+        self.assertEqual(self.feed(endpointer, frame(60, 3000)), [EndpointEvent.ONSET])
+
+    def test_short_pauses_do_not_end_speech(self):
+        endpointer = LocalEndpointer(offset_ms=600)
+        events = self.feed(endpointer, frame(200, 3000), frame(400, 0), frame(200, 3000), frame(400, 0))
+        self.assertEqual(events, [EndpointEvent.ONSET])
+        self.assertTrue(endpointer.in_speech)
+
+    def test_quiet_room_is_silence(self):
+        endpointer = LocalEndpointer()
+        self.assertEqual(self.feed(endpointer, *[frame(100, 100)] * 20), [])
+
+    def test_events_inside_one_frame(self):
+        endpointer = LocalEndpointer(offset_ms=100)
+        self.assertEqual(endpointer.process(frame(100, 3000) + frame(100, 0)), [EndpointEvent.ONSET, EndpointEvent.OFFSET])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import time
+import socket
+import tempfile
+import unittest
+import importlib.util
+
+import LocalParaformerAsr
+from LocalParaformerAsr import _model_file
+from EndpointSelector import EndpointSelector
+from FakeDashscopeServer import FakeDashscopeServer
+from core import Setting, AsrEngine, ChooseAsrEngine
+
+
+def closed_port_url() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"ws://127.0.0.1:{s.getsockname()[1]}/api-ws/v1/inference"
+
+
+class ModelFileTest(unittest.TestCase):
+    def test_int8_preferred(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(FileNotFoundError):
+                _model_file(directory, "encoder")
+            for name in ("encoder.onnx", "decoder.onnx", "decoder.int8.onnx"):
+                open(os.path.join(directory, name), "wb").close()
+            self.assertEqual(os.path.basename(_model_file(directory, "encoder")), "encoder.onnx")
+            self.assertEqual(os.path.basename(_model_file(directory, "decoder")), "decoder.int8.onnx")
+
+
+class ChooseAsrEngineTest(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        EndpointSelector.stop_shared("asr")
+
+    def setting(self, engine: str, url: str) -> Setting:
+        setting = Setting()
+        setting.asr_engine = engine
+        setting.asr_endpoints = [url]
+        return setting
+
+    async def test_fixed_engines(self):
+        self.assertEqual(await ChooseAsrEngine(self.setting(AsrEngine.LOCAL, closed_port_url())), AsrEngine.LOCAL)
+        self.assertEqual(await ChooseAsrEngine(self.setting(AsrEngine.CLOUD, closed_port_url())), AsrEngine.CLOUD)
+
+    async def test_fallback_only_when_the_server_is_unreachable(self):
+        fake = FakeDashscopeServer()
+        url = await fake.start()
+        try:
+            self.assertEqual(await ChooseAsrEngine(self.setting(AsrEngine.LOCAL_FALLBACK, url)), AsrEngine.CLOUD)
+        finally:
+            await fake.stop()
+        with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+            self.assertEqual(await ChooseAsrEngine(self.setting(AsrEngine.LOCAL_FALLBACK, closed_port_url())), AsrEngine.LOCAL)
+
+
+class ScriptedModel:
+    """Stands in for the sherpa-onnx recognizer: one more character per frame, an endpoint every `sentence_frames`."""
+    class Stream:
+        def __init__(self):
+            self.frames = 0
+            self.finished = False
+
+        def accept_waveform(self, sample_rate, samples):
+            self.frames += 1
+
+        def input_finished(self):
+            self.finished = True
+
+    def __init__(self, sentence_frames: int = 3):
+        self.sentence_frames = sentence_frames
+
+    def create_stream(self):
+        return self.Stream()
+
+    def is_ready(self, stream) -> bool:
+        return False
+
+    def get_result(self, stream) -> str:
+        return "字" * stream.frames
+
+    def is_endpoint(self, stream) -> bool:
+        return stream.frames >= self.sentence_frames
+
+    def reset(self, stream):
+        stream.frames = 0
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+
+@unittest.skipUnless(importlib.util.find_spec("numpy"), "The local engine needs numpy")
+class DecodeWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        key = (os.path.abspath(self.directory.name), 1)
+        LocalParaformerAsr._shared_models[key] = ScriptedModel()
+        self.addCleanup(LocalParaformerAsr._shared_models.pop, key)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_partials_then_a_final_at_each_endpoint(self):
+        asr = LocalParaformerAsr.LocalParaformerAsr(self.directory.name, num_threads=1)
+        callback = Recorder()
+        asr.start(callback)
+        for _ in range(5):
+            asr.send_audio_frame(bytes(3200))
+        while asr.decoded_ms < 500:
+            time.sleep(0.01)
+        asr.stop()
+        events = [(args[0].get_sentence()["text"], args[0].get_sentence()["end_time"]) for name, args in callback.calls if name == "on_event"]
+        # The sentence in progress is flushed at stop
+        self.assertEqual(events, [("字", None), ("字字", None), ("字字字", None), ("字字字", 300), ("字", None), ("字字", None), ("字字", 500)])
+        self.assertEqual([name for name, _ in callback.calls if name != "on_event"], ["on_open", "on_complete", "on_close"])
+
+    def test_ends_by_itself_at_an_endpoint_after_max_duration(self):
+        asr = LocalParaformerAsr.LocalParaformerAsr(self.directory.name, num_threads=1)
+        callback = Recorder()
+        asr.start(callback, max_duration_s=0.2)
+        for _ in range(5):
+            asr.send_audio_frame(bytes(3200))
+        asr._worker.join(2)
+        self.assertTrue(asr.is_stopped())
+        self.assertEqual(asr.decoded_ms, 300)
+        self.assertEqual([name for name, _ in callback.calls], ["on_open", "on_event", "on_event", "on_event", "on_event", "on_complete", "on_close"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+from Microbench import BENCHMARKS, measure, make_entry, load_history, append_history, find_baseline, compare
+
+
+def entry(label: str, commit: str, **results) -> dict:
+    return {"label": label, "commit": commit,
+            "results": {name: {"us_per_op": median, "min_us_per_op": best} for name, (median, best) in results.items()}}
+
+
+class MicrobenchTest(unittest.TestCase):
+    def test_every_benchmark_runs(self):
+        for name, setup in BENCHMARKS.items():
+            with self.subTest(name):
+                setup()(3)
+
+    def test_measure(self):
+        calls = []
+        result = measure(lambda n: calls.append(n), repeat=3, target_s=0.001)
+        self.assertGreater(len(calls), 3)
+        self.assertLessEqual(result["min_us_per_op"], result["us_per_op"])
+
+    def test_history(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.jsonl")
+            self.assertEqual(load_history(path), [])
+            append_history(path, make_entry({"a": {"us_per_op": 1.0, "min_us_per_op": 0.9}}, "before"))
+            append_history(path, make_entry({"a": {"us_per_op": 2.0, "min_us_per_op": 1.8}}))
+            history = load_history(path)
+        self.assertEqual([item["label"] for item in history], ["before", None])
+        self.assertEqual(history[1]["results"]["a"]["us_per_op"], 2.0)
+
+    def test_find_baseline(self):
+        history = [entry("v1", "aaa"), entry(None, "bbb"), entry("v1", "ccc")]
+        self.assertIs(find_baseline(history), history[2])
+        self.assertIs(find_baseline(history, "v1"), history[2])
+        self.assertIs(find_baseline(history, "bbb"), history[1])
+        self.assertIs(find_baseline(history, "0"), history[0])
+        self.assertIsNone(find_baseline(history, "nope"))
+        self.assertIsNone(find_baseline([], None))
+
+    def test_regressed_only_if_median_and_best_are_slower(self):
+        before = entry(None, None, slower=(10, 9), unlucky=(10, 9), faster=(10, 9), gone=(10, 9))
+        after = entry(None, None, slower=(13, 12), unlucky=(13, 9.5), faster=(8, 7), new=(1, 1))
+        rows = {row["name"]: row for row in compare(before, after, threshold_pct=20)}
+        self.assertEqual(set(rows), {"slower", "unlucky", "faster"})
+        self.assertTrue(rows["slower"]["regressed"])
+        self.assertFalse(rows["unlucky"]["regressed"])
+        self.assertFalse(rows["faster"]["regressed"])
+        self.assertAlmostEqual(rows["faster"]["change_pct"], -20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import time
+import random
+import asyncio
+import unittest
+
+from NetworkImpairment import ImpairmentTimeline, Impairment, TcpImpairmentProxy, UdpImpairmentProxy, _Link
+
+
+class TimelineTest(unittest.TestCase):
+    def test_phases_in_order(self):
+        timeline = ImpairmentTimeline.from_script([{"at": 60, "latency_ms": 300, "loss": 0.05}, {"at": 10, "down": True}, {"at": 120, "disconnect": True}])
+        self.assertEqual([phase.at_s for phase in timeline.phases], [10, 60, 120])
+        self.assertEqual(timeline.phases[1].impairment, Impairment(latency_ms=300, loss=0.05))
+        self.assertTrue(timeline.phases[2].disconnect)
+        self.assertEqual(timeline.phases[2].impairment, Impairment())
+
+    def test_current_follows_the_clock(self):
+        timeline = ImpairmentTimeline.from_script([{"at": 10, "latency_ms": 100}, {"at": 20, "down": True}], speed=1000)
+        timeline._start = time.perf_counter()
+        self.assertEqual((timeline.index(), timeline.current()), (-1, Impairment()))
+        timeline._start -= 0.015
+        self.assertEqual((timeline.index(), timeline.current().latency_ms), (0, 100))
+        timeline._start -= 0.010
+        self.assertTrue(timeline.current().down)
+
+    def test_unknown_field(self):
+        with self.assertRaises(TypeError):
+            ImpairmentTimeline.from_script([{"at": 0, "latency": 100}])
+
+
+class LinkTest(unittest.TestCase):
+    def test_latency_and_bandwidth(self):
+        link = _Link()
+        impairment = Impairment(latency_ms=50, bandwidth_kbps=80)
+        rng = random.Random(0)
+        # 1000 bytes take 0.1s at 80kbps, the second waits for the first
+        self.assertAlmostEqual(link.schedule(1000, impairment, 0, rng, reliable=True), 0.15)
+        self.assertAlmostEqual(link.schedule(1000, impairment, 0, rng, reliable=True), 0.25)
+
+    def test_jitter_stays_within_bounds(self):
+        link, rng = _Link(), random.Random(0)
+        dues = [link.schedule(10, Impairment(latency_ms=100, jitter_ms=20), 0, rng, reliable=True) for _ in range(100)]
+        self.assertTrue(all(0.08 <= due <= 0.12 for due in dues))
+        self.assertGreater(max(dues) - min(dues), 0.02)
+
+    def test_loss(self):
+        rng = random.Random(0)
+        link = _Link()
+        self.assertIsNone(link.schedule(10, Impairment(latency_ms=10, loss=1), 0, rng, reliable=False))
+        # Retransmitted after at least 200ms
+        self.assertAlmostEqual(link.schedule(10, Impairment(latency_ms=10, loss=1), 0, rng, reliable=True), 0.21)
+        self.assertEqual(link.lost, 2)
+
+
+class EchoServer:
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.echo, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def echo(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def stop(self):
+        self.server.close()
+
+
+class TcpProxyTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.echo = EchoServer()
+        self.timeline = ImpairmentTimeline.constant(latency_ms=50)
+        self.proxy = TcpImpairmentProxy(("127.0.0.1", await self.echo.start()), self.timeline, seed=0)
+        await self.proxy.start()
+
+    async def asyncTearDown(self):
+        await self.proxy.stop()
+        await self.echo.stop()
+
+    async def round_trip(self, data: bytes) -> tuple[bytes, float]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.proxy.port)
+        started = time.perf_counter()
+        writer.write(data)
+        received = await asyncio.wait_for(reader.readexactly(len(data)), 2)
+        elapsed = time.perf_counter() - started
+        writer.close()
+        return received, elapsed
+
+    async def test_delays_both_ways(self):
+        received, elapsed = await self.round_trip(b"hello")
+        self.assertEqual(received, b"hello")
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertEqual((self.proxy.stats["bytes_up"], self.proxy.stats["bytes_down"]), (5, 5))
+
+    async def test_down_refuses_and_cuts(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.proxy.port)
+        writer.write(b"x")
+        await reader.readexactly(1)
+        self.timeline.phases[0].impairment.down = True
+        self.proxy._cut()
+        self.assertEqual(await reader.read(), b"")
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.proxy.port)
+        self.assertEqual(await asyncio.wait_for(reader.read(), 2), b"")
+        self.assertEqual((self.proxy.stats["cut"], self.proxy.stats["refused"]), (1, 1))
+
+    def test_rewrite(self):
+        self.assertEqual(self.proxy.rewrite("wss://dashscope.aliyuncs.com/api-ws/v1/inference"),
+                         f"wss://127.0.0.1:{self.proxy.port}/api-ws/v1/inference")
+
+
+class Collector(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.datagrams = []
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.datagrams.append(data)
+
+
+class UdpProxyTest(unittest.IsolatedAsyncioTestCase):
+    async def proxy(self, **impairment) -> tuple[UdpImpairmentProxy, Collector, asyncio.DatagramTransport]:
+        loop = asyncio.get_running_loop()
+        receiver, collector = await loop.create_datagram_endpoint(Collector, local_addr=("127.0.0.1", 0))
+        self.addCleanup(receiver.close)
+        proxy = UdpImpairmentProxy(receiver.get_extra_info("sockname"), ImpairmentTimeline.constant(**impairment), seed=0)
+        await proxy.start()
+        self.addAsyncCleanup(proxy.stop)
+        sender, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=("127.0.0.1", proxy.port))
+        self.addCleanup(sender.close)
+        return proxy, collector, sender
+
+    async def test_delayed(self):
+        proxy, collector, sender = await self.proxy(latency_ms=50)
+        sender.sendto(b"/chatbox/input")
+        await asyncio.sleep(0.02)
+        self.assertEqual(collector.datagrams, [])
+        await asyncio.sleep(0.1)
+        self.assertEqual(collector.datagrams, [b"/chatbox/input"])
+
+    async def test_lost(self):
+        proxy, collector, sender = await self.proxy(loss=0.5)
+        for i in range(40):
+            sender.sendto(bytes([i]))
+        await asyncio.sleep(0.1)
+        self.assertEqual(proxy.stats["datagrams"], 40)
+        self.assertEqual(len(collector.datagrams), 40 - proxy.stats["dropped"])
+        self.assertTrue(5 < proxy.stats["dropped"] < 35)
+
+
+if __name__ == "__main__":
+    unittest.main()
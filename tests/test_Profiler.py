@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+
+from Profiler import LoopLagMonitor, ThreadCpuSampler, RuntimeMonitor, SamplingProfiler
+
+
+def spin(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def busy_worker(stop: threading.Event):
+    while not stop.is_set():
+        spin(0.001)
+
+
+class LoopLagTest(unittest.IsolatedAsyncioTestCase):
+    async def test_blocked_loop(self):
+        monitor = LoopLagMonitor(interval_s=0.02, warn_ms=50)
+        task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.05)
+        with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+            time.sleep(0.15)
+            await asyncio.sleep(0.03)
+        task.cancel()
+        self.assertGreater(monitor.take_max(), 100)
+        # Down to the last lag once taken
+        self.assertLess(monitor.take_max(), 100)
+
+    async def test_runtime_message(self):
+        published = []
+        monitor = RuntimeMonitor(published.append, interval_s=0.05)
+        task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.12)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.assertGreaterEqual(len(published), 1)
+        self.assertEqual(published[0]["type"], "runtime")
+        self.assertIn("MainThread", published[0]["threads"])
+
+
+class ThreadCpuTest(unittest.TestCase):
+    def test_busy_thread_by_name(self):
+        sampler = ThreadCpuSampler()
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_worker, args=(stop,), name="Busy")
+        thread.start()
+        time.sleep(0.3)
+        usage = sampler.sample()
+        stop.set()
+        thread.join()
+        self.assertGreater(usage.get("Busy", usage.get("process", 0)), 30)
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    def profile(self) -> SamplingProfiler:
+        profiler = SamplingProfiler(interval_ms=2)
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_worker, args=(stop,), name="Busy")
+        thread.start()
+        profiler.start()
+        time.sleep(0.1)
+        profiler.stop()
+        stop.set()
+        thread.join()
+        return profiler
+
+    def test_collapsed_stacks(self):
+        profiler = self.profile()
+        self.assertGreater(len(profiler.samples), 10)
+        busy = {key: count for key, count in profiler.collapsed().items() if key.startswith("Busy;")}
+        self.assertTrue(any("busy_worker (test_Profiler.py:" in key for key in busy))
+        # Its own thread is left out
+        self.assertFalse(any(key.startswith("SamplingProfiler") for key in profiler.collapsed()))
+
+    def test_trace_events_are_balanced(self):
+        events = self.profile().trace_events()
+        depth: dict[int, list[str]] = {}
+        for event in events:
+            if event["ph"] == "B":
+                depth.setdefault(event["tid"], []).append(event["name"])
+            elif event["ph"] == "E":
+                self.assertEqual(depth[event["tid"]].pop(), event["name"])
+        self.assertTrue(all(not stack for stack in depth.values()))
+        self.assertTrue(any(event["ph"] == "M" and event["args"]["name"] == "Busy" for event in events))
+
+    def test_write_and_only_one_at_a_time(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.json")
+            profiler = SamplingProfiler(interval_ms=2)
+            with self.assertLogs("VRChatParaformerAsr", "INFO") as logs:
+                self.assertTrue(profiler.profile_in_background(0.05, path))
+                self.assertFalse(profiler.profile_in_background(0.05, path))
+                for _ in range(200):
+                    if any("written to" in line for line in logs.output):
+                        break
+                    time.sleep(0.01)
+            with open(path) as f:
+                self.assertIn("traceEvents", json.load(f))
+            folded = os.path.join(directory, "profile.folded")
+            profiler.write(folded)
+            with open(folded) as f:
+                self.assertTrue(all(line.rsplit(" ", 1)[1].strip().isdigit() for line in f))
+
+
+if __name__ == "__main__":
+    unittest.main()
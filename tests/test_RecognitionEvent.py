@@ -0,0 +1,81 @@
+import json
+import unittest
+from http import HTTPStatus
+
+from dashscope.api_entities.dashscope_response import DashScopeAPIResponse, RecognitionResponse
+from dashscope.audio.asr import RecognitionResult
+from RecognitionEvent import RecognitionEvent, fast_loads
+
+
+def sentence(text: str, end: bool) -> dict:
+    return {"begin_time": 1200, "end_time": 4400 if end else None, "text": text,
+            "words": [{"begin_time": 1200, "end_time": 1400, "text": text[:1], "punctuation": ""}]}
+
+
+# (status_code, output, usage, code, message) as the server sends them
+RESPONSES = {
+    "partial": (HTTPStatus.OK, {"sentence": sentence("你好", False)}, None, None, None),
+    "sentence end": (HTTPStatus.OK, {"sentence": sentence("你好。", True)}, {"duration": 4}, None, None),
+    "sentence end without usage": (HTTPStatus.OK, {"sentence": sentence("你好。", True)}, None, None, None),
+    "no sentence": (HTTPStatus.OK, {}, None, None, None),
+    "error": (HTTPStatus.BAD_REQUEST, None, None, "InvalidParameter", "bad format"),
+}
+
+
+def sdk_result(status_code, output, usage, code, message) -> RecognitionResult:
+    # As the SDK recognizer builds it
+    response = DashScopeAPIResponse(request_id="task", status_code=status_code, output=output, usage=usage, code=code, message=message)
+    usages = [{"end_time": output["sentence"]["end_time"], "usage": usage}] if usage else None
+    return RecognitionResult(RecognitionResponse.from_api_response(response), usages=usages)
+
+
+class ParityTest(unittest.TestCase):
+    def assertSame(self, event, result):
+        self.assertEqual(event.status_code, result.status_code)
+        self.assertEqual(event.get_request_id(), result.get_request_id())
+        self.assertEqual(event.code, result.code)
+        self.assertEqual(event.message, result.message)
+        sentence = result.get_sentence()
+        self.assertEqual(event.get_sentence(), sentence)
+        if sentence is not None:
+            self.assertEqual(event.is_sentence_end(event.get_sentence()), RecognitionResult.is_sentence_end(sentence))
+        self.assertEqual(event.get_usage(event.get_sentence()), result.get_usage(sentence))
+        self.assertEqual(json.loads(str(event)), json.loads(str(result)))
+
+    def test_same_as_the_sdk_result(self):
+        for name, response in RESPONSES.items():
+            with self.subTest(name):
+                event, result = RecognitionEvent(response[0], "task", *response[1:]), sdk_result(*response)
+                self.assertSame(event, result)
+                sentence = result.get_sentence()
+                # The fields taken out once
+                self.assertEqual(event.sentence_end, sentence is not None and RecognitionResult.is_sentence_end(sentence))
+                self.assertEqual(event.text, sentence["text"] if sentence else "")
+
+    def test_from_response(self):
+        for name, response in RESPONSES.items():
+            with self.subTest(name):
+                status_code, output, usage, code, message = response
+                api_response = DashScopeAPIResponse(request_id="task", status_code=status_code, output=output, usage=usage, code=code, message=message)
+                self.assertSame(RecognitionEvent.from_response(api_response), sdk_result(*response))
+
+    def test_to_result_round_trip(self):
+        for name, response in RESPONSES.items():
+            with self.subTest(name):
+                self.assertSame(RecognitionEvent(response[0], "task", *response[1:]).to_result(), sdk_result(*response))
+
+    def test_usage_only_for_its_own_sentence(self):
+        event = RecognitionEvent(HTTPStatus.OK, "task", *RESPONSES["sentence end"][1:])
+        other = sentence("再见", True)
+        other["end_time"] = 9000
+        self.assertIsNone(event.get_usage(other))
+        self.assertIsNone(event.get_usage(None))
+
+    def test_fast_loads_decodes_like_json(self):
+        data = json.dumps({"payload": {"output": {"sentence": sentence("今天晚上。", True)}, "usage": {"duration": 4}}}, ensure_ascii=False)
+        self.assertEqual(fast_loads(data), json.loads(data))
+        self.assertEqual(fast_loads(data.encode()), json.loads(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
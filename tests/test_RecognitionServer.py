@@ -0,0 +1,140 @@
+import json
+import socket
+import asyncio
+import unittest
+
+import aiohttp
+
+from FakeDashscopeServer import FakeDashscopeServer
+from RecognitionEvent import RecognitionEvent
+from RecognitionServer import SessionPool, RecognitionServer, ClientCallback
+
+
+class UdpRestartTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: self.errors.append(context))
+        self.fake = FakeDashscopeServer()
+        url = await self.fake.start()
+        self.pool = SessionPool(["test"], max_sessions_per_key=4, url=url, keep_connections=False)
+        self.server = RecognitionServer(self.pool, host="127.0.0.1", port=0, udp_port=0)
+        await self.server.start()
+        self.address = self.server._udp.transport.get_extra_info("sockname")
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    async def asyncTearDown(self):
+        self.sock.close()
+        await self.server.stop()
+        await self.fake.stop()
+
+    async def wait_for(self, condition, timeout_s: float = 5):
+        deadline = asyncio.get_running_loop().time() + timeout_s
+        while not condition():
+            self.assertLess(asyncio.get_running_loop().time(), deadline, "timed out")
+            await asyncio.sleep(0.01)
+
+    async def test_burst_after_session_stopped(self):
+        frame = bytes(3200)
+        self.sock.sendto(frame, self.address)
+        await self.wait_for(lambda: self.server._udp.clients)
+        client = next(iter(self.server._udp.clients.values()))
+        stopped = client.recognition
+        # Like a timeout on the ASR side
+        await stopped.close()
+        for _ in range(20):
+            self.sock.sendto(frame, self.address)
+        await self.wait_for(lambda: client.recognition is not None and client.recognition is not stopped)
+        await asyncio.sleep(0.2)
+        # Started over exactly once
+        self.assertEqual(self.pool.in_use, 1)
+        self.assertFalse(client.recognition.is_stopped())
+        self.assertEqual(self.errors, [])
+
+
+class SessionPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fake = FakeDashscopeServer()
+        url = await self.fake.start()
+        self.pool = SessionPool(["a", "b"], max_sessions_per_key=2, url=url, keep_connections=False)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        await self.fake.stop()
+
+    async def acquire(self):
+        session = await self.pool.acquire()
+        if session is not None:
+            # Results read like `PoolClient` does, or stopping waits for them
+            asyncio.create_task(session.dispatch(ClientCallback(lambda message: None)))
+        return session
+
+    async def test_spread_over_keys_until_saturated(self):
+        sessions = [await self.acquire() for _ in range(4)]
+        self.assertEqual(self.pool.active, {"a": 2, "b": 2})
+        self.assertEqual(self.pool.in_use, self.pool.capacity)
+        self.assertIsNone(await self.acquire())
+        await self.pool.release(sessions[0])
+        # Released twice by mistake, counted once
+        await self.pool.release(sessions[0])
+        self.assertEqual(self.pool.in_use, 3)
+        replacement = await self.acquire()
+        self.assertIsNotNone(replacement)
+        for session in sessions[1:] + [replacement]:
+            await self.pool.release(session)
+        self.assertEqual(self.pool.active, {"a": 0, "b": 0})
+
+
+class StartFailureTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: self.errors.append(context))
+        # Nothing listens there
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            url = f"ws://127.0.0.1:{unused.getsockname()[1]}/api-ws/v1/inference"
+        self.pool = SessionPool(["test"], max_sessions_per_key=4, url=url, keep_connections=False)
+        self.server = RecognitionServer(self.pool, host="127.0.0.1", port=0, udp_port=0)
+        await self.server.start()
+        self.address = self.server._udp.transport.get_extra_info("sockname")
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    async def asyncTearDown(self):
+        self.sock.close()
+        await self.server.stop()
+
+    async def receive(self) -> dict:
+        loop = asyncio.get_running_loop()
+        return json.loads(await asyncio.wait_for(loop.sock_recv(self.sock, 65536), 5))
+
+    async def test_udp_error_then_retry(self):
+        for _ in range(2):
+            self.sock.sendto(bytes(3200), self.address)
+            message = await self.receive()
+            self.assertEqual(message["type"], "error")
+            self.assertEqual(self.server._udp.clients, {})
+            self.assertEqual(self.server._udp.opening, {})
+        self.assertEqual(self.pool.in_use, 0)
+        self.assertEqual(self.server.shed, 0)
+        self.assertEqual(self.errors, [])
+
+    async def test_ws_error_then_close(self):
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(f"ws://127.0.0.1:{self.server.port}/asr") as ws:
+                message = await ws.receive_json(timeout=5)
+                self.assertEqual(message["type"], "error")
+                closing = await ws.receive(timeout=5)
+                self.assertEqual(closing.type, aiohttp.WSMsgType.CLOSE)
+        self.assertEqual(self.pool.in_use, 0)
+        self.assertEqual(self.errors, [])
+
+
+class ClientCallbackTest(unittest.TestCase):
+    def test_event_without_sentence_is_ignored(self):
+        sent = []
+        ClientCallback(sent.append).on_event(RecognitionEvent(200, "task", {}, None))
+        self.assertEqual(sent, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+
+from SharedAudioRing import SharedAudioRing, RingAudioSource
+
+
+def pattern(start: int, size: int) -> bytes:
+    return bytes((start + i) % 251 for i in range(size))
+
+
+class SharedAudioRingTest(unittest.TestCase):
+    def setUp(self):
+        # 20 samples, 40 bytes
+        self.ring = SharedAudioRing.create(seconds=20 / 16000)
+        self.reader = SharedAudioRing.attach(self.ring.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.ring.close()
+
+    def test_wraps_around(self):
+        self.assertEqual(self.ring.capacity, 40)
+        received = b""
+        # 30 bytes a time never lines up with the end of the ring
+        for i in range(10):
+            self.assertTrue(self.ring.write(pattern(i * 30, 30)))
+            received += self.reader.read(30)
+        self.assertEqual(received, pattern(0, 300))
+        self.assertEqual(self.ring.get_stats(), {"written_bytes": 300, "backlog_bytes": 0, "dropped_bytes": 0, "capacity_bytes": 40})
+
+    def test_full_ring_drops_and_counts(self):
+        self.assertTrue(self.ring.write(pattern(0, 30)))
+        self.assertFalse(self.ring.write(pattern(30, 20)))
+        self.ring.write_or_drop(pattern(30, 20))
+        self.ring.write_or_drop(pattern(50, 10))
+        self.assertEqual(self.ring.get_stats()["dropped_bytes"], 20)
+        self.assertEqual(self.reader.read(40), pattern(0, 30) + pattern(50, 10))
+
+    def test_read_waits_for_the_whole_frame(self):
+        self.ring.write(pattern(0, 10))
+        self.assertIsNone(self.reader.read(20))
+        self.assertEqual(self.reader.read(20, partial=True), pattern(0, 10))
+        self.assertIsNone(self.reader.read(20, partial=True))
+
+    def test_written_frame_may_be_a_memoryview(self):
+        self.ring.write(pattern(0, 30))
+        self.reader.read(30)
+        self.ring.write(memoryview(pattern(30, 30)))
+        self.assertEqual(self.reader.read(30), pattern(30, 30))
+
+    def test_writer_state(self):
+        self.assertFalse(self.reader.ended)
+        self.ring.reset_writer(realtime=False)
+        self.assertFalse(self.reader.realtime)
+        self.ring.end()
+        self.assertTrue(self.reader.ended)
+        self.ring.reset_writer(realtime=True)
+        self.assertTrue(self.reader.realtime)
+        self.assertFalse(self.reader.ended)
+
+
+class RingAudioSourceTest(unittest.IsolatedAsyncioTestCase):
+    async def test_reads_frames_then_the_rest_once_ended(self):
+        ring = SharedAudioRing.create(seconds=0.1)
+        source = RingAudioSource(ring.name, poll_s=0.001, frame_ms=10)
+        source.start()
+        try:
+            ring.reset_writer(realtime=False)
+            data = pattern(0, 320 * 25 + 160)
+            writer = asyncio.create_task(self.write(ring, data))
+            frames = []
+            while (frame := await source.read()) is not None:
+                frames.append(frame)
+            await writer
+            self.assertEqual([len(frame) for frame in frames], [320] * 25 + [160])
+            self.assertEqual(b"".join(frames), data)
+            self.assertTrue(source.ended)
+            self.assertFalse(source.realtime)
+        finally:
+            source.close()
+            ring.close()
+
+    async def write(self, ring: SharedAudioRing, data: bytes):
+        # Far more than the 3200 bytes the ring holds, in chunks not lined up with the frames
+        for offset in range(0, len(data), 100):
+            await ring.write_async(data[offset:offset + 100], poll_s=0.001)
+        ring.end()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+from SoakTest import SoakTest, slope
+
+
+def samples(hours: list[float], **metrics) -> list[dict]:
+    # Every tracked metric flat at 1, unless given as a function of the simulated hour
+    soak = SoakTest()
+    return [{"audio_h": h, "restarts": i, "osc_messages": 10 * i,
+             **{metric: metrics[metric](h) if metric in metrics else 1 for metric in soak.limits}}
+            for i, h in enumerate(hours)]
+
+
+class TrendTest(unittest.TestCase):
+    def test_slope(self):
+        self.assertAlmostEqual(slope([0, 1, 2, 3], [1, 3, 5, 7]), 2)
+        self.assertEqual(slope([1, 1], [1, 5]), 0)
+
+    def test_flat_run_is_ok(self):
+        soak = SoakTest()
+        soak.samples = samples([i / 10 for i in range(11)])
+        report = soak.report()
+        self.assertTrue(report["ok"])
+        self.assertEqual((report["simulated_hours"], report["restarts"], report["osc_messages"]), (1.0, 10, 100))
+
+    def test_leaks_over_the_limits(self):
+        soak = SoakTest()
+        # 10MB per hour, a thread every 10 minutes, over the 1h40m after warm-up
+        soak.samples = samples([i / 6 for i in range(13)], rss_mb=lambda h: 100 + 10 * h, threads=lambda h: 5 + round(6 * h))
+        report = soak.report()
+        self.assertFalse(report["ok"])
+        self.assertAlmostEqual(report["trends"]["rss_mb"]["growth"], 10)
+        self.assertAlmostEqual(report["trends"]["threads"]["growth"], 10, delta=0.5)
+        self.assertFalse(report["trends"]["threads"]["ok"])
+        self.assertTrue(report["trends"]["fds"]["ok"])
+
+    def test_warm_up_is_left_out(self):
+        soak = SoakTest(warm_up=0.2)
+        # Grows only during the first fifth
+        soak.samples = samples([i / 10 for i in range(11)], rss_mb=lambda h: 100 + min(h, 0.15) * 400)
+        self.assertTrue(soak.report()["trends"]["rss_mb"]["ok"])
+        soak.warm_up = 0
+        self.assertFalse(soak.report()["trends"]["rss_mb"]["ok"])
+
+    def test_too_few_samples(self):
+        soak = SoakTest()
+        soak.samples = samples([0, 0.1])
+        with self.assertRaises(RuntimeError):
+            soak.report()
+
+    def test_write_csv(self):
+        soak = SoakTest()
+        soak.samples = samples([0, 0.5])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "soak.csv")
+            soak.write_csv(path)
+            with open(path) as f:
+                lines = f.read().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0].split(",")[:3], ["audio_h", "restarts", "osc_messages"])
+
+
+class ShortSoakTest(unittest.IsolatedAsyncioTestCase):
+    async def test_restarts_and_translator_failures(self):
+        # 90 simulated seconds in about 1.5s, restarting every 30s
+        soak = SoakTest(hours=90 / 3600, speed=60, reconnect_every_s=30, sample_interval_s=0.1, limits={"rss_mb": 1e9})
+        report = await soak.run()
+        self.assertGreaterEqual(report["restarts"], 3)
+        self.assertGreater(report["osc_messages"], 0)
+        self.assertGreater(report["mt_requests"], 0)
+        # Too short for the callback, thread and fd counts: a callback replaced by a restart lives on with its translate thread
+        # and connections while that thread is joined, which takes real seconds, not simulated ones
+        for metric in ("backlog_frames", "translate_queue", "AudioBacklog", "DashscopeCustomRecognition"):
+            self.assertTrue(report["trends"][metric]["ok"], report["trends"][metric])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import asyncio
+import unittest
+
+from dashscope.common.error import RequestFailure
+from Supervisor import Supervisor, FailureKind, HealthState, classify_failure, classify_exception
+from RecognitionEvent import RecognitionEvent
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_failures(self):
+        self.assertEqual(classify_failure(401), FailureKind.AUTH)
+        self.assertEqual(classify_failure(400, "InvalidApiKey"), FailureKind.AUTH)
+        self.assertEqual(classify_failure(400, None, "Invalid API key provided"), FailureKind.AUTH)
+        self.assertEqual(classify_failure(429), FailureKind.QUOTA)
+        self.assertEqual(classify_failure(400, "Throttling.User"), FailureKind.QUOTA)
+        self.assertEqual(classify_failure(400, "Arrearage"), FailureKind.QUOTA)
+        self.assertEqual(classify_failure(500, "InternalError", "oops"), FailureKind.TRANSIENT)
+        self.assertEqual(classify_failure(), FailureKind.TRANSIENT)
+
+    def test_exceptions(self):
+        self.assertEqual(classify_exception(RequestFailure(message="denied", name="AccessDenied", http_code=400)), FailureKind.AUTH)
+        self.assertEqual(classify_exception(RequestFailure(message="slow down", http_code=429)), FailureKind.QUOTA)
+        self.assertEqual(classify_exception(ConnectionResetError("reset by peer")), FailureKind.TRANSIENT)
+
+
+class Mic:
+    def __init__(self):
+        self.ended = False
+        self.reads = 0
+
+    async def read(self):
+        self.reads += 1
+        await asyncio.sleep(0.005)
+
+
+def error(status_code: int, code: str) -> RecognitionEvent:
+    return RecognitionEvent(status_code, "task", None, code=code, message=code)
+
+
+class ScriptedWorker:
+    """Each session ends with the next outcome: a result, None, an exception or a float to run that many seconds first."""
+    def __init__(self, mic: Mic, outcomes: list):
+        self.mic = mic
+        self.outcomes = list(outcomes)
+        self.sessions = 0
+
+    async def __call__(self, setting, mic):
+        self.sessions += 1
+        outcome = self.outcomes.pop(0)
+        if not self.outcomes:
+            self.mic.ended = True
+        if isinstance(outcome, float):
+            await asyncio.sleep(outcome)
+            return None
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+class SupervisorTest(unittest.IsolatedAsyncioTestCase):
+    def supervisor(self, outcomes: list, **kwargs) -> tuple[Supervisor, ScriptedWorker]:
+        mic = Mic()
+        worker = ScriptedWorker(mic, outcomes)
+        kwargs = {"base_delay_s": 0.02, "max_delay_s": 0.08, "failure_threshold": 3,
+                  "open_s": {kind: 0.1 for kind in (FailureKind.TRANSIENT, FailureKind.AUTH, FailureKind.QUOTA)}, **kwargs}
+        return Supervisor(None, worker, mic, **kwargs), worker
+
+    async def test_backoff_grows_with_jitter_up_to_the_maximum(self):
+        supervisor, _ = self.supervisor([None])
+        for failures, delay in ((1, 0.02), (2, 0.04), (3, 0.08), (10, 0.08)):
+            supervisor.consecutive_failures = failures
+            for _ in range(20):
+                self.assertTrue(delay / 2 <= supervisor._backoff_s() <= delay)
+
+    async def test_open_circuit_doubles_up_to_the_maximum(self):
+        supervisor, _ = self.supervisor([None], open_s={FailureKind.QUOTA: 900}, max_open_s=3600)
+        waits = []
+        for opened in range(1, 5):
+            supervisor.circuit_opened = opened
+            waits.append(supervisor._open_circuit_s(FailureKind.QUOTA))
+        self.assertEqual(waits, [900, 1800, 3600, 3600])
+
+    async def test_transient_failures_back_off_then_open_the_circuit(self):
+        supervisor, worker = self.supervisor([error(500, "InternalError"), ConnectionResetError(), error(500, "InternalError"), None])
+        states = []
+        set_state = supervisor._set_state
+        def record(state):
+            states.append(state)
+            set_state(state)
+        supervisor._set_state = record
+        await asyncio.wait_for(supervisor.run(), 5)
+        self.assertEqual(worker.sessions, 4)
+        self.assertEqual(states, [HealthState.BACKING_OFF, HealthState.BACKING_OFF, HealthState.CIRCUIT_OPEN])
+        self.assertEqual(supervisor.last_failure_kind, FailureKind.TRANSIENT)
+        # The mic is read while waiting
+        self.assertGreater(supervisor.mic.reads, 0)
+
+    async def test_auth_failure_opens_the_circuit_at_once(self):
+        supervisor, worker = self.supervisor([error(401, "InvalidApiKey"), None])
+        with self.assertLogs("VRChatParaformerAsr", "ERROR"):
+            await asyncio.wait_for(supervisor.run(), 5)
+        self.assertEqual(supervisor.state, HealthState.CIRCUIT_OPEN)
+        self.assertEqual(supervisor.last_failure_kind, FailureKind.AUTH)
+        self.assertEqual(supervisor.last_error, "InvalidApiKey: InvalidApiKey")
+
+    async def test_quick_normal_end_counts_as_a_failure(self):
+        supervisor, worker = self.supervisor([None, None])
+        await asyncio.wait_for(supervisor.run(), 5)
+        self.assertEqual(supervisor.consecutive_failures, 1)
+        self.assertEqual(supervisor.state, HealthState.BACKING_OFF)
+
+    async def test_long_normal_end_restarts_at_once(self):
+        supervisor, worker = self.supervisor([0.05, None], base_delay_s=0.04)
+        await asyncio.wait_for(supervisor.run(), 5)
+        self.assertEqual(worker.sessions, 2)
+        self.assertEqual(supervisor.consecutive_failures, 0)
+        self.assertEqual(supervisor.mic.reads, 0)
+
+    async def test_healthy_run_resets_the_failures(self):
+        supervisor, worker = self.supervisor([error(500, "InternalError"), 0.15, None], healthy_after_s=0.1)
+        await asyncio.wait_for(supervisor.run(), 5)
+        self.assertEqual(supervisor.state, HealthState.HEALTHY)
+        self.assertEqual(supervisor.consecutive_failures, 0)
+
+    async def test_reset_retries_now(self):
+        supervisor, worker = self.supervisor([error(401, "InvalidApiKey"), None], open_s={FailureKind.AUTH: 60})
+        task = asyncio.create_task(supervisor.run())
+        with self.assertLogs("VRChatParaformerAsr", "ERROR"):
+            while supervisor.retry_at is None:
+                await asyncio.sleep(0.01)
+        self.assertGreater(supervisor.health()["retry_in_s"], 50)
+        supervisor.reset()
+        await asyncio.wait_for(task, 5)
+        self.assertEqual(worker.sessions, 2)
+        self.assertEqual(supervisor.consecutive_failures, 0)
+
+    async def test_restart_cancels_the_worker(self):
+        supervisor, worker = self.supervisor([60.0, None])
+        task = asyncio.create_task(supervisor.run())
+        await asyncio.sleep(0.05)
+        supervisor.restart()
+        await asyncio.wait_for(task, 5)
+        self.assertEqual(worker.sessions, 2)
+        self.assertEqual(supervisor.consecutive_failures, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
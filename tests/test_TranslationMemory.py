@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from TranslationMemory import TranslationMemory, MemoryTranslator, normalize, similarity
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_fillers(self):
+        self.assertEqual(normalize("嗯，你好啊"), "你好")
+        self.assertEqual(normalize("Um, uh... hello"), "hello")
+        # Only whole words
+        self.assertEqual(normalize("um... umbrella"), "umbrella")
+        self.assertEqual(normalize("Uh, I hurry, erm"), "ihurry")
+        self.assertEqual(normalize("这笔金额不对"), "这笔金额不对")
+
+    def test_question_keeps_its_mark(self):
+        self.assertEqual(normalize("你会来吗？"), "你会来吗?")
+        self.assertEqual(normalize("Are you coming?!"), "areyoucoming?")
+        self.assertEqual(normalize("你会来。"), "你会来")
+
+
+class SimilarityTest(unittest.TestCase):
+    def test_only_added_or_left_out_characters(self):
+        self.assertEqual(similarity("你好", "你好"), 1.0)
+        self.assertAlmostEqual(similarity("我觉得很好", "我觉得很好呢"), 5 / 6)
+        self.assertAlmostEqual(similarity("我觉得很好呢", "我觉得很好"), 5 / 6)
+        self.assertEqual(similarity("你好今天天气怎么样", "你好昨天天气怎么样"), 0.0)
+        self.assertEqual(similarity("", "你好"), 0.0)
+
+
+class TranslationMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "memory.sqlite3")
+        self.memory = TranslationMemory(self.path)
+
+    def tearDown(self):
+        self.memory.close()
+        self.directory.cleanup()
+
+    def remember(self, text: str) -> str:
+        # Each into a language pair of its own, so earlier pairs of a test do not answer
+        self.pairs = getattr(self, "pairs", 0) + 1
+        dst_lang = f"ja{self.pairs}"
+        self.memory.add("zh", dst_lang, text, f"[ja]{text}")
+        return dst_lang
+
+    def assertMatches(self, remembered: str, query: str):
+        found = self.memory.lookup("zh", self.remember(remembered), query)
+        self.assertIsNotNone(found, f"{query} should reuse {remembered}")
+        self.assertEqual(found[0], f"[ja]{remembered}")
+
+    def assertNoMatch(self, remembered: str, query: str):
+        self.assertIsNone(self.memory.lookup("zh", self.remember(remembered), query), f"{query} should not reuse {remembered}")
+
+    def test_near_duplicates(self):
+        self.assertMatches("今天晚上一起去那个世界看看吧。", "嗯，今天晚上一起去那个世界看看吧！")
+        self.assertMatches("我觉得这个东西很好用", "我觉得这个东西很好用了")
+        self.assertEqual(self.memory.fuzzy_hits, 1)
+
+    def test_replaced_character(self):
+        self.assertNoMatch("你好今天天气怎么样", "你好昨天天气怎么样")
+        self.assertNoMatch("今天晚上一起去那个世界看看吧", "今天晚上一起去这个世界看看吧")
+
+    def test_short_sentences_match_exactly(self):
+        self.assertNoMatch("我喜欢你", "我喜欢你了")
+
+    def test_question_and_statement(self):
+        pairs = [
+            ("I will go to the party tomorrow.", "I will go to the party tomorrow?"),
+            ("你明天会来参加聚会", "你明天会来参加聚会吗"),
+            ("你明天会来参加聚会", "你明天会来参加聚会？"),
+            ("我们明天一起去看电影", "我们明天一起去看电影吧"),
+            ("他现在还在公司上班", "他现在还在公司上班呢"),
+            ("明日のパーティーに来ます", "明日のパーティーに来ますか"),
+        ]
+        for statement, question in pairs:
+            for remembered, query in ((statement, question), (question, statement)):
+                with self.subTest(remembered=remembered, query=query):
+                    self.assertNoMatch(remembered, query)
+
+    def test_negations(self):
+        pairs = [
+            ("我觉得这个东西很好用", "我觉得这个东西不很好用"),
+            ("他昨天晚上去了那个地方", "他昨天晚上没去那个地方"),
+            ("这件事情你告诉他们吧", "这件事情你别告诉他们吧"),
+        ]
+        for remembered, query in pairs:
+            with self.subTest(remembered=remembered, query=query):
+                self.assertNoMatch(remembered, query)
+
+    def test_digits(self):
+        pairs = [
+            ("我们明天下午3点在门口见", "我们明天下午4点在门口见"),
+            ("我们明天下午3点在门口见", "我们明天下午13点在门口见"),
+            ("这个东西一共卖20块钱", "这个东西一共卖200块钱"),
+        ]
+        for remembered, query in pairs:
+            with self.subTest(remembered=remembered, query=query):
+                self.assertNoMatch(remembered, query)
+
+    def test_language_pairs_are_separate(self):
+        self.memory.add("zh", "ja", "你好", "こんにちは")
+        self.assertIsNone(self.memory.lookup("zh", "en", "你好"))
+
+    def test_kept_across_sessions_and_evicted_least_recently_used(self):
+        for i in range(5):
+            self.memory.add("zh", "ja", f"第{i}句话", f"[ja]{i}")
+        self.memory.lookup("zh", "ja", "第0句话")
+        self.memory.close()
+        self.memory = TranslationMemory(self.path, max_entries=4)
+        # A tenth of 4 is 0, so one goes: the least recently used after the hit on 0
+        self.assertEqual(len(self.memory), 4)
+        self.assertIsNotNone(self.memory.lookup("zh", "ja", "第0句话"))
+        self.assertIsNone(self.memory.lookup("zh", "ja", "第1句话"))
+
+    def test_entries_of_an_older_normalize_are_dropped(self):
+        self.memory.close()
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA user_version = 0")
+        db.execute("INSERT INTO memory VALUES ('zh', 'ja', '你会来吗', '你会来吗？', '[ja]?', 0)")
+        db.commit()
+        db.close()
+        self.memory = TranslationMemory(self.path)
+        self.assertEqual(len(self.memory), 0)
+
+
+class MemoryTranslatorTest(unittest.TestCase):
+    class Echo:
+        def __init__(self):
+            self.requests = []
+
+        def translate_multi(self, source_language, target_languages, context, source_texts, *args):
+            self.requests.append(list(source_texts))
+            return [{lang: f"[{lang}]{text}" for lang in target_languages} for text in source_texts]
+
+    def test_asks_only_for_what_is_missing(self):
+        with tempfile.TemporaryDirectory() as directory:
+            memory = TranslationMemory(os.path.join(directory, "memory.sqlite3"))
+            echo = self.Echo()
+            translator = MemoryTranslator(echo, memory)
+            translator.translate_multi("zh", ["ja", "en"], "", ["你好", "再见"])
+            self.assertTrue(translator.cloud_used)
+            results = translator.translate_multi("zh", ["ja", "en"], "", ["你好。", "谢谢"])
+            self.assertEqual(echo.requests, [["你好", "再见"], ["谢谢"]])
+            self.assertEqual(results[0], {"ja": "[ja]你好", "en": "[en]你好"})
+            translator.translate_multi("zh", ["ja", "en"], "", ["再见"])
+            self.assertFalse(translator.cloud_used)
+            memory.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import time
+import unittest
+
+from TranslatorRouter import TranslatorRouter, RoutingPolicy
+
+
+class Translator:
+    def __init__(self, name: str, pairs: set[str] = None, delay_s: float = 0, fail: bool = False):
+        self.name = name
+        self.model_dir = "models"
+        self.pairs = pairs
+        self.delay_s = delay_s
+        self.fail = fail
+        self.calls = 0
+
+    def supports(self, source_language: str, target_language: str) -> bool:
+        return f"{source_language}-{target_language}" in self.pairs
+
+    def translate_multi(self, source_language, target_languages, context, source_texts, *args):
+        self.calls += 1
+        time.sleep(self.delay_s)
+        if self.fail:
+            raise ConnectionError(f"{self.name} down")
+        return [{lang: f"[{self.name}]{text}" for lang in target_languages} for text in source_texts]
+
+
+def cloud(**kwargs) -> Translator:
+    return Translator("cloud", **kwargs)
+
+
+def local(**kwargs) -> Translator:
+    return Translator("local", {"zh-ja", "zh-en"}, **kwargs)
+
+
+class TranslatorRouterTest(unittest.TestCase):
+    def translate(self, router: TranslatorRouter, text: str, target_languages: list[str] = None) -> str:
+        return router.translate_multi("zh", target_languages or ["ja"], "", [text])[0][(target_languages or ["ja"])[0]]
+
+    def test_local_short(self):
+        router = TranslatorRouter(cloud(), local(), RoutingPolicy.LOCAL_SHORT, short_chars=4)
+        self.assertEqual(self.translate(router, "你好"), "[local]你好")
+        self.assertFalse(router.cloud_used)
+        self.assertEqual(self.translate(router, "今天天气很好"), "[cloud]今天天气很好")
+        self.assertTrue(router.cloud_used)
+        self.assertEqual(router.stats, {"cloud": 1, "local": 1, "fallback": 0})
+
+    def test_fixed_policies(self):
+        self.assertEqual(self.translate(TranslatorRouter(cloud(), local(), RoutingPolicy.CLOUD), "你好"), "[cloud]你好")
+        self.assertEqual(self.translate(TranslatorRouter(cloud(), local(), RoutingPolicy.LOCAL), "今天天气很好呢朋友们"), "[local]今天天气很好呢朋友们")
+        # No cloud translator, everything local
+        self.assertEqual(self.translate(TranslatorRouter(None, local(), RoutingPolicy.CLOUD), "你好"), "[local]你好")
+
+    def test_pair_without_a_local_model_goes_to_the_cloud(self):
+        router = TranslatorRouter(cloud(), local(), RoutingPolicy.LOCAL)
+        with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+            self.assertEqual(self.translate(router, "你好", ["ja", "ko"]), "[cloud]你好")
+        # Reported once
+        with self.assertNoLogs("VRChatParaformerAsr", "WARNING"):
+            self.translate(router, "你好", ["ja", "ko"])
+
+    def test_pair_without_any_translator(self):
+        router = TranslatorRouter(None, local(), RoutingPolicy.LOCAL)
+        with self.assertLogs("VRChatParaformerAsr", "ERROR"), self.assertRaises(ValueError):
+            self.translate(router, "你好", ["ko"])
+
+    def test_cloud_failure_falls_back_to_local(self):
+        router = TranslatorRouter(cloud(fail=True), local(), RoutingPolicy.CLOUD)
+        with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+            self.assertEqual(self.translate(router, "你好"), "[local]你好")
+        self.assertEqual(router.stats["fallback"], 1)
+        # Nothing to fall back to
+        with self.assertRaises(ConnectionError):
+            self.translate(router, "你好", ["ko"])
+
+    def test_race_takes_the_first_answer(self):
+        router = TranslatorRouter(cloud(delay_s=0.2), local(), RoutingPolicy.RACE)
+        self.assertEqual(self.translate(router, "你好"), "[local]你好")
+        self.assertTrue(router.cloud_used)
+        self.assertEqual(router.stats["local"], 1)
+
+    def test_race_skips_the_failed_one(self):
+        router = TranslatorRouter(cloud(delay_s=0.05), local(fail=True), RoutingPolicy.RACE)
+        self.assertEqual(self.translate(router, "你好"), "[cloud]你好")
+        router = TranslatorRouter(cloud(fail=True), local(fail=True), RoutingPolicy.RACE)
+        with self.assertRaises(ConnectionError):
+            self.translate(router, "你好")
+
+
+if __name__ == "__main__":
+    unittest.main()
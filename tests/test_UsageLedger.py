@@ -0,0 +1,154 @@
+import os
+import time
+import struct
+import tempfile
+import unittest
+
+from core import Setting, InitUsage, CloseUsage
+from UsageLedger import UsageLedger, UsageCallback, mask_api_key
+from RecognitionEvent import RecognitionEvent
+
+KEY = "sk-0123456789abcd"
+
+
+def speech(ms: int) -> bytes:
+    samples = 16 * ms
+    return struct.pack(f"<{samples}h", *([3000, -3000] * (samples // 2)))
+
+
+def silence(ms: int) -> bytes:
+    return bytes(32 * ms)
+
+
+def sentence_end(duration_s: float) -> RecognitionEvent:
+    return RecognitionEvent(200, "task", {"sentence": {"begin_time": 0, "end_time": 900, "text": "你好"}}, usage={"duration": duration_s})
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def on_event(self, result):
+        self.events.append(result)
+
+
+class UsageLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "usage.sqlite3")
+        self.exceeded = []
+        self.ledger = self.open()
+
+    def tearDown(self):
+        self.ledger.close()
+        self.directory.cleanup()
+
+    def open(self, daily_budget_s: float = 0) -> UsageLedger:
+        return UsageLedger(self.path, daily_budget_s, lambda *args: self.exceeded.append(args))
+
+    def test_mask_api_key(self):
+        self.assertEqual(mask_api_key(KEY), "...abcd")
+        self.assertEqual(mask_api_key("abcd"), "...")
+
+    def test_counters(self):
+        session = self.ledger.open_session(KEY)
+        session.add_captured(speech(300))
+        session.add_captured(silence(200))
+        session.set_sent_ms(400)
+        session.add_mt_chars(12)
+        counters = session.to_dict()
+        self.assertEqual((counters["captured_ms"], counters["speech_ms"], counters["sent_ms"], counters["mt_chars"]), (500, 300, 400, 12))
+
+    def test_only_sentence_ends_are_billed(self):
+        session = self.ledger.open_session(KEY)
+        recorder = Recorder()
+        callback = UsageCallback(recorder, session)
+        partial = RecognitionEvent(200, "task", {"sentence": {"begin_time": 0, "end_time": None, "text": "你"}}, usage={"duration": 9})
+        for result in (partial, sentence_end(2), RecognitionEvent(200, "task", {}), sentence_end(3)):
+            callback.on_event(result)
+        self.assertEqual(session.billed_s, 5)
+        self.assertEqual(len(recorder.events), 4)
+
+    def test_flush_replaces_the_session_row(self):
+        session = self.ledger.open_session(KEY)
+        session.add_result(sentence_end(2))
+        session.flush()
+        session.add_result(sentence_end(3))
+        session.flush()
+        self.ledger.open_session(KEY).flush()
+        rows = self.ledger.query("api_key")
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]["api_key"], rows[0]["sessions"], rows[0]["billed_s"]), ("...abcd", 2, 5))
+        self.assertEqual(self.ledger.billed_seconds(time.strftime("%Y-%m-%d"), "...abcd"), 5)
+
+    def test_flush_interval(self):
+        session = self.ledger.open_session(KEY, flush_interval_s=0)
+        session.add_captured(silence(100))
+        self.assertEqual(self.ledger.query("session_id")[0]["captured_ms"], 100)
+
+    def test_query_rejects_other_columns(self):
+        with self.assertRaises(ValueError):
+            self.ledger.query("billed_s; DROP TABLE usage")
+
+    def test_budget_warns_once_per_day_and_key(self):
+        self.ledger.close()
+        self.ledger = self.open(daily_budget_s=5)
+        first = self.ledger.open_session(KEY)
+        first.add_result(sentence_end(3))
+        first.flush()
+        self.assertEqual(self.exceeded, [])
+        second = self.ledger.open_session(KEY)
+        second.add_result(sentence_end(3))
+        with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+            second.flush()
+        self.assertEqual(self.exceeded, [(time.strftime("%Y-%m-%d"), "...abcd", 6)])
+        second.flush()
+        # Another key has a budget of its own
+        other = self.ledger.open_session("sk-other-key-wxyz")
+        other.add_result(sentence_end(1))
+        other.flush()
+        self.assertEqual(len(self.exceeded), 1)
+
+    def test_budget_warning_is_remembered_across_restarts(self):
+        self.ledger.close()
+        self.ledger = self.open(daily_budget_s=5)
+        session = self.ledger.open_session(KEY)
+        session.add_result(sentence_end(6))
+        with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+            session.flush()
+        self.ledger.close()
+        self.ledger = self.open(daily_budget_s=5)
+        session = self.ledger.open_session(KEY)
+        session.add_result(sentence_end(1))
+        session.flush()
+        self.assertEqual(len(self.exceeded), 1)
+
+    def test_write_after_close_is_dropped(self):
+        session = self.ledger.open_session(KEY)
+        self.ledger.close()
+        session.flush()
+
+
+class InitUsageTest(unittest.TestCase):
+    def test_disabled_without_a_file(self):
+        setting = Setting()
+        setting.usage_db = ""
+        self.assertEqual(InitUsage(setting), (None, None))
+        CloseUsage(None, None)
+
+    def test_budget_exceeded_is_published(self):
+        with tempfile.TemporaryDirectory() as directory:
+            setting = Setting()
+            setting.api_key = KEY
+            setting.usage_db = os.path.join(directory, "usage.sqlite3")
+            setting.usage_daily_budget_s = 1
+            published = []
+            ledger, usage = InitUsage(setting, published.append)
+            usage.add_result(sentence_end(2))
+            with self.assertLogs("VRChatParaformerAsr", "WARNING"):
+                CloseUsage(ledger, usage)
+            self.assertEqual(published, [{"type": "usage", "budget_exceeded": True, "day": time.strftime("%Y-%m-%d"), "api_key": "...abcd", "billed_s": 2}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import time
+import asyncio
+import threading
+import unittest
+
+from core import VRChatOscCallback, Setting, StartConcurrently
+from AudioSource import AudioSource
+from RecognitionEvent import RecognitionEvent
+
+
+class SlowTranslator:
+    def __init__(self, delay_s: float = 0):
+        self.delay_s = delay_s
+        self.calls = 0
+
+    def translate_multi(self, source_language, target_languages, context, source_texts, *args):
+        self.calls += 1
+        time.sleep(self.delay_s)
+        return [{lang: f"[{lang}]{text}" for lang in target_languages} for text in source_texts]
+
+
+def make_callback(translator, loop: asyncio.AbstractEventLoop = None, two_phase: bool = False) -> tuple[VRChatOscCallback, list[str]]:
+    setting = Setting()
+    setting.enable_translate = True
+    setting.translate_two_phase = two_phase
+    setting.chatbox_min_interval_ms = 300
+    callback = VRChatOscCallback(setting, translator, loop)
+    sent = []
+    callback._send_chatbox_now = lambda text, sfx: sent.append(text)
+    if callback.chatbox_throttle:
+        callback.chatbox_throttle._send = callback._send_chatbox_now
+    return callback, sent
+
+
+class CloseTranslateWorkerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_thread_finishes_queue_then_exits(self):
+        translator = SlowTranslator()
+        callback, sent = make_callback(translator)
+        callback.pending_texts.put_nowait("你好")
+        await callback.close_translate_worker(timeout_s=2)
+        self.assertFalse(callback.translate_worker.is_alive())
+        self.assertEqual(translator.calls, 1)
+        self.assertTrue(any("你好" in text for text in sent))
+
+    async def test_thread_busy_past_timeout_sends_nothing_more(self):
+        translator = SlowTranslator(delay_s=0.3)
+        callback, sent = make_callback(translator)
+        for text in ("一", "二"):
+            callback.pending_texts.put_nowait(text)
+            await asyncio.sleep(0.05)
+        await callback.close_translate_worker(timeout_s=0.1)
+        await asyncio.to_thread(callback.translate_worker.join, 2)
+        self.assertFalse(callback.translate_worker.is_alive())
+        self.assertEqual(translator.calls, 1)
+        self.assertEqual(sent, [])
+
+    async def test_task_busy_past_timeout_is_cancelled(self):
+        translator = SlowTranslator(delay_s=0.3)
+        callback, sent = make_callback(translator, asyncio.get_running_loop())
+        callback.pending_texts.put_nowait("一")
+        await asyncio.sleep(0.05)
+        await callback.close_translate_worker(timeout_s=0.1)
+        await asyncio.gather(callback.translate_worker, return_exceptions=True)
+        self.assertTrue(callback.translate_worker.cancelled())
+        self.assertEqual(sent, [])
+
+
+class CloseChatboxTest(unittest.IsolatedAsyncioTestCase):
+    async def test_held_back_update_goes_out_before_the_session_ends(self):
+        callback, sent = make_callback(None, two_phase=True)
+        callback.send_chatbox("一")
+        callback.send_chatbox("一(one)", quiet=True)
+        self.assertEqual(sent, ["一"])
+        await callback.close_chatbox()
+        self.assertEqual(sent, ["一", "一(one)"])
+        # Nothing of this session after it ended
+        callback.send_chatbox("二")
+        await asyncio.sleep(0.4)
+        self.assertEqual(sent, ["一", "一(one)"])
+
+
+class OscMessages:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, address, value):
+        self.messages.append((address, value))
+
+    def chatbox(self) -> list[tuple[str, bool]]:
+        return [(value[0], value[2]) for address, value in self.messages if address == "/chatbox/input"]
+
+
+def sentence(text: str, end: bool) -> RecognitionEvent:
+    return RecognitionEvent(200, "task", {"sentence": {"begin_time": 0, "end_time": 900 if end else None, "text": text}})
+
+
+class EarlyCommitTest(unittest.TestCase):
+    def setUp(self):
+        setting = Setting()
+        setting.osc_enableSFX = True
+        self.callback = VRChatOscCallback(setting)
+        self.osc = OscMessages()
+        self.callback.osc_client = self.osc
+
+    def test_partial_shown_at_local_offset_and_final_not_sent_again(self):
+        self.callback.on_event(sentence("你好", end=False))
+        self.callback.on_speech_offset()
+        self.callback.on_event(sentence("你好", end=True))
+        self.assertEqual(self.osc.chatbox(), [("\n你好", True)])
+        self.assertEqual(len(self.callback.early_gains_ms), 1)
+        self.assertEqual(self.callback.last_text, "你好")
+
+    def test_different_final_replaces_quietly(self):
+        self.callback.on_event(sentence("你号", end=False))
+        self.callback.on_speech_offset()
+        self.callback.on_event(sentence("你好。", end=True))
+        self.assertEqual(self.osc.chatbox(), [("\n你号", True), ("\n你好。", False)])
+
+    def test_offset_without_partial_does_nothing(self):
+        self.callback.on_speech_offset()
+        self.assertEqual(self.osc.chatbox(), [])
+
+    def test_event_without_sentence_is_ignored(self):
+        self.callback.on_event(RecognitionEvent(200, "task", {}))
+        self.assertEqual(self.osc.chatbox(), [])
+
+
+class PacedMic(AudioSource):
+    def __init__(self, frames: int = 1000, realtime: bool = True):
+        super().__init__(frame_ms=10)
+        self.frames = frames
+        self.realtime = realtime
+        self.started = False
+
+    def start(self):
+        self.started = True
+
+    async def read(self) -> bytes | None:
+        if not self.frames:
+            return None
+        self.frames -= 1
+        await asyncio.sleep(0.01)
+        return bytes(self.frame_bytes)
+
+
+class StartConcurrentlyTest(unittest.IsolatedAsyncioTestCase):
+    async def test_steps_run_together_while_the_mic_is_buffered(self):
+        mic = PacedMic()
+        published = []
+        started = time.perf_counter()
+        audio, ended = await StartConcurrently({"asr": asyncio.sleep(0.2), "translator": asyncio.sleep(0.2)}, mic, True, published.append)
+        self.assertLess(time.perf_counter() - started, 0.35)
+        self.assertTrue(mic.started)
+        self.assertFalse(ended)
+        self.assertGreater(len(audio), 5)
+        self.assertEqual(published[0]["type"], "latency")
+        self.assertEqual(set(published[0]), {"type", "asr_ms", "translator_ms", "mic_ms", "ready_ms", "buffered_ms"})
+        self.assertEqual(published[0]["buffered_ms"], len(audio) * 10)
+
+    async def test_file_is_not_read_meanwhile(self):
+        audio, ended = await StartConcurrently({"asr": asyncio.sleep(0.05)}, PacedMic(realtime=False), False, None)
+        self.assertEqual((audio, ended), ([], False))
+
+    async def test_source_ending_during_startup(self):
+        audio, ended = await StartConcurrently({"asr": asyncio.sleep(0.2)}, PacedMic(frames=3), False, None)
+        self.assertEqual((len(audio), ended), (3, True))
+
+    async def test_failed_step_cancels_the_others(self):
+        async def fail():
+            await asyncio.sleep(0.05)
+            raise ConnectionError("asr down")
+        slow = asyncio.ensure_future(asyncio.sleep(10))
+        started = time.perf_counter()
+        with self.assertRaises(ConnectionError):
+            await StartConcurrently({"asr": fail(), "translator": slow}, PacedMic(), False, None)
+        self.assertLess(time.perf_counter() - started, 1)
+        await asyncio.sleep(0)
+        self.assertTrue(slow.cancelled())
+
+
+if __name__ == "__main__":
+    unittest.main()